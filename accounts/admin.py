@@ -1,6 +1,26 @@
 from django.contrib import admin
 
-from .models import FriendShip, User
+from tweets import purge
+
+from .models import FollowSuggestion, FriendShip, ImportCheckpoint, User
+
+
+@admin.action(description="非表示にしてバックグラウンドで削除")
+def schedule_purge(modeladmin, request, queryset):
+    for user in queryset:
+        purge.schedule_user(user)
+
+
+@admin.register(User)
+class UserAdmin(admin.ModelAdmin):
+    actions = [schedule_purge]
+
+    def has_delete_permission(self, request, obj=None):
+        # Deleting in one transaction cascades through every related row and
+        # holds the write lock; deletions go through schedule_purge instead.
+        return False
+
 
-admin.site.register(User)
 admin.site.register(FriendShip)
+admin.site.register(FollowSuggestion)
+admin.site.register(ImportCheckpoint)
@@ -0,0 +1,107 @@
+import csv
+import io
+import json
+import zlib
+
+from tweets.models import Like, Tweet
+
+from .models import FriendShip
+
+CSV_FIELDS = [
+    "type",
+    "id",
+    "username",
+    "date_joined",
+    "content",
+    "created_at",
+    "like_count",
+    "tweet_id",
+    "author",
+    "follower",
+    "following",
+]
+
+CONTENT_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+
+def export_records(user, chunk_size=2000):
+    """
+    Yield the account, tweets, likes and follow edges of ``user`` as dicts,
+    reading each table with a server-side chunked iterator.
+    """
+    yield {"type": "user", "username": user.username, "date_joined": user.date_joined.isoformat()}
+
+    tweets = Tweet.objects.filter(user=user).order_by("id").values_list("id", "content", "created_at", "like_count")
+    for pk, content, created_at, like_count in tweets.iterator(chunk_size=chunk_size):
+        yield {
+            "type": "tweet",
+            "id": pk,
+            "username": user.username,
+            "content": content,
+            "created_at": created_at.isoformat(),
+            "like_count": like_count,
+        }
+
+    likes = Like.objects.filter(user=user).order_by("id").values_list("target_id", "target__user__username")
+    for tweet_id, author in likes.iterator(chunk_size=chunk_size):
+        yield {"type": "like", "username": user.username, "tweet_id": tweet_id, "author": author}
+
+    for field in ("follower", "following"):
+        edges = FriendShip.objects.filter(**{field: user}).order_by("id")
+        rows = edges.values_list("follower__username", "following__username", "created_at")
+        for follower, following, created_at in rows.iterator(chunk_size=chunk_size):
+            yield {
+                "type": "follow",
+                "follower": follower,
+                "following": following,
+                "created_at": created_at.isoformat(),
+            }
+
+
+def ndjson_lines(records):
+    for record in records:
+        yield json.dumps(record, ensure_ascii=False) + "\n"
+
+
+def csv_lines(records):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, CSV_FIELDS, extrasaction="ignore")
+    writer.writeheader()
+    for record in records:
+        writer.writerow(record)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+
+def encode(lines, size=64 * 1024):
+    # Joins lines into chunks of about ``size`` bytes, so each write to the
+    # client or the compressor is not a single row.
+    chunk = []
+    length = 0
+    for line in lines:
+        data = line.encode()
+        chunk.append(data)
+        length += len(data)
+        if length >= size:
+            yield b"".join(chunk)
+            chunk = []
+            length = 0
+    if chunk:
+        yield b"".join(chunk)
+
+
+def gzip_stream(chunks, level=6):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export(user, format="ndjson", compress=False, chunk_size=2000):
+    """Return an iterator of the bytes of ``user``'s archive."""
+    lines = ndjson_lines if format == "ndjson" else csv_lines
+    chunks = encode(lines(export_records(user, chunk_size)))
+    return gzip_stream(chunks) if compress else chunks
@@ -0,0 +1,188 @@
+import json
+from datetime import datetime, timezone
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import F, Max
+from django.utils import timezone as django_timezone
+
+from tweets import entities
+from tweets.models import Tweet
+
+from .models import FriendShip, ImportCheckpoint
+
+User = get_user_model()
+
+USERNAME_MAX_LENGTH = User._meta.get_field("username").max_length
+CONTENT_MAX_LENGTH = Tweet._meta.get_field("content").max_length
+
+
+class InvalidRecord(ValueError):
+    pass
+
+
+def parse_datetime(value):
+    try:
+        parsed = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise InvalidRecord(f"invalid created_at {value!r}")
+    if django_timezone.is_naive(parsed):
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+
+def parse_username(record, key):
+    username = record.get(key)
+    if not isinstance(username, str) or not 0 < len(username) <= USERNAME_MAX_LENGTH:
+        raise InvalidRecord(f"invalid {key}")
+    try:
+        User.username_validator(username)
+    except ValidationError:
+        raise InvalidRecord(f"invalid {key} {username!r}")
+    return username
+
+
+def parse(line):
+    """Validate one NDJSON line, in the format written by accounts.export."""
+    try:
+        record = json.loads(line)
+    except ValueError:
+        raise InvalidRecord("invalid JSON")
+    if not isinstance(record, dict):
+        raise InvalidRecord("not an object")
+    kind = record.get("type")
+    if kind == "user":
+        return kind, parse_username(record, "username"), parse_datetime(record.get("date_joined"))
+    if kind == "tweet":
+        content = record.get("content")
+        if not isinstance(content, str) or not 0 < len(content) <= CONTENT_MAX_LENGTH:
+            raise InvalidRecord("invalid content")
+        return kind, parse_username(record, "username"), content, parse_datetime(record.get("created_at"))
+    if kind == "follow":
+        follower = parse_username(record, "follower")
+        following = parse_username(record, "following")
+        if follower == following:
+            raise InvalidRecord("self follow")
+        return kind, follower, following, parse_datetime(record.get("created_at"))
+    raise InvalidRecord(f"unsupported type {kind!r}")
+
+
+class ArchiveImporter:
+    """
+    Import users, tweets and follow edges from an NDJSON file. Each batch of
+    lines is written in one transaction together with the byte offset reached,
+    so an interrupted import resumes after the last committed batch and no
+    line is applied twice.
+    """
+
+    def __init__(self, path, source=None, batch_size=5000):
+        self.path = path
+        self.batch_size = batch_size
+        self.user_ids = dict(User.objects.values_list("username", "id"))
+        self.checkpoint, created = ImportCheckpoint.objects.get_or_create(source=source or str(path))
+        if created:
+            self.checkpoint.tweet_id_floor = Tweet.all_objects.aggregate(Max("id"))["id__max"] or 0
+            self.checkpoint.friendship_id_floor = FriendShip.objects.aggregate(Max("id"))["id__max"] or 0
+            self.checkpoint.save()
+        self.errors = []
+
+    def batches(self):
+        """Yield lists of (line number, raw line) and the byte offset after them."""
+        with open(self.path, "rb") as f:
+            f.seek(self.checkpoint.position)
+            position = self.checkpoint.position
+            number = self.checkpoint.lines
+            batch = []
+            for line in f:
+                position += len(line)
+                number += 1
+                if line.strip():
+                    batch.append((number, line))
+                if len(batch) == self.batch_size:
+                    yield batch, number, position
+                    batch = []
+            if batch or position != self.checkpoint.position:
+                yield batch, number, position
+
+    def run(self):
+        """Import the rest of the file, yielding the checkpoint after each batch."""
+        for batch, lines, position in self.batches():
+            records = []
+            skipped = 0
+            for number, line in batch:
+                try:
+                    records.append(parse(line))
+                except InvalidRecord as e:
+                    self.errors.append((number, str(e)))
+                    skipped += 1
+            with transaction.atomic():
+                users, tweets, follows, unresolved = self.write(records)
+                ImportCheckpoint.objects.filter(pk=self.checkpoint.pk).update(
+                    position=position,
+                    lines=lines,
+                    users=F("users") + users,
+                    tweets=F("tweets") + tweets,
+                    follows=F("follows") + follows,
+                    skipped=F("skipped") + skipped + unresolved,
+                )
+            self.checkpoint.refresh_from_db()
+            yield self.checkpoint
+
+    def write(self, records):
+        users = [record for record in records if record[0] == "user" and record[1] not in self.user_ids]
+        created_users = 0
+        if users:
+            password = make_password(None)
+            User.objects.bulk_create(
+                [User(username=username, date_joined=joined, password=password) for _, username, joined in users],
+                batch_size=1000,
+                ignore_conflicts=True,
+            )
+            names = [username for _, username, _ in users]
+            new_ids = dict(User.objects.filter(username__in=names).values_list("username", "id"))
+            created_users = len(new_ids)
+            self.user_ids.update(new_ids)
+
+        tweets = []
+        friendships = []
+        unresolved = 0
+        for record in records:
+            if record[0] == "tweet" and record[1] in self.user_ids:
+                _, username, content, created_at = record
+                tweets.append(Tweet(user_id=self.user_ids[username], content=content, created_at=created_at))
+            elif record[0] == "follow" and record[1] in self.user_ids and record[2] in self.user_ids:
+                _, follower, following, created_at = record
+                friendships.append(
+                    FriendShip(
+                        follower_id=self.user_ids[follower],
+                        following_id=self.user_ids[following],
+                        created_at=created_at,
+                    )
+                )
+            elif record[0] != "user":
+                unresolved += 1
+
+        # Tweets have no natural key to conflict on; the checkpoint written in
+        # the same transaction is what keeps them from being imported twice.
+        Tweet.objects.bulk_create(tweets, batch_size=1000)
+        entities.index_tweets((tweet.pk, tweet.content, tweet.created_at) for tweet in tweets if tweet.pk)
+        FriendShip.objects.bulk_create(friendships, batch_size=1000, ignore_conflicts=True)
+        return created_users, len(tweets), len(friendships), unresolved
+
+    def affected_authors(self):
+        """Ids of the accounts whose followers' timelines this import changed."""
+        authors = set(
+            Tweet.objects.filter(id__gt=self.checkpoint.tweet_id_floor).values_list("user_id", flat=True).distinct()
+        )
+        authors.update(
+            FriendShip.objects.filter(id__gt=self.checkpoint.friendship_id_floor)
+            .values_list("following_id", flat=True)
+            .distinct()
+        )
+        return authors
+
+    def finish(self):
+        self.checkpoint.finished_at = django_timezone.now()
+        self.checkpoint.save(update_fields=["finished_at", "updated_at"])
@@ -0,0 +1,42 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts import export
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = "Stream the tweets, likes and follow edges of a user as NDJSON or CSV, optionally gzip-compressed."
+
+    def add_arguments(self, parser):
+        parser.add_argument("username")
+        parser.add_argument("--format", choices=sorted(export.CONTENT_TYPES), default="ndjson")
+        parser.add_argument("--gzip", action="store_true", help="Compress the output with gzip.")
+        parser.add_argument("--output", help="File to write (default: standard output).")
+        parser.add_argument("--chunk-size", type=int, default=2000, help="Rows fetched per database round trip.")
+
+    def handle(self, *args, username, format, gzip, output, chunk_size, **options):
+        try:
+            user = User.objects.get(username=username)
+        except User.DoesNotExist:
+            raise CommandError(f"User {username!r} does not exist.")
+        if gzip and not output:
+            raise CommandError("--gzip requires --output.")
+        chunks = export.export(user, format, gzip, chunk_size)
+        started = time.perf_counter()
+        written = 0
+        if output:
+            with open(output, "wb") as f:
+                for chunk in chunks:
+                    f.write(chunk)
+                    written += len(chunk)
+        else:
+            # Uncompressed chunks always end at a record boundary.
+            for chunk in chunks:
+                self.stdout.write(chunk.decode(), ending="")
+                written += len(chunk)
+        elapsed = time.perf_counter() - started
+        self.stderr.write(f"Wrote {written} bytes in {elapsed:.1f}s.")
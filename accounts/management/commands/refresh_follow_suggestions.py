@@ -0,0 +1,21 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from accounts import suggestions
+
+
+class Command(BaseCommand):
+    help = "Recompute the follow suggestions of every user from an in-memory copy of the follow graph."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--size", type=int, default=10, help="Suggestions stored per user.")
+        parser.add_argument("--batch-size", type=int, default=1000, help="Users replaced per transaction.")
+        parser.add_argument("--max-neighbours", type=int, default=1000)
+        parser.add_argument("--max-degree", type=int, default=10000)
+
+    def handle(self, *args, size, batch_size, max_neighbours, max_degree, **options):
+        started = time.perf_counter()
+        stored = suggestions.refresh(size, batch_size, max_neighbours=max_neighbours, max_degree=max_degree)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f"Stored {stored} follow suggestions in {elapsed:.1f}s."))
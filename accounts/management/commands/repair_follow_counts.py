@@ -0,0 +1,46 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+from accounts.models import FriendShip
+
+User = get_user_model()
+
+
+def count_friendships(field):
+    friendships = (
+        FriendShip.objects.filter(**{field: OuterRef("pk")}).values(field).annotate(n=Count("id")).values("n")
+    )
+    return Coalesce(Subquery(friendships), 0)
+
+
+class Command(BaseCommand):
+    help = "Recompute User.followers_count and User.following_count from FriendShip, one chunk of users at a time."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=1000)
+
+    def handle(self, *args, chunk_size, **options):
+        last_id = 0
+        checked = fixed = 0
+        while True:
+            ids = list(User.objects.filter(id__gt=last_id).order_by("id").values_list("id", flat=True)[:chunk_size])
+            if not ids:
+                break
+            last_id = ids[-1]
+            with transaction.atomic():
+                chunk = User.objects.filter(id__gte=ids[0], id__lte=last_id).annotate(
+                    actual_followers=count_friendships("following"),
+                    actual_following=count_friendships("follower"),
+                )
+                drifted = chunk.filter(
+                    ~Q(followers_count=F("actual_followers")) | ~Q(following_count=F("actual_following"))
+                )
+                fixed += User.objects.filter(id__in=list(drifted.values_list("id", flat=True))).update(
+                    followers_count=count_friendships("following"),
+                    following_count=count_friendships("follower"),
+                )
+            checked += len(ids)
+        self.stdout.write(self.style.SUCCESS(f"Checked {checked} users, fixed {fixed} follow counts."))
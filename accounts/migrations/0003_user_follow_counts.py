@@ -0,0 +1,42 @@
+# Generated by Django 4.1.13 on 2026-10-18 11:05
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_follow_counts(apps, schema_editor):
+    User = apps.get_model("accounts", "User")
+    FriendShip = apps.get_model("accounts", "FriendShip")
+
+    def count_friendships(field):
+        friendships = (
+            FriendShip.objects.filter(**{field: OuterRef("pk")}).values(field).annotate(n=Count("id")).values("n")
+        )
+        return Coalesce(Subquery(friendships), 0)
+
+    User.objects.update(
+        followers_count=count_friendships("following"),
+        following_count=count_friendships("follower"),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("accounts", "0002_friendship_friendship_follow_unique"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="user",
+            name="followers_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="user",
+            name="following_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_follow_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 4.1.13 on 2026-10-18 11:09
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("accounts", "0003_user_follow_counts"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="friendship",
+            name="created_at",
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 4.1.13 on 2026-10-18 11:50
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("accounts", "0004_alter_friendship_created_at"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="FollowSuggestion",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("score", models.PositiveIntegerField()),
+                ("rank", models.PositiveSmallIntegerField()),
+                (
+                    "suggested",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, related_name="+", to=settings.AUTH_USER_MODEL
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="follow_suggestions",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="followsuggestion",
+            index=models.Index(fields=["user", "rank"], name="follow_suggestion_rank_idx"),
+        ),
+        migrations.AddConstraint(
+            model_name="followsuggestion",
+            constraint=models.UniqueConstraint(fields=("user", "suggested"), name="follow_suggestion_unique"),
+        ),
+    ]
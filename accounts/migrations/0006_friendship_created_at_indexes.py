@@ -0,0 +1,21 @@
+# Generated by Django 4.1.13 on 2026-10-18 11:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("accounts", "0005_followsuggestion"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="friendship",
+            index=models.Index(fields=["follower", "-created_at", "-id"], name="follower_created_at_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="friendship",
+            index=models.Index(fields=["following", "-created_at", "-id"], name="following_created_at_idx"),
+        ),
+    ]
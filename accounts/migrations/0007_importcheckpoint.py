@@ -0,0 +1,30 @@
+# Generated by Django 4.1.13 on 2026-10-18 11:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("accounts", "0006_friendship_created_at_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ImportCheckpoint",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("source", models.CharField(max_length=255, unique=True)),
+                ("position", models.PositiveBigIntegerField(default=0)),
+                ("lines", models.PositiveBigIntegerField(default=0)),
+                ("users", models.PositiveBigIntegerField(default=0)),
+                ("tweets", models.PositiveBigIntegerField(default=0)),
+                ("follows", models.PositiveBigIntegerField(default=0)),
+                ("skipped", models.PositiveBigIntegerField(default=0)),
+                ("tweet_id_floor", models.PositiveBigIntegerField(default=0)),
+                ("friendship_id_floor", models.PositiveBigIntegerField(default=0)),
+                ("finished_at", models.DateTimeField(blank=True, null=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,16 @@
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user
+from django.contrib.auth.mixins import LoginRequiredMixin
+
+
+class AsyncLoginRequiredMixin(LoginRequiredMixin):
+    """
+    LoginRequiredMixin for views with async handlers. The user is loaded from
+    the session in a worker thread instead of lazily on the event loop.
+    """
+
+    async def dispatch(self, request, *args, **kwargs):
+        request.user = await sync_to_async(get_user)(request)
+        if not request.user.is_authenticated:
+            return self.handle_no_permission()
+        return await super(LoginRequiredMixin, self).dispatch(request, *args, **kwargs)
@@ -1,18 +1,60 @@
 from django.conf import settings
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from django.utils import timezone
 
 
 class User(AbstractUser):
     email = models.EmailField()
+    followers_count = models.PositiveIntegerField(default=0)
+    following_count = models.PositiveIntegerField(default=0)
 
 
 class FriendShip(models.Model):
     following = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="follower")
     follower = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="following")
-    created_at = models.DateTimeField(auto_now_add=True)
+    created_at = models.DateTimeField(default=timezone.now)
 
     class Meta:
         constraints = [
             models.UniqueConstraint(fields=["following", "follower"], name="follow_unique"),
         ]
+        indexes = [
+            models.Index(fields=["follower", "-created_at", "-id"], name="follower_created_at_idx"),
+            models.Index(fields=["following", "-created_at", "-id"], name="following_created_at_idx"),
+        ]
+
+
+class FollowSuggestion(models.Model):
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="follow_suggestions")
+    suggested = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="+")
+    score = models.PositiveIntegerField()
+    rank = models.PositiveSmallIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "suggested"], name="follow_suggestion_unique"),
+        ]
+        indexes = [
+            models.Index(fields=["user", "rank"], name="follow_suggestion_rank_idx"),
+        ]
+
+
+class ImportCheckpoint(models.Model):
+    """Progress of `manage.py import_archive` through one input file."""
+
+    source = models.CharField(max_length=255, unique=True)
+    position = models.PositiveBigIntegerField(default=0)
+    lines = models.PositiveBigIntegerField(default=0)
+    users = models.PositiveBigIntegerField(default=0)
+    tweets = models.PositiveBigIntegerField(default=0)
+    follows = models.PositiveBigIntegerField(default=0)
+    skipped = models.PositiveBigIntegerField(default=0)
+    # Rows above these ids were written by this import.
+    tweet_id_floor = models.PositiveBigIntegerField(default=0)
+    friendship_id_floor = models.PositiveBigIntegerField(default=0)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.source
@@ -0,0 +1,11 @@
+from django.conf import settings
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.db.models.signals import pre_delete
+from django.dispatch import receiver
+
+
+@receiver(pre_delete, sender=settings.AUTH_USER_MODEL)
+def release_follow_counts(sender, instance, **kwargs):
+    sender.objects.filter(follower__follower=instance).update(followers_count=Greatest(F("followers_count") - 1, 0))
+    sender.objects.filter(following__following=instance).update(following_count=Greatest(F("following_count") - 1, 0))
@@ -0,0 +1,129 @@
+import heapq
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from itertools import chain
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Q
+
+from .models import FollowSuggestion, FriendShip
+
+User = get_user_model()
+
+
+class Adjacency:
+    """
+    Compressed sparse rows: the neighbours of node ``i`` are
+    ``targets[offsets[i]:offsets[i + 1]]``, all stored in two flat arrays.
+    """
+
+    def __init__(self, size, pairs):
+        # ``pairs`` must be sorted by source node.
+        self.offsets = array("q", [0]) * (size + 1)
+        self.targets = array("i")
+        for source, target in pairs:
+            self.offsets[source + 1] += 1
+            self.targets.append(target)
+        for i in range(size):
+            self.offsets[i + 1] += self.offsets[i]
+
+    def neighbours(self, node):
+        return self.targets[self.offsets[node] : self.offsets[node + 1]]
+
+
+class FollowGraph:
+    def __init__(self, user_ids, following, followers):
+        self.user_ids = user_ids
+        self.following = following
+        self.followers = followers
+
+    @classmethod
+    def load(cls, chunk_size=10000):
+        """
+        Read users and FriendShip edges into dense integer indices, one short
+        query per ``chunk_size`` rows so no read lock is held across chunks.
+        Memory is two arrays of edge length plus one of user length.
+        """
+        user_ids = array("q")
+        while True:
+            ids = User.objects.filter(id__gt=user_ids[-1] if user_ids else 0).order_by("id")
+            chunk = list(ids.values_list("id", flat=True)[:chunk_size])
+            user_ids.extend(chunk)
+            if len(chunk) < chunk_size:
+                break
+
+        def node(user_id):
+            i = bisect_left(user_ids, user_id)
+            return i if i < len(user_ids) and user_ids[i] == user_id else None
+
+        def edges(source, target):
+            # The chunks are separate reads, so edges to users outside
+            # ``user_ids`` (signed up after they were read) are skipped.
+            rows = FriendShip.objects.order_by(source, target).values_list(source, target)
+            chunk = list(rows[:chunk_size])
+            while chunk:
+                for source_id, target_id in chunk:
+                    source_node, target_node = node(source_id), node(target_id)
+                    if source_node is not None and target_node is not None:
+                        yield source_node, target_node
+                if len(chunk) < chunk_size:
+                    break
+                # `a >= x AND (a > x OR b > y)` is `(a, b) > (x, y)` with an
+                # index range on `a`, as in tweets.pagination.after_cursor.
+                last_source, last_target = chunk[-1]
+                chunk = list(
+                    rows.filter(
+                        Q(**{f"{source}__gte": last_source}),
+                        Q(**{f"{source}__gt": last_source}) | Q(**{f"{target}__gt": last_target}),
+                    )[:chunk_size]
+                )
+
+        return cls(
+            user_ids,
+            Adjacency(len(user_ids), edges("follower_id", "following_id")),
+            Adjacency(len(user_ids), edges("following_id", "follower_id")),
+        )
+
+    def suggest(self, node, size=10, max_neighbours=1000, max_degree=10000):
+        """
+        Score the accounts followed by the accounts ``node`` follows (friends of
+        friends) and by the accounts following ``node`` (common followers), one
+        point per path. Returns up to ``size`` (node, score) pairs, best first.
+
+        Only the first ``max_neighbours`` of ``node``'s own edges are walked, and
+        neighbours following more than ``max_degree`` accounts are skipped: they
+        add work without telling much about ``node``.
+        """
+        following = self.following.neighbours(node)
+        scores = Counter()
+        for neighbour in chain(following[:max_neighbours], self.followers.neighbours(node)[:max_neighbours]):
+            candidates = self.following.neighbours(neighbour)
+            if len(candidates) <= max_degree:
+                scores.update(candidates)
+        for known in (node, *following):
+            scores.pop(known, None)
+        return heapq.nlargest(size, scores.items(), key=lambda item: (item[1], -item[0]))
+
+
+def refresh(size=10, batch_size=1000, **options):
+    """
+    Recompute the follow suggestions of every user and replace the stored ones,
+    one transaction per ``batch_size`` users. Returns the number stored.
+    """
+    graph = FollowGraph.load()
+    user_ids = graph.user_ids
+    stored = 0
+    for start in range(0, len(user_ids), batch_size):
+        end = min(start + batch_size, len(user_ids))
+        suggestions = [
+            FollowSuggestion(user_id=user_ids[node], suggested_id=user_ids[candidate], score=score, rank=rank)
+            for node in range(start, end)
+            for rank, (candidate, score) in enumerate(graph.suggest(node, size, **options))
+        ]
+        with transaction.atomic():
+            FollowSuggestion.objects.filter(user_id__gte=user_ids[start], user_id__lte=user_ids[end - 1]).delete()
+            FollowSuggestion.objects.bulk_create(suggestions, batch_size=1000)
+        stored += len(suggestions)
+    return stored
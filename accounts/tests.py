@@ -1,11 +1,27 @@
+import csv
+import gzip
+import json
+import os
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from asgiref.sync import sync_to_async
+from asgiref.testing import ApplicationCommunicator
 from django.conf import settings
 from django.contrib.auth import SESSION_KEY, get_user_model
-from django.test import TestCase
+from django.core.management import CommandError, call_command
+from django.test import TestCase, TransactionTestCase
 from django.urls import reverse
 
-from tweets.models import Tweet
+from monitoring.querybudget import query_budget
+from mysite.asgi import application
+from tweets.models import Like, TimelineEntry, Tweet, TweetHashtag
 
-from .models import FriendShip
+from .imports import ArchiveImporter
+from .models import FollowSuggestion, FriendShip, ImportCheckpoint
+from .suggestions import FollowGraph
+from .views import FollowerListView, FollowingListView, UserProfileView
 
 User = get_user_model()
 
@@ -304,6 +320,35 @@ class TestUserProfileView(TestCase):
         ct_following = FriendShip.objects.filter(follower__exact=self.target_user).count()
         self.assertEqual(context["following_num"], ct_following)
 
+    def test_query_budget(self):
+        for i in range(30):
+            tweet = Tweet.objects.create(user=self.target_user, content=f"tweet{i}")
+            Like.objects.create(user=self.login_user, target=tweet)
+        with query_budget(UserProfileView.query_budget):
+            self.client.get(self.url)
+
+    def test_success_get_not_modified(self):
+        self.client.get(self.url)
+        etag = self.client.get(self.url)["ETag"]
+        # session, user, profile user, fingerprint
+        with self.assertNumQueries(4):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        FriendShip.objects.create(follower=self.login_user, following=self.target_user)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context["is_following"])
+
+    def test_success_get_with_messages_is_not_cached(self):
+        FriendShip.objects.create(follower=self.login_user, following=self.target_user)
+        self.client.get(self.url)
+        etag = self.client.get(self.url)["ETag"]
+        response = self.client.post(reverse("accounts:follow", kwargs={"username": self.target_user.username}))
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "フォロー済です。")
+
 
 class TestFollowView(TestCase):
     def setUp(self):
@@ -321,6 +366,21 @@ class TestFollowView(TestCase):
             target_status_code=200,
         )
         self.assertTrue(FriendShip.objects.filter(follower=self.user1, following=self.user2).exists())
+        self.user1.refresh_from_db()
+        self.user2.refresh_from_db()
+        self.assertEqual(self.user1.following_count, 1)
+        self.assertEqual(self.user2.followers_count, 1)
+
+    async def test_success_post_asgi(self):
+        await sync_to_async(self.async_client.force_login)(self.user1)
+        response = await self.async_client.post(reverse("accounts:follow", kwargs={"username": self.user2.username}))
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(await FriendShip.objects.filter(follower=self.user1, following=self.user2).aexists())
+
+    def test_success_post_backfills_timeline(self):
+        tweet = Tweet.objects.create(user=self.user2, content="tweet")
+        self.client.post(reverse("accounts:follow", kwargs={"username": self.user2.username}))
+        self.assertTrue(TimelineEntry.objects.filter(owner=self.user1, tweet=tweet).exists())
 
     def test_failure_post_with_not_exist_user(self):
         url = reverse("accounts:follow", kwargs={"username": "not_exist_user"})
@@ -340,7 +400,7 @@ class TestUnfollowView(TestCase):
         self.user1 = User.objects.create_user(username="test", password="password1")
         self.user2 = User.objects.create_user(username="test2", password="password2")
         self.client.force_login(self.user1)
-        FriendShip.objects.create(follower=self.user1, following=self.user2)
+        self.client.post(reverse("accounts:follow", kwargs={"username": self.user2.username}))
 
     def test_success_post(self):
         url = reverse("accounts:unfollow", kwargs={"username": self.user2.username})
@@ -352,6 +412,21 @@ class TestUnfollowView(TestCase):
             target_status_code=200,
         )
         self.assertFalse(FriendShip.objects.exists())
+        self.user1.refresh_from_db()
+        self.user2.refresh_from_db()
+        self.assertEqual(self.user1.following_count, 0)
+        self.assertEqual(self.user2.followers_count, 0)
+
+    def test_success_delete_followed_user(self):
+        self.user2.delete()
+        self.user1.refresh_from_db()
+        self.assertEqual(self.user1.following_count, 0)
+
+    def test_success_post_prunes_timeline(self):
+        tweet = Tweet.objects.create(user=self.user2, content="tweet")
+        TimelineEntry.objects.create(owner=self.user1, tweet=tweet, created_at=tweet.created_at)
+        self.client.post(reverse("accounts:unfollow", kwargs={"username": self.user2.username}))
+        self.assertFalse(TimelineEntry.objects.exists())
 
     def test_failure_post_with_not_exist_user(self):
         url = reverse("accounts:follow", kwargs={"username": "not_exist_user"})
@@ -366,6 +441,92 @@ class TestUnfollowView(TestCase):
         self.assertTrue(FriendShip.objects.filter(follower=self.user1, following=self.user2).exists())
 
 
+class TestRepairFollowCountsCommand(TestCase):
+    def setUp(self):
+        self.user1 = User.objects.create_user(username="test1", password="password1", followers_count=3)
+        self.user2 = User.objects.create_user(username="test2", password="password2")
+        FriendShip.objects.create(follower=self.user2, following=self.user1)
+
+    def test_repair(self):
+        call_command("repair_follow_counts", chunk_size=1, stdout=StringIO())
+        self.user1.refresh_from_db()
+        self.user2.refresh_from_db()
+        self.assertEqual((self.user1.followers_count, self.user1.following_count), (1, 0))
+        self.assertEqual((self.user2.followers_count, self.user2.following_count), (0, 1))
+
+
+class TestFollowSuggestions(TestCase):
+    def setUp(self):
+        self.users = {name: User.objects.create_user(username=name, password="testpassword") for name in "abcdef"}
+        for follower, following in ["ab", "ac", "bd", "be", "cd", "fa", "fe"]:
+            FriendShip.objects.create(follower=self.users[follower], following=self.users[following])
+        self.url = reverse("accounts:user_profile", kwargs={"username": "a"})
+        self.client.force_login(self.users["a"])
+
+    def suggested(self, name):
+        suggestions = FollowSuggestion.objects.filter(user=self.users[name]).order_by("rank")
+        return list(suggestions.values_list("suggested__username", "score"))
+
+    def test_graph(self):
+        graph = FollowGraph.load(chunk_size=2)
+        node = {user_id: i for i, user_id in enumerate(graph.user_ids)}
+        a = node[self.users["a"].pk]
+        self.assertEqual(list(graph.following.neighbours(a)), [node[self.users["b"].pk], node[self.users["c"].pk]])
+        self.assertEqual(list(graph.followers.neighbours(a)), [node[self.users["f"].pk]])
+        self.assertEqual(graph.suggest(a, max_degree=1), [(node[self.users["d"].pk], 1)])
+
+    def test_graph_skips_edges_to_users_not_loaded(self):
+        # Users "c" and "f" signed up after the user ids were read.
+        loaded = [self.users[name].pk for name in "abde"]
+        with mock.patch("accounts.suggestions.User") as user_model:
+            user_ids = user_model.objects.filter.return_value.order_by.return_value.values_list.return_value
+            user_ids.__getitem__.return_value = loaded
+            graph = FollowGraph.load()
+        self.assertEqual(list(graph.user_ids), loaded)
+        self.assertEqual(list(graph.following.neighbours(0)), [1])
+        self.assertEqual(list(graph.following.neighbours(1)), [2, 3])
+        self.assertEqual(list(graph.followers.neighbours(0)), [])
+
+    def test_graph_loads_in_chunks(self):
+        graph = FollowGraph.load()
+        chunked = FollowGraph.load(chunk_size=2)
+        self.assertEqual(chunked.user_ids, graph.user_ids)
+        for adjacency in ("following", "followers"):
+            self.assertEqual(getattr(chunked, adjacency).offsets, getattr(graph, adjacency).offsets)
+            self.assertEqual(getattr(chunked, adjacency).targets, getattr(graph, adjacency).targets)
+
+    def test_refresh(self):
+        out = StringIO()
+        call_command("refresh_follow_suggestions", batch_size=4, stdout=out)
+        self.assertIn("Stored 9 follow suggestions", out.getvalue())
+        self.assertEqual(self.suggested("a"), [("d", 2), ("e", 2)])
+        self.assertEqual(self.suggested("f"), [("b", 1), ("c", 1)])
+
+        FriendShip.objects.filter(follower=self.users["f"]).delete()
+        call_command("refresh_follow_suggestions", stdout=StringIO())
+        self.assertEqual(self.suggested("f"), [])
+
+    def test_success_get_own_profile(self):
+        call_command("refresh_follow_suggestions", stdout=StringIO())
+        FriendShip.objects.create(follower=self.users["a"], following=self.users["d"])
+        with query_budget(UserProfileView.query_budget):
+            response = self.client.get(self.url)
+        suggested = [suggestion.suggested for suggestion in response.context["follow_suggestions"]]
+        self.assertEqual(suggested, [self.users["e"]])
+
+    def test_success_get_other_profile(self):
+        call_command("refresh_follow_suggestions", stdout=StringIO())
+        response = self.client.get(reverse("accounts:user_profile", kwargs={"username": "b"}))
+        self.assertNotIn("follow_suggestions", response.context)
+
+    def test_success_get_not_modified_until_refreshed(self):
+        self.client.get(self.url)
+        etag = self.client.get(self.url)["ETag"]
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        call_command("refresh_follow_suggestions", stdout=StringIO())
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
 class TestFollowingListView(TestCase):
     def setUp(self):
         self.user1 = User.objects.create_user(username="test1", password="password1")
@@ -379,7 +540,40 @@ class TestFollowingListView(TestCase):
         response = self.client.get(self.url)
         self.assertEqual(response.status_code, 200)
         self.assertTemplateUsed(response, "accounts/following_list.html")
-        self.assertEqual(response.context["following_list"].count(), 1)
+        self.assertEqual(len(response.context["following_list"]), 1)
+
+    def test_query_budget(self):
+        for i in range(5):
+            FriendShip.objects.create(follower=self.user2, following=User.objects.create_user(username=f"user{i}"))
+        with query_budget(FollowingListView.query_budget):
+            self.client.get(self.url)
+
+    def test_success_get_paginates(self):
+        for i in range(25):
+            FriendShip.objects.create(follower=self.user2, following=User.objects.create_user(username=f"user{i}"))
+        first_page = self.client.get(self.url).context
+        second_page = self.client.get(self.url, {"cursor": first_page["page"].next_cursor}).context
+        seen = [friendship.following.username for friendship in first_page["following_list"]]
+        rest = [friendship.following.username for friendship in second_page["following_list"]]
+        self.assertEqual(seen[:2], ["user24", "user23"])
+        self.assertEqual(len(seen), 20)
+        self.assertEqual(len(set(seen + rest)), 26)
+        self.assertIsNone(second_page["page"].next_cursor)
+
+    def test_success_get_with_relationship_flags(self):
+        user3 = User.objects.create_user(username="test3", password="password3")
+        FriendShip.objects.create(follower=self.user2, following=user3)
+        FriendShip.objects.create(follower=self.user1, following=user3)
+        FriendShip.objects.create(follower=user3, following=self.user1)
+        flags = {
+            friendship.following: (friendship.viewer_follows, friendship.follows_viewer)
+            for friendship in self.client.get(self.url).context["following_list"]
+        }
+        self.assertEqual(flags, {self.user1: (False, False), user3: (True, True)})
+
+    def test_failure_get_with_invalid_cursor(self):
+        response = self.client.get(self.url, {"cursor": "invalid"})
+        self.assertEqual(response.status_code, 400)
 
 
 class TestFollowerListView(TestCase):
@@ -395,4 +589,193 @@ class TestFollowerListView(TestCase):
         response = self.client.get(self.url)
         self.assertEqual(response.status_code, 200)
         self.assertTemplateUsed(response, "accounts/follower_list.html")
-        self.assertEqual(response.context["follower_list"].count(), 1)
+        self.assertEqual(len(response.context["follower_list"]), 1)
+
+    def test_query_budget(self):
+        for i in range(5):
+            FriendShip.objects.create(follower=User.objects.create_user(username=f"user{i}"), following=self.user2)
+        with query_budget(FollowerListView.query_budget):
+            self.client.get(self.url)
+
+    def test_success_get_with_relationship_flags(self):
+        user3 = User.objects.create_user(username="test3", password="password3")
+        FriendShip.objects.create(follower=user3, following=self.user2)
+        FriendShip.objects.create(follower=user3, following=self.user1)
+        response = self.client.get(self.url)
+        flags = {
+            friendship.follower: (friendship.viewer_follows, friendship.follows_viewer)
+            for friendship in response.context["follower_list"]
+        }
+        self.assertEqual(flags, {self.user1: (False, False), user3: (False, True)})
+        self.assertContains(response, "フォローされています", count=1)
+
+
+class TestExportView(TestCase):
+    def setUp(self):
+        self.user1 = User.objects.create_user(username="test1", password="password1")
+        self.user2 = User.objects.create_user(username="test2", password="password2")
+        self.client.force_login(self.user1)
+        self.tweet1 = Tweet.objects.create(user=self.user1, content='tweet1,\n"quoted"')
+        self.tweet2 = Tweet.objects.create(user=self.user2, content="tweet2")
+        Like.objects.create(user=self.user1, target=self.tweet2)
+        FriendShip.objects.create(follower=self.user1, following=self.user2)
+        FriendShip.objects.create(follower=self.user2, following=self.user1)
+        self.url = reverse("accounts:export", kwargs={"username": self.user1.username})
+
+    def test_success_get_ndjson(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        self.assertEqual(response["Content-Disposition"], "attachment; filename*=utf-8''test1.ndjson")
+        records = [json.loads(line) for line in b"".join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([record["type"] for record in records], ["user", "tweet", "like", "follow", "follow"])
+        self.assertEqual(records[1]["content"], self.tweet1.content)
+        self.assertEqual(records[1]["created_at"], self.tweet1.created_at.isoformat())
+        like = {"type": "like", "username": "test1", "tweet_id": self.tweet2.pk, "author": "test2"}
+        self.assertEqual(records[2], like)
+        follows = {(record["follower"], record["following"]) for record in records[3:]}
+        self.assertEqual(follows, {("test1", "test2"), ("test2", "test1")})
+
+    def test_success_get_csv(self):
+        response = self.client.get(self.url, {"format": "csv"})
+        self.assertEqual(response["Content-Type"], "text/csv")
+        rows = list(csv.DictReader(StringIO(b"".join(response.streaming_content).decode())))
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(rows[1]["content"], self.tweet1.content)
+        self.assertEqual(rows[0]["date_joined"], self.user1.date_joined.isoformat())
+        self.assertEqual(rows[2]["author"], "test2")
+
+    def test_success_get_gzip(self):
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING="gzip, deflate")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertIn("Accept-Encoding", response["Vary"])
+        lines = gzip.decompress(b"".join(response.streaming_content)).decode().splitlines()
+        self.assertEqual(len(lines), 5)
+
+    def test_failure_get_other_user(self):
+        response = self.client.get(reverse("accounts:export", kwargs={"username": self.user2.username}))
+        self.assertEqual(response.status_code, 403)
+
+    def test_failure_get_with_unknown_format(self):
+        response = self.client.get(self.url, {"format": "xml"})
+        self.assertEqual(response.status_code, 400)
+
+
+class TestExportViewUnderASGI(TransactionTestCase):
+    # The ASGI handler runs each request in its own thread with its own
+    # database connection, which cannot see rows left uncommitted by TestCase.
+    def setUp(self):
+        self.user = User.objects.create_user(username="test1", password="password1")
+        Tweet.objects.create(user=self.user, content="tweet1")
+        self.client.force_login(self.user)
+        self.url = reverse("accounts:export", kwargs={"username": self.user.username})
+
+    async def test_success_get(self):
+        cookie = f"{settings.SESSION_COOKIE_NAME}={self.client.cookies[settings.SESSION_COOKIE_NAME].value}"
+        scope = {
+            "type": "http",
+            "method": "GET",
+            "path": self.url,
+            "query_string": b"",
+            "headers": [(b"host", b"testserver"), (b"cookie", cookie.encode())],
+        }
+        communicator = ApplicationCommunicator(application, scope)
+        await communicator.send_input({"type": "http.request"})
+        start = await communicator.receive_output()
+        self.assertEqual(start["status"], 200)
+        body = b""
+        while True:
+            message = await communicator.receive_output()
+            body += message.get("body", b"")
+            if not message.get("more_body"):
+                break
+        records = [json.loads(line) for line in body.decode().splitlines()]
+        self.assertEqual([record["type"] for record in records], ["user", "tweet"])
+
+
+class TestExportUserCommand(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="test1", password="password1")
+        Tweet.objects.bulk_create([Tweet(user=self.user, content=f"tweet{i}") for i in range(5)])
+
+    def test_export(self):
+        out = StringIO()
+        call_command("export_user", "test1", chunk_size=2, stdout=out, stderr=StringIO())
+        self.assertEqual(len(out.getvalue().splitlines()), 6)
+
+    def test_export_gzip(self):
+        output = os.path.join(tempfile.mkdtemp(), "test1.csv.gz")
+        call_command("export_user", "test1", format="csv", gzip=True, output=output, stderr=StringIO())
+        with gzip.open(output, "rt") as f:
+            self.assertEqual(len(list(csv.DictReader(f))), 6)
+
+    def test_export_unknown_user(self):
+        with self.assertRaisesMessage(CommandError, "does not exist"):
+            call_command("export_user", "nobody", stdout=StringIO())
+
+
+class TestImportArchiveCommand(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="test1", password="password1")
+        records = [
+            {"type": "user", "username": "alice", "date_joined": "2020-01-01T00:00:00+00:00"},
+            {"type": "user", "username": "bob", "date_joined": "2020-01-02T00:00:00"},
+            {"type": "tweet", "username": "alice", "content": "hello #django", "created_at": "2020-01-03T00:00:00"},
+            {"type": "tweet", "username": "bob", "content": "", "created_at": "2020-01-03T00:00:00"},
+            {"type": "tweet", "username": "nobody", "content": "who", "created_at": "2020-01-03T00:00:00"},
+            {"type": "follow", "follower": "bob", "following": "alice", "created_at": "2020-01-04T00:00:00"},
+            {"type": "follow", "follower": "test1", "following": "alice", "created_at": "2020-01-04T00:00:00"},
+            {"type": "follow", "follower": "bob", "following": "bob", "created_at": "2020-01-04T00:00:00"},
+            {"type": "like", "username": "bob", "tweet_id": 1, "author": "alice"},
+        ]
+        self.path = os.path.join(tempfile.mkdtemp(), "archive.ndjson")
+        with open(self.path, "w") as f:
+            for record in records:
+                f.write(json.dumps(record) + "\n")
+            f.write("not json\n")
+
+    def test_import(self):
+        out = StringIO()
+        call_command("import_archive", self.path, batch_size=3, stdout=out, stderr=StringIO())
+        self.assertIn("Imported 2 users, 1 tweets and 2 follows, skipped 5 lines", out.getvalue())
+        tweet = Tweet.objects.get(user__username="alice")
+        self.assertEqual(tweet.created_at.isoformat(), "2020-01-03T00:00:00+00:00")
+        self.assertTrue(TweetHashtag.objects.filter(tweet=tweet, hashtag__name="django").exists())
+        alice = User.objects.get(username="alice")
+        self.assertEqual(alice.followers_count, 2)
+        self.assertFalse(alice.has_usable_password())
+        self.assertTrue(TimelineEntry.objects.filter(owner=self.user, tweet=tweet).exists())
+
+    def test_import_twice(self):
+        call_command("import_archive", self.path, stdout=StringIO(), stderr=StringIO())
+        out = StringIO()
+        call_command("import_archive", self.path, stdout=out, stderr=StringIO())
+        self.assertIn("already imported", out.getvalue())
+        self.assertEqual(Tweet.objects.count(), 1)
+
+    def test_resume_after_failure(self):
+        write = ArchiveImporter.write
+        calls = []
+
+        def fail_on_second_batch(importer, records):
+            calls.append(records)
+            if len(calls) == 2:
+                raise RuntimeError("interrupted")
+            return write(importer, records)
+
+        with mock.patch.object(ArchiveImporter, "write", fail_on_second_batch):
+            with self.assertRaises(RuntimeError):
+                call_command("import_archive", self.path, batch_size=3, stdout=StringIO(), stderr=StringIO())
+        self.assertEqual(ImportCheckpoint.objects.get().lines, 3)
+
+        out = StringIO()
+        call_command("import_archive", self.path, batch_size=3, stdout=out, stderr=StringIO())
+        self.assertIn("Resuming at line 4", out.getvalue())
+        self.assertEqual(Tweet.objects.count(), 1)
+        self.assertEqual(FriendShip.objects.count(), 2)
+        self.assertEqual(User.objects.get(username="alice").followers_count, 2)
+
+    def test_import_missing_file(self):
+        with self.assertRaisesMessage(CommandError, "Cannot read"):
+            call_command("import_archive", "/nonexistent.ndjson", stdout=StringIO())
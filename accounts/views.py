@@ -1,20 +1,40 @@
+import re
+from urllib.parse import quote
+
+from asgiref.sync import sync_to_async
 from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth import authenticate, get_user_model, login
-from django.contrib.auth.mixins import LoginRequiredMixin
-from django.http import HttpResponseBadRequest
+from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
+from django.db import transaction
+from django.db.models import Exists, F, Max, OuterRef
+from django.db.models.functions import Greatest
+from django.http import Http404, HttpResponseBadRequest, StreamingHttpResponse
 from django.shortcuts import HttpResponseRedirect, get_object_or_404, render
 from django.urls import reverse, reverse_lazy
+from django.utils.cache import patch_vary_headers
 from django.views.generic import CreateView, DetailView, ListView, View
 
-from tweets.models import Like, Tweet
+from tweets import timeline
+from tweets.conditional import ConditionalGetMixin
+from tweets.models import Tweet
+from tweets.pagination import KeysetPaginationMixin, keyset_window
 
+from . import export
 from .forms import SignupForm
-from .models import FriendShip
+from .mixins import AsyncLoginRequiredMixin
+from .models import FollowSuggestion, FriendShip
 
 User = get_user_model()
 
 
+async def aget_user_or_404(username):
+    try:
+        return await User.objects.aget(username=username, is_active=True)
+    except User.DoesNotExist:
+        raise Http404
+
+
 class SignupView(CreateView):
     form_class = SignupForm
     template_name = "accounts/signup.html"
@@ -29,73 +49,156 @@ class SignupView(CreateView):
         return response
 
 
-class UserProfileView(LoginRequiredMixin, DetailView):
+class UserProfileView(LoginRequiredMixin, KeysetPaginationMixin, ConditionalGetMixin, DetailView):
     template_name = "accounts/profile.html"
     model = User
     context_object_name = "user"
     slug_url_kwarg = "username"
     slug_field = "username"
+    # Own profile: session, user, profile user, fingerprint, suggestions version, tweets, suggestions
+    query_budget = 7
+    suggestion_count = 5
+
+    def get_queryset(self):
+        following = FriendShip.objects.filter(following=OuterRef("pk"), follower=self.request.user)
+        return super().get_queryset().filter(is_active=True).annotate(is_following=Exists(following))
+
+    def get_object(self, queryset=None):
+        if getattr(self, "object", None) is None:
+            self.object = super().get_object(queryset)
+        return self.object
+
+    def get_validators(self):
+        user = self.get_object()
+        tweets = keyset_window(Tweet.objects.filter(user=user), self.get_cursor(), self.page_size + 1)
+        fingerprint = Tweet.objects.filter(pk__in=tweets.values("id")).fingerprint(self.request.user)
+        validators = (user.pk, user.followers_count, user.following_count, user.is_following, fingerprint)
+        if user == self.request.user:
+            validators += (FollowSuggestion.objects.filter(user=user).aggregate(Max("id"))["id__max"],)
+        return validators
+
+    def get_follow_suggestions(self):
+        # Accounts followed since the suggestions were computed are skipped.
+        followed = FriendShip.objects.filter(follower=self.request.user, following=OuterRef("suggested"))
+        suggestions = FollowSuggestion.objects.filter(user=self.request.user, suggested__is_active=True)
+        suggestions = suggestions.exclude(Exists(followed))
+        return list(suggestions.select_related("suggested").order_by("rank")[: self.suggestion_count])
 
     def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
         user = self.object
-        tweets = Tweet.objects.select_related("user").prefetch_related("likes").filter(user=user)
-        context["tweet_list"] = tweets.order_by("-created_at")
-        context["is_following"] = FriendShip.objects.filter(following=user, follower=self.request.user).exists()
-        context["following_num"] = FriendShip.objects.filter(follower=user).count()
-        context["followers_num"] = FriendShip.objects.filter(following=user).count()
-        likes = Like.objects.filter(user=self.request.user).values_list("target", flat=True)
-        context["user_like_list"] = likes
+        tweets = Tweet.objects.select_related("user").with_viewer_state(self.request.user).filter(user=user)
+        kwargs["tweet_list"] = self.paginate_keyset(tweets)
+        context = super().get_context_data(**kwargs)
+        context["is_following"] = user.is_following
+        context["following_num"] = user.following_count
+        context["followers_num"] = user.followers_count
+        if user == self.request.user:
+            context["follow_suggestions"] = self.get_follow_suggestions()
         return context
 
 
-class FollowView(LoginRequiredMixin, View):
-    def post(self, request, *args, **kwargs):
-        following = get_object_or_404(User, username=self.kwargs["username"])
+class FollowView(AsyncLoginRequiredMixin, View):
+    async def post(self, request, *args, **kwargs):
+        following = await aget_user_or_404(self.kwargs["username"])
         follower = request.user
 
         if following == follower:
             messages.warning(request, "自分自身はフォローできません。")
             return HttpResponseBadRequest(render(request, "error/400.html"))
 
-        if FriendShip.objects.filter(following=following, follower=follower).exists():
+        if await FriendShip.objects.filter(following=following, follower=follower).aexists():
             messages.warning(request, "フォロー済です。")
             return HttpResponseRedirect(reverse("accounts:user_profile", kwargs={"username": following.username}))
 
-        FriendShip.objects.create(following=following, follower=follower)
+        await sync_to_async(self.follow)(follower, following)
         return HttpResponseRedirect(reverse("accounts:user_profile", kwargs={"username": following.username}))
 
+    @transaction.atomic
+    def follow(self, follower, following):
+        FriendShip.objects.create(following=following, follower=follower)
+        User.objects.filter(pk=following.pk).update(followers_count=F("followers_count") + 1)
+        User.objects.filter(pk=follower.pk).update(following_count=F("following_count") + 1)
+        timeline.backfill(follower, following)
 
-class UnFollowView(LoginRequiredMixin, View):
-    def post(self, request, *args, **kwargs):
-        following = get_object_or_404(User, username=self.kwargs["username"])
+
+class UnFollowView(AsyncLoginRequiredMixin, View):
+    async def post(self, request, *args, **kwargs):
+        following = await aget_user_or_404(self.kwargs["username"])
         follower = request.user
         unfollow = FriendShip.objects.filter(following=following, follower=follower)
 
         if following == follower:
             messages.warning(request, "自分自身を対象には出来ません。")
             return HttpResponseBadRequest(render(request, "error/400.html"))
-        elif unfollow.exists():
-            unfollow.delete()
+        elif await unfollow.aexists():
+            await sync_to_async(self.unfollow)(follower, following, unfollow)
             return HttpResponseRedirect(reverse("accounts:user_profile", kwargs={"username": following.username}))
         else:
             messages.warning(request, "無効な操作です。")
             return HttpResponseBadRequest(render(request, "error/400.html"))
 
+    @transaction.atomic
+    def unfollow(self, follower, following, unfollow):
+        if unfollow.delete()[0]:
+            User.objects.filter(pk=following.pk).update(followers_count=Greatest(F("followers_count") - 1, 0))
+            User.objects.filter(pk=follower.pk).update(following_count=Greatest(F("following_count") - 1, 0))
+        timeline.prune(follower, following)
 
-class FollowingListView(LoginRequiredMixin, ListView):
-    template_name = "accounts/following_list.html"
-    context_object_name = "following_list"
+
+class FollowListMixin(LoginRequiredMixin, KeysetPaginationMixin):
+    # The account listed on each row; the other side of the row is the profile
+    # owner, `user_field`.
+    listed_field = None
+    user_field = None
+    query_budget = 4
 
     def get_queryset(self):
-        user = get_object_or_404(User, username=self.kwargs["username"])
-        return FriendShip.objects.select_related("following").filter(follower=user).order_by("-created_at")
+        user = get_object_or_404(User, username=self.kwargs["username"], is_active=True)
+        viewer = self.request.user
+        listed = OuterRef(self.listed_field)
+        friendships = (
+            FriendShip.objects.select_related(self.listed_field)
+            .filter(**{self.user_field: user, f"{self.listed_field}__is_active": True})
+            .annotate(
+                viewer_follows=Exists(FriendShip.objects.filter(follower=viewer, following=listed)),
+                follows_viewer=Exists(FriendShip.objects.filter(follower=listed, following=viewer)),
+            )
+        )
+        return self.paginate_keyset(friendships)
+
+
+class FollowingListView(FollowListMixin, ListView):
+    template_name = "accounts/following_list.html"
+    context_object_name = "following_list"
+    listed_field = "following"
+    user_field = "follower"
 
 
-class FollowerListView(LoginRequiredMixin, ListView):
+class FollowerListView(FollowListMixin, ListView):
     template_name = "accounts/follower_list.html"
     context_object_name = "follower_list"
+    listed_field = "follower"
+    user_field = "following"
 
-    def get_queryset(self):
-        user = get_object_or_404(User, username=self.kwargs["username"])
-        return FriendShip.objects.select_related("follower").filter(following=user).order_by("-created_at")
+
+class ExportView(LoginRequiredMixin, UserPassesTestMixin, View):
+    accepts_gzip = re.compile(r"\bgzip\b")
+
+    def get(self, request, *args, **kwargs):
+        format = request.GET.get("format", "ndjson")
+        if format not in export.CONTENT_TYPES:
+            messages.warning(request, "エクスポート形式が正しくありません。")
+            return HttpResponseBadRequest(render(request, "error/400.html"))
+        compress = bool(self.accepts_gzip.search(request.headers.get("Accept-Encoding", "")))
+        response = StreamingHttpResponse(
+            export.export(request.user, format, compress), content_type=export.CONTENT_TYPES[format]
+        )
+        filename = quote(f"{request.user.username}.{format}")
+        response["Content-Disposition"] = f"attachment; filename*=utf-8''{filename}"
+        if compress:
+            response["Content-Encoding"] = "gzip"
+        patch_vary_headers(response, ["Accept-Encoding"])
+        return response
+
+    def test_func(self):
+        return self.request.user.username == self.kwargs["username"]
@@ -0,0 +1,87 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.test import AsyncClient, Client, override_settings
+from django.urls import reverse
+
+from monitoring.profiling import percentiles
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        "Send the same GET requests concurrently through the ASGI handler (one event loop) and the WSGI handler "
+        "(one thread per concurrent request) and report throughput and latency at each concurrency level."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--url-name", action="append", help="Endpoint to request (default: tweets:timeline).")
+        parser.add_argument("--concurrency", default="1,8,32", help="Comma separated concurrency levels.")
+        parser.add_argument("--requests", type=int, default=200, help="Requests per endpoint and level.")
+        parser.add_argument("--username", help="Viewer account (default: the user following the most accounts).")
+
+    # AsyncClient always sends "Host: testserver".
+    @override_settings(ALLOWED_HOSTS=["testserver"])
+    def handle(self, *args, **options):
+        if options["username"]:
+            viewer = User.objects.get(username=options["username"])
+        else:
+            viewer = User.objects.order_by("-following_count", "id").first()
+        if viewer is None:
+            raise CommandError("The database has no users; run seed_scale first.")
+        client = Client()
+        client.force_login(viewer)
+        self.cookies = client.cookies
+
+        levels = [int(level) for level in options["concurrency"].split(",")]
+        for url_name in options["url_name"] or ["tweets:timeline"]:
+            url = reverse(url_name)
+            for concurrency in levels:
+                for mode, run in (("wsgi", self.run_wsgi), ("asgi", self.run_asgi)):
+                    started = time.perf_counter()
+                    latencies = run(url, concurrency, options["requests"])
+                    elapsed = time.perf_counter() - started
+                    latency = percentiles(latencies)
+                    self.stdout.write(
+                        f"{url_name:<24} {mode} concurrency={concurrency:<4} {len(latencies) / elapsed:8.1f} req/s "
+                        f"p50={latency['p50']:8.2f}ms p95={latency['p95']:8.2f}ms"
+                    )
+
+    def run_wsgi(self, url, concurrency, total):
+        local = threading.local()
+
+        def send(_):
+            if not hasattr(local, "client"):
+                local.client = Client()
+                local.client.cookies.update(self.cookies)
+            started = time.perf_counter()
+            self.check_response(url, local.client.get(url))
+            return (time.perf_counter() - started) * 1000
+
+        with ThreadPoolExecutor(concurrency) as pool:
+            return list(pool.map(send, range(total)))
+
+    def run_asgi(self, url, concurrency, total):
+        async def run():
+            client = AsyncClient()
+            client.cookies.update(self.cookies)
+            semaphore = asyncio.Semaphore(concurrency)
+
+            async def send():
+                async with semaphore:
+                    started = time.perf_counter()
+                    self.check_response(url, await client.get(url))
+                    return (time.perf_counter() - started) * 1000
+
+            return await asyncio.gather(*(send() for _ in range(total)))
+
+        return asyncio.run(run())
+
+    def check_response(self, url, response):
+        if response.status_code != 200:
+            raise CommandError(f"{url} returned {response.status_code}")
@@ -0,0 +1,252 @@
+import json
+import platform
+import statistics
+import time
+import tracemalloc
+from importlib import import_module
+
+import django
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.urls import reverse
+from django.utils import timezone
+
+from accounts.models import FriendShip
+from monitoring.profiling import QueryCapture, percentiles
+from tweets.models import Hashtag, Like, Tweet
+
+User = get_user_model()
+
+URLCONFS = ["tweets.urls", "accounts.urls"]
+
+# Routes the test client cannot exercise: tweets:events is a long-lived stream
+# served by mysite.asgi, and its URL only answers other requests with 204.
+UNBENCHMARKED = {"tweets:events"}
+
+
+class Scenario:
+    def __init__(self, url_name, method="get", kwargs=None, data=None, setup=None, content_type=None):
+        self.url_name = url_name
+        self.method = method
+        self.kwargs = kwargs or {}
+        self.data = data or {}
+        self.setup = setup
+        self.content_type = content_type
+
+    @property
+    def key(self):
+        return f"{self.method.upper()} {self.url_name}"
+
+
+class Command(BaseCommand):
+    help = (
+        "Drive every tweets/accounts endpoint through the test client against the current database and report "
+        "latency percentiles, query count, rows fetched and peak memory. All writes are rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=20)
+        parser.add_argument("--warmup", type=int, default=2)
+        parser.add_argument("--username", help="Viewer account (default: the user following the most accounts).")
+        parser.add_argument("--output", default="benchmark.json")
+        parser.add_argument("--compare", help="Baseline JSON file written by a previous run.")
+        parser.add_argument(
+            "--threshold", type=float, default=0.2, help="Allowed relative p95 latency growth over the baseline."
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            results = self.run(options)
+            transaction.set_rollback(True)
+
+        with open(options["output"], "w") as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+        self.stdout.write(f"Results written to {options['output']}")
+
+        if options["compare"]:
+            with open(options["compare"]) as f:
+                baseline = json.load(f)
+            regressions = self.compare(baseline, results, options["threshold"])
+            if regressions:
+                raise CommandError(f"{len(regressions)} endpoint(s) regressed:\n" + "\n".join(regressions))
+            self.stdout.write(self.style.SUCCESS("No regressions against the baseline."))
+
+    def run(self, options):
+        rows = {
+            "users": User.objects.count(),
+            "tweets": Tweet.objects.count(),
+            "likes": Like.objects.count(),
+            "friendships": FriendShip.objects.count(),
+        }
+        if options["username"]:
+            viewer = User.objects.get(username=options["username"])
+        else:
+            viewer = User.objects.order_by("-following_count", "id").first()
+        if viewer is None:
+            raise CommandError("The database has no users; run seed_scale first.")
+        other = User.objects.exclude(pk=viewer.pk).order_by("-followers_count", "id").first()
+        if other is None:
+            other = User.objects.create(username="bench-other")
+        tweet = Tweet.objects.order_by("-like_count", "-id").first()
+        if tweet is None:
+            tweet = Tweet.objects.create(user=other, content="benchmark")
+
+        client = Client(SERVER_NAME=self.server_name())
+        client.force_login(viewer)
+        scenarios = self.scenarios(client, viewer, other, tweet)
+        uncovered = self.url_names() - {scenario.url_name for scenario in scenarios} - UNBENCHMARKED
+        for url_name in sorted(uncovered):
+            self.stderr.write(f"No benchmark scenario for {url_name}")
+
+        endpoints = {}
+        for scenario in scenarios:
+            endpoints[scenario.key] = self.measure(client, scenario, options["iterations"], options["warmup"])
+            self.report(scenario.key, endpoints[scenario.key])
+        return {
+            "meta": {
+                "created_at": timezone.now().isoformat(),
+                "python": platform.python_version(),
+                "django": django.get_version(),
+                "vendor": connection.vendor,
+                "iterations": options["iterations"],
+                "viewer": viewer.username,
+                "rows": rows,
+            },
+            "endpoints": endpoints,
+        }
+
+    def scenarios(self, client, viewer, other, tweet):
+        def post(url_name, **kwargs):
+            def setup():
+                client.post(reverse(url_name, kwargs=kwargs))
+
+            return setup
+
+        def login():
+            client.force_login(viewer)
+
+        def new_tweet():
+            return {"pk": Tweet.objects.create(user=viewer, content="benchmark").pk}
+
+        own = {"pk": new_tweet()["pk"]}
+        pk = {"pk": tweet.pk}
+        username = {"username": other.username}
+        page = list(Tweet.objects.order_by("-created_at", "-id").values_list("pk", flat=True)[:20])
+        hashtag = Hashtag.objects.order_by("id").values_list("name", flat=True).first() or "benchmark"
+        return [
+            Scenario("tweets:home"),
+            Scenario("tweets:timeline"),
+            Scenario("tweets:create"),
+            Scenario("tweets:create", "post", data={"content": "benchmark"}),
+            Scenario("tweets:detail", kwargs=pk),
+            Scenario("tweets:search", data={"q": max(tweet.content.split() or ["benchmark"], key=len)}),
+            Scenario("tweets:hashtag", kwargs={"name": hashtag}),
+            Scenario("tweets:mentions"),
+            Scenario("tweets:trending"),
+            Scenario("tweets:delete", kwargs=own),
+            Scenario("tweets:delete", "post", setup=new_tweet),
+            Scenario("tweets:like", "post", kwargs=pk, setup=post("tweets:unlike", **pk)),
+            Scenario("tweets:unlike", "post", kwargs=pk, setup=post("tweets:like", **pk)),
+            Scenario("tweets:likes", data={"ids": ",".join(map(str, page))}),
+            Scenario(
+                "tweets:likes",
+                "post",
+                data={"actions": [{"id": pk, "liked": i % 2 == 0} for i, pk in enumerate(page)]},
+                content_type="application/json",
+            ),
+            Scenario("accounts:signup"),
+            Scenario("accounts:login"),
+            Scenario("accounts:user_profile", kwargs=username),
+            Scenario("accounts:follow", "post", kwargs=username, setup=post("accounts:unfollow", **username)),
+            Scenario("accounts:unfollow", "post", kwargs=username, setup=post("accounts:follow", **username)),
+            Scenario("accounts:following_list", kwargs={"username": viewer.username}),
+            Scenario("accounts:follower_list", kwargs=username),
+            Scenario("accounts:export", kwargs={"username": viewer.username}),
+            Scenario("accounts:logout", "post", setup=login),
+        ]
+
+    def server_name(self):
+        for host in settings.ALLOWED_HOSTS:
+            if host != "*":
+                return host.lstrip(".")
+        return "localhost"
+
+    def url_names(self):
+        names = set()
+        for urlconf in URLCONFS:
+            module = import_module(urlconf)
+            names.update(f"{module.app_name}:{pattern.name}" for pattern in module.urlpatterns)
+        return names
+
+    def request(self, client, scenario):
+        kwargs = dict(scenario.kwargs)
+        if scenario.setup:
+            kwargs.update(scenario.setup() or {})
+        url = reverse(scenario.url_name, kwargs=kwargs)
+        extra = {"content_type": scenario.content_type} if scenario.content_type else {}
+
+        def send():
+            response = getattr(client, scenario.method)(url, scenario.data, **extra)
+            if response.streaming:
+                # Streamed bodies are produced while they are read.
+                for _ in response.streaming_content:
+                    pass
+            return response
+
+        return send
+
+    def measure(self, client, scenario, iterations, warmup):
+        for _ in range(warmup):
+            self.request(client, scenario)()
+
+        latencies, queries, rows, statuses = [], [], [], set()
+        for _ in range(iterations):
+            send = self.request(client, scenario)
+            with QueryCapture() as capture:
+                started = time.perf_counter()
+                response = send()
+                latencies.append((time.perf_counter() - started) * 1000)
+            queries.append(len(capture))
+            rows.append(capture.rows)
+            statuses.add(response.status_code)
+
+        # Peak memory is measured on a separate request, since tracing every
+        # allocation would distort the latency samples.
+        send = self.request(client, scenario)
+        tracemalloc.start()
+        try:
+            send()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        return {
+            "latency_ms": {key: round(value, 3) for key, value in percentiles(latencies).items()},
+            "queries": max(queries),
+            "rows": int(statistics.median(rows)),
+            "peak_memory_kib": round(peak / 1024, 1),
+            "status": sorted(statuses),
+        }
+
+    def report(self, key, result):
+        latency = result["latency_ms"]
+        self.stdout.write(
+            f"{key:<36} p50={latency['p50']:8.2f}ms p95={latency['p95']:8.2f}ms p99={latency['p99']:8.2f}ms "
+            f"queries={result['queries']:<3} rows={result['rows']:<6} peak={result['peak_memory_kib']}KiB "
+            f"status={result['status']}"
+        )
+
+    def compare(self, baseline, results, threshold):
+        regressions = []
+        for key, current in results["endpoints"].items():
+            previous = baseline["endpoints"].get(key)
+            if previous is None:
+                continue
+            if current["latency_ms"]["p95"] > previous["latency_ms"]["p95"] * (1 + threshold):
+                regressions.append(f"{key}: p95 {previous['latency_ms']['p95']}ms -> {current['latency_ms']['p95']}ms")
+            if current["queries"] > previous["queries"]:
+                regressions.append(f"{key}: queries {previous['queries']} -> {current['queries']}")
+        return regressions
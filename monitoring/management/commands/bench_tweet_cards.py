@@ -0,0 +1,64 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+from django.template import engines
+from django.test import RequestFactory
+
+from monitoring.profiling import percentiles
+from tweets.models import Tweet
+
+User = get_user_model()
+
+RENDERERS = {
+    "include": "{% for tweet in tweet_list %}\n{% include 'tweets/tweet_card.html' %}\n{% endfor %}",
+    "tag": "{% load tweet_cards %}{% tweet_cards tweet_list %}",
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Render the same page of tweet cards with the include-based template and the tweet_cards tag, "
+        "check that the output is identical and report render times with a cold and a warm fragment cache."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--tweets", type=int, default=100, help="Tweet cards per render.")
+        parser.add_argument("--iterations", type=int, default=50, help="Renders per renderer and cache state.")
+        parser.add_argument("--username", help="Viewer account (default: the author of the newest tweet).")
+
+    def handle(self, *args, **options):
+        tweets = Tweet.objects.select_related("user").order_by("-created_at", "-id")
+        if options["username"]:
+            viewer = User.objects.get(username=options["username"])
+        else:
+            newest = tweets.first()
+            if newest is None:
+                raise CommandError("The database has no tweets; run seed_scale first.")
+            viewer = newest.user
+        tweet_list = list(tweets.with_viewer_state(viewer)[: options["tweets"]])
+        request = RequestFactory().get("/")
+        request.user = viewer
+        cache = caches["tweet_cards"]
+
+        outputs = {}
+        for cache_state in ("cold", "warm"):
+            for name, source in RENDERERS.items():
+                template = engines["django"].from_string(source)
+                cache.clear()
+                template.render({"tweet_list": tweet_list}, request)
+                samples = []
+                for _ in range(options["iterations"]):
+                    if cache_state == "cold":
+                        cache.clear()
+                    started = time.perf_counter()
+                    outputs[name] = template.render({"tweet_list": tweet_list}, request)
+                    samples.append((time.perf_counter() - started) * 1000)
+                latency = percentiles(samples)
+                self.stdout.write(
+                    f"{name:<8} {cache_state} {len(tweet_list)} cards "
+                    f"p50={latency['p50']:8.2f}ms p95={latency['p95']:8.2f}ms"
+                )
+            if outputs["include"] != outputs["tag"]:
+                raise CommandError("The tweet_cards tag renders different output from tweets/tweet_card.html.")
@@ -0,0 +1,72 @@
+import threading
+from bisect import bisect_left
+
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+class Registry:
+    """
+    In-process aggregation of request metrics, labelled by URL name. Each
+    worker process keeps its own registry and is scraped separately.
+    """
+
+    metrics = {
+        "django_request_duration_seconds": ("Total time spent handling the request.", SECONDS_BUCKETS),
+        "django_view_duration_seconds": ("Time spent outside template rendering.", SECONDS_BUCKETS),
+        "django_db_duration_seconds": ("Time spent executing SQL.", SECONDS_BUCKETS),
+        "django_template_duration_seconds": ("Time spent rendering templates.", SECONDS_BUCKETS),
+        "django_db_queries": ("SQL queries executed per request.", QUERY_COUNT_BUCKETS),
+    }
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.histograms = {name: {} for name in self.metrics}
+            self.responses = {}
+
+    def observe(self, view, status, values):
+        with self.lock:
+            for name, value in values.items():
+                histograms = self.histograms[name]
+                if view not in histograms:
+                    histograms[view] = Histogram(self.metrics[name][1])
+                histograms[view].observe(value)
+            key = (view, status)
+            self.responses[key] = self.responses.get(key, 0) + 1
+
+    def render(self):
+        lines = []
+        with self.lock:
+            for name, (help_text, buckets) in self.metrics.items():
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} histogram")
+                for view, histogram in sorted(self.histograms[name].items()):
+                    cumulative = 0
+                    for bound, count in zip((*buckets, "+Inf"), histogram.counts):
+                        cumulative += count
+                        lines.append(f'{name}_bucket{{view="{view}",le="{bound}"}} {cumulative}')
+                    lines.append(f'{name}_sum{{view="{view}"}} {histogram.sum}')
+                    lines.append(f'{name}_count{{view="{view}"}} {cumulative}')
+            lines.append("# HELP django_responses_total Responses by URL name and status code.")
+            lines.append("# TYPE django_responses_total counter")
+            for (view, status), count in sorted(self.responses.items()):
+                lines.append(f'django_responses_total{{view="{view}",status="{status}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
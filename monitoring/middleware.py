@@ -0,0 +1,152 @@
+import logging
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connection
+
+from .metrics import registry
+from .querybudget import find_repeated, normalize_sql, query_location
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetMiddleware:
+    """
+    Development middleware that logs requests exceeding their view's
+    ``query_budget`` and repeated statements that look like N+1 queries,
+    together with the template line or code location that issued them.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        queries = []
+
+        def record(execute, sql, params, many, context):
+            queries.append((sql, query_location()))
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(record):
+            response = self.get_response(request)
+        self.check(request, queries)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.query_budget = getattr(getattr(view_func, "view_class", view_func), "query_budget", None)
+
+    def check(self, request, queries):
+        budget = getattr(request, "query_budget", None)
+        if budget is not None and len(queries) > budget:
+            listing = "\n".join(f"  {sql}\n    at {location}" for sql, location in queries)
+            logger.warning(
+                "%s %s ran %d queries, budget is %d:\n%s", request.method, request.path, len(queries), budget, listing
+            )
+
+        repeated = find_repeated([sql for sql, _ in queries], settings.QUERY_BUDGET_N_PLUS_ONE_THRESHOLD)
+        for pattern, count in repeated.items():
+            locations = sorted({location for sql, location in queries if normalize_sql(sql) == pattern})
+            logger.warning(
+                "%s %s ran %d similar queries: %s\n%s",
+                request.method,
+                request.path,
+                count,
+                pattern,
+                "\n".join(f"    at {location}" for location in locations),
+            )
+
+
+class RequestTiming:
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.template_started = None
+        self.started = time.perf_counter()
+
+    def record_query(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - started
+            self.queries += 1
+
+    def install(self):
+        connection.execute_wrappers.append(self.record_query)
+
+    def uninstall(self):
+        connection.execute_wrappers.remove(self.record_query)
+
+    def start_template(self):
+        self.template_started = time.perf_counter()
+
+    def finish_template(self, response):
+        self.template_time += time.perf_counter() - self.template_started
+
+
+class MetricsMiddleware:
+    """
+    Measure SQL, template and total time per request, return them in a
+    ``Server-Timing`` header and aggregate them by URL name for ``/metrics``.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        timing = request.timing = RequestTiming()
+        with connection.execute_wrapper(timing.record_query):
+            response = self.get_response(request)
+        return self.finish(request, response)
+
+    async def __acall__(self, request):
+        timing = request.timing = RequestTiming()
+        # Connections are thread-local, so the wrapper is installed on the
+        # connection of the thread that runs this request's sync code.
+        await sync_to_async(timing.install)()
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(timing.uninstall)()
+        return self.finish(request, response)
+
+    def finish(self, request, response):
+        timing = request.timing
+        total = time.perf_counter() - timing.started
+        view = total - timing.template_time
+
+        match = request.resolver_match
+        registry.observe(
+            match.view_name if match else "unresolved",
+            response.status_code,
+            {
+                "django_request_duration_seconds": total,
+                "django_view_duration_seconds": view,
+                "django_db_duration_seconds": timing.db_time,
+                "django_template_duration_seconds": timing.template_time,
+                "django_db_queries": timing.queries,
+            },
+        )
+        response["Server-Timing"] = ", ".join(
+            [
+                f'db;dur={timing.db_time * 1000:.2f};desc="{timing.queries} queries"',
+                f"tpl;dur={timing.template_time * 1000:.2f}",
+                f"view;dur={view * 1000:.2f}",
+                f"total;dur={total * 1000:.2f}",
+            ]
+        )
+        return response
+
+    def process_template_response(self, request, response):
+        request.timing.start_template()
+        response.add_post_render_callback(request.timing.finish_template)
+        return response
@@ -0,0 +1,60 @@
+import statistics
+
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.backends.utils import CursorDebugWrapper
+from django.test.utils import CaptureQueriesContext
+
+
+class RowCountingCursorWrapper(CursorDebugWrapper):
+    def __init__(self, cursor, db, capture):
+        super().__init__(cursor, db)
+        self.capture = capture
+
+    def fetchone(self):
+        with self.db.wrap_database_errors:
+            row = self.cursor.fetchone()
+        if row is not None:
+            self.capture.rows += 1
+        return row
+
+    def fetchmany(self, size=None):
+        with self.db.wrap_database_errors:
+            rows = self.cursor.fetchmany() if size is None else self.cursor.fetchmany(size)
+        self.capture.rows += len(rows)
+        return rows
+
+    def fetchall(self):
+        with self.db.wrap_database_errors:
+            rows = self.cursor.fetchall()
+        self.capture.rows += len(rows)
+        return rows
+
+
+class QueryCapture(CaptureQueriesContext):
+    """
+    Capture the queries run on a connection, like CaptureQueriesContext, and
+    also count the rows fetched from their cursors.
+    """
+
+    def __init__(self, using=DEFAULT_DB_ALIAS):
+        super().__init__(connections[using])
+        self.rows = 0
+
+    def __enter__(self):
+        self.connection.make_debug_cursor = lambda cursor: RowCountingCursorWrapper(cursor, self.connection, self)
+        return super().__enter__()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        del self.connection.make_debug_cursor
+        super().__exit__(exc_type, exc_value, traceback)
+
+    @property
+    def db_time(self):
+        return sum(float(query["time"]) for query in self.captured_queries)
+
+
+def percentiles(samples, points=(50, 95, 99)):
+    if len(samples) == 1:
+        return {f"p{point}": samples[0] for point in points}
+    cuts = statistics.quantiles(samples, n=100, method="inclusive")
+    return {f"p{point}": cuts[point - 1] for point in points}
@@ -0,0 +1,87 @@
+import os
+import re
+import sys
+from collections import Counter
+from contextlib import ContextDecorator
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.template.base import Node
+from django.test.utils import CaptureQueriesContext
+
+TRANSACTION_STATEMENT = re.compile(r"^\s*(SAVEPOINT|RELEASE|ROLLBACK|BEGIN|COMMIT)\b", re.IGNORECASE)
+STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+PLACEHOLDER_LIST = re.compile(r"\((?:\s*(?:\?|%s)\s*,)+\s*(?:\?|%s)\s*\)")
+
+PACKAGE_DIR = os.path.dirname(__file__)
+PROJECT_DIR = str(settings.BASE_DIR)
+MANAGE_PY = os.path.join(PROJECT_DIR, "manage.py")
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def normalize_sql(sql):
+    sql = STRING_LITERAL.sub("?", sql)
+    sql = NUMBER_LITERAL.sub("?", sql)
+    return PLACEHOLDER_LIST.sub("(...)", sql)
+
+
+def find_repeated(statements, threshold):
+    counts = Counter(normalize_sql(sql) for sql in statements if not TRANSACTION_STATEMENT.match(sql))
+    return {sql: count for sql, count in counts.items() if count >= threshold}
+
+
+def query_location():
+    # Report the innermost template node being rendered, if any, otherwise the
+    # innermost frame from project code, falling back to the innermost frame
+    # outside this package (e.g. inside django.contrib.sessions).
+    project_frame = outer_frame = None
+    frame = sys._getframe(1)
+    while frame is not None:
+        node = frame.f_locals.get("self")
+        if frame.f_code.co_name == "render_annotated" and isinstance(node, Node) and node.origin:
+            return f"{node.origin.name}, line {node.token.lineno}"
+        filename = frame.f_code.co_filename
+        if not filename.startswith(PACKAGE_DIR):
+            location = f"{filename}:{frame.f_lineno} in {frame.f_code.co_name}"
+            outer_frame = outer_frame or location
+            if project_frame is None and filename.startswith(PROJECT_DIR) and filename != MANAGE_PY:
+                project_frame = location
+        frame = frame.f_back
+    return project_frame or outer_frame
+
+
+class query_budget(ContextDecorator):
+    """
+    Fail when the wrapped block runs more than ``max_queries`` queries, or runs
+    the same statement (ignoring literal values) ``n_plus_one_threshold`` times
+    or more.
+    """
+
+    def __init__(self, max_queries, n_plus_one_threshold=None, using=DEFAULT_DB_ALIAS):
+        self.max_queries = max_queries
+        self.n_plus_one_threshold = n_plus_one_threshold or settings.QUERY_BUDGET_N_PLUS_ONE_THRESHOLD
+        self.using = using
+
+    def __enter__(self):
+        self.capture = CaptureQueriesContext(connections[self.using])
+        self.capture.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.capture.__exit__(exc_type, exc_value, traceback)
+        if exc_type is not None:
+            return
+        statements = [query["sql"] for query in self.capture.captured_queries]
+        listing = "\n".join(f"{i}. {sql}" for i, sql in enumerate(statements, start=1))
+        if len(statements) > self.max_queries:
+            raise QueryBudgetExceeded(
+                f"{len(statements)} queries executed, budget is {self.max_queries}. Queries:\n{listing}"
+            )
+        repeated = find_repeated(statements, self.n_plus_one_threshold)
+        if repeated:
+            patterns = "\n".join(f"{count}x {sql}" for sql, count in repeated.items())
+            raise QueryBudgetExceeded(f"Possible N+1 queries:\n{patterns}")
@@ -0,0 +1,205 @@
+import json
+import os
+import tempfile
+from io import StringIO
+from unittest.mock import patch
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.template import Context, Template
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from tweets.models import Tweet
+from tweets.views import HomeView
+
+from .metrics import Registry, registry
+from .profiling import QueryCapture, percentiles
+from .querybudget import QueryBudgetExceeded, normalize_sql, query_budget, query_location
+
+User = get_user_model()
+
+
+class TestQueryCapture(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpassword")
+        Tweet.objects.bulk_create([Tweet(user=self.user, content=f"tweet{i}") for i in range(3)])
+
+    def test_capture(self):
+        with QueryCapture() as capture:
+            list(Tweet.objects.all())
+            Tweet.objects.filter(content="tweet0").exists()
+        self.assertEqual(len(capture), 2)
+        self.assertEqual(capture.rows, 4)
+
+
+class TestPercentiles(TestCase):
+    def test_percentiles(self):
+        result = percentiles(list(range(1, 101)))
+        self.assertEqual(result["p50"], 50.5)
+        self.assertAlmostEqual(result["p99"], 99.01)
+
+
+class TestBenchEndpointsCommand(TestCase):
+    def setUp(self):
+        self.user1 = User.objects.create_user(username="testuser", password="testpassword")
+        self.user2 = User.objects.create_user(username="testuser2", password="testpassword2")
+        Tweet.objects.create(user=self.user2, content="tweet")
+        self.output = os.path.join(tempfile.mkdtemp(), "benchmark.json")
+
+    def bench(self, **options):
+        self.stderr = StringIO()
+        call_command(
+            "bench_endpoints",
+            iterations=2,
+            warmup=0,
+            output=self.output,
+            stdout=StringIO(),
+            stderr=self.stderr,
+            **options,
+        )
+        with open(self.output) as f:
+            return json.load(f)
+
+    def test_bench(self):
+        results = self.bench(username="testuser")
+        self.assertEqual(results["endpoints"]["GET tweets:home"]["status"], [200])
+        self.assertEqual(results["endpoints"]["POST tweets:like"]["status"], [200])
+        self.assertEqual(results["meta"]["rows"]["tweets"], 1)
+        self.assertEqual(Tweet.objects.count(), 1)
+        self.assertEqual(self.stderr.getvalue(), "")
+
+    def test_bench_with_regression(self):
+        results = self.bench()
+        results["endpoints"]["GET tweets:home"]["queries"] = 0
+        baseline = self.output + ".baseline"
+        with open(baseline, "w") as f:
+            json.dump(results, f)
+        with self.assertRaisesMessage(CommandError, "GET tweets:home: queries 0"):
+            self.bench(compare=baseline, threshold=1000)
+
+
+class TestBenchTweetCardsCommand(TestCase):
+    def test_bench(self):
+        user = User.objects.create_user(username="testuser", password="testpassword")
+        Tweet.objects.create(user=user, content="tweet")
+        out = StringIO()
+        call_command("bench_tweet_cards", iterations=2, stdout=out)
+        self.assertEqual(out.getvalue().count(" 1 cards "), 4)
+
+    def test_bench_without_tweets(self):
+        with self.assertRaisesMessage(CommandError, "The database has no tweets"):
+            call_command("bench_tweet_cards", iterations=2, stdout=StringIO())
+
+
+class TestQueryBudget(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpassword")
+        Tweet.objects.bulk_create([Tweet(user=self.user, content=f"tweet{i}") for i in range(3)])
+
+    def test_normalize_sql(self):
+        self.assertEqual(
+            normalize_sql("SELECT * FROM t WHERE a = 'x''y' AND b = 1.5 AND c IN (%s, %s, %s)"),
+            "SELECT * FROM t WHERE a = ? AND b = ? AND c IN (...)",
+        )
+
+    def test_within_budget(self):
+        with query_budget(1):
+            list(Tweet.objects.select_related("user"))
+
+    def test_over_budget(self):
+        with self.assertRaisesMessage(QueryBudgetExceeded, "2 queries executed, budget is 1"):
+            with query_budget(1):
+                Tweet.objects.count()
+                User.objects.count()
+
+    def test_n_plus_one(self):
+        with self.assertRaisesMessage(QueryBudgetExceeded, "3x SELECT"):
+            with query_budget(10):
+                for tweet in Tweet.objects.all():
+                    tweet.user.username
+
+
+@override_settings(MIDDLEWARE=["monitoring.middleware.QueryBudgetMiddleware", *settings.MIDDLEWARE])
+class TestQueryBudgetMiddleware(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpassword")
+        self.client.force_login(self.user)
+        Tweet.objects.bulk_create([Tweet(user=self.user, content=f"tweet{i}") for i in range(3)])
+
+    def test_within_budget(self):
+        with self.assertNoLogs("monitoring.middleware"):
+            self.client.get(reverse("tweets:home"))
+
+    def test_over_budget(self):
+        with patch.object(HomeView, "query_budget", 1), self.assertLogs("monitoring.middleware", "WARNING") as logs:
+            self.client.get(reverse("tweets:home"))
+        self.assertIn("budget is 1", logs.output[0])
+        self.assertIn("tweets/timeline.py", logs.output[0])
+
+    def test_query_location_in_template(self):
+        template = Template("{% for tweet in tweets %}\n{{ tweet.user.username }}{% endfor %}")
+        tweets = list(Tweet.objects.all())
+        locations = []
+
+        def record(execute, sql, params, many, context):
+            locations.append(query_location())
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(record):
+            template.render(Context({"tweets": tweets}))
+        self.assertEqual(locations, ["<unknown source>, line 2"] * 3)
+
+
+class TestMetricsRegistry(TestCase):
+    def test_render(self):
+        metrics = Registry()
+        metrics.observe("tweets:home", 200, {"django_request_duration_seconds": 0.02, "django_db_queries": 7})
+        metrics.observe("tweets:home", 200, {"django_request_duration_seconds": 3, "django_db_queries": 7})
+        text = metrics.render()
+        self.assertIn('django_request_duration_seconds_bucket{view="tweets:home",le="0.01"} 0', text)
+        self.assertIn('django_request_duration_seconds_bucket{view="tweets:home",le="0.025"} 1', text)
+        self.assertIn('django_request_duration_seconds_bucket{view="tweets:home",le="+Inf"} 2', text)
+        self.assertIn('django_request_duration_seconds_sum{view="tweets:home"} 3.02', text)
+        self.assertIn('django_db_queries_bucket{view="tweets:home",le="10"} 2', text)
+        self.assertIn('django_responses_total{view="tweets:home",status="200"} 2', text)
+
+
+class TestMetricsMiddleware(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpassword")
+        self.client.force_login(self.user)
+        registry.reset()
+
+    def test_server_timing(self):
+        response = self.client.get(reverse("tweets:home"))
+        timings = dict(metric.split(";", 1) for metric in response["Server-Timing"].split(", "))
+        self.assertEqual(list(timings), ["db", "tpl", "view", "total"])
+        self.assertRegex(timings["db"], r'^dur=[0-9.]+;desc="6 queries"$')
+
+    async def test_server_timing_asgi(self):
+        await sync_to_async(self.async_client.force_login)(self.user)
+        response = await self.async_client.get(reverse("tweets:timeline"))
+        self.assertIn('desc="5 queries"', response["Server-Timing"])
+
+    def test_metrics_endpoint(self):
+        self.client.get(reverse("tweets:home"))
+        self.client.get(reverse("tweets:timeline"))
+        response = self.client.get(reverse("monitoring:metrics"))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response["Content-Type"].startswith("text/plain"))
+        text = response.content.decode()
+        self.assertIn('django_template_duration_seconds_count{view="tweets:home"} 1', text)
+        self.assertIn('django_db_queries_bucket{view="tweets:timeline",le="10"} 1', text)
+        self.assertIn('django_responses_total{view="tweets:home",status="200"} 1', text)
+
+    def test_metrics_endpoint_forbidden_from_other_addresses(self):
+        response = self.client.get(reverse("monitoring:metrics"), REMOTE_ADDR="203.0.113.1")
+        self.assertEqual(response.status_code, 403)
+        self.user.is_staff = True
+        self.user.save()
+        response = self.client.get(reverse("monitoring:metrics"), REMOTE_ADDR="203.0.113.1")
+        self.assertEqual(response.status_code, 200)
@@ -0,0 +1,16 @@
+from django.conf import settings
+from django.core.exceptions import PermissionDenied
+from django.http import HttpResponse
+from django.views import View
+
+from .metrics import registry
+
+
+class MetricsView(View):
+    def dispatch(self, request, *args, **kwargs):
+        if request.META.get("REMOTE_ADDR") not in settings.METRICS_ALLOWED_IPS and not request.user.is_staff:
+            raise PermissionDenied
+        return super().dispatch(request, *args, **kwargs)
+
+    def get(self, request, *args, **kwargs):
+        return HttpResponse(registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
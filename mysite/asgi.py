@@ -9,8 +9,53 @@ https://docs.djangoproject.com/en/4.0/howto/deployment/asgi/
 
 import os
 
-from django.core.asgi import get_asgi_application
+import django
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIHandler
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "mysite.settings")
 
-application = get_asgi_application()
+
+class StreamingASGIHandler(ASGIHandler):
+    """
+    Django's ASGI handler, except that streaming response bodies are read in
+    the request's sync thread. Django 4.1 iterates them on the event loop,
+    where a body generator that queries the database (such as the export)
+    raises SynchronousOnlyOperation.
+    """
+
+    async def send_response(self, response, send):
+        if not response.streaming:
+            return await super().send_response(response, send)
+        parts = iter(response)
+        response.streaming_content = []
+        next_part = sync_to_async(next, thread_sensitive=True)
+
+        async def send_parts(message):
+            # The base implementation sends the headers, finds an empty body
+            # and sends the closing message; the parts go out just before it.
+            if message["type"] == "http.response.body" and not message.get("more_body"):
+                while (part := await next_part(parts, None)) is not None:
+                    for chunk, _ in self.chunk_bytes(part):
+                        await send({"type": "http.response.body", "body": chunk, "more_body": True})
+            await send(message)
+
+        await super().send_response(response, send_parts)
+
+
+django.setup(set_prefix=False)
+django_application = StreamingASGIHandler()
+
+from django.urls import reverse  # noqa: E402
+
+from tweets.events import stream_events  # noqa: E402
+
+EVENTS_PATH = reverse("tweets:events")
+
+
+async def application(scope, receive, send):
+    # Django 4.1 cannot stream from async code, so the event stream is served
+    # by its own ASGI application.
+    if scope["type"] == "http" and scope["path"] == EVENTS_PATH:
+        return await stream_events(scope, receive, send)
+    return await django_application(scope, receive, send)
@@ -39,9 +39,11 @@ INSTALLED_APPS = [
     "accounts.apps.AccountsConfig",
     "tweets.apps.TweetsConfig",
     "welcome.apps.WelcomeConfig",
+    "monitoring.apps.MonitoringConfig",
 ]
 
 MIDDLEWARE = [
+    "monitoring.middleware.MetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -83,6 +85,17 @@ DATABASES = {
 }
 
 
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "tweet_cards": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "tweet_cards",
+        "OPTIONS": {"MAX_ENTRIES": 20000},
+    },
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/4.0/ref/settings/#auth-password-validators
 
@@ -132,6 +145,34 @@ LOGIN_REDIRECT_URL = "tweets:home"
 
 LOGOUT_REDIRECT_URL = "welcome:index"
 
+# Authors with more followers than this are not fanned out on write;
+# their tweets are merged into followers' home timelines at read time.
+TIMELINE_FANOUT_MAX_FOLLOWERS = 1000
+
+# Number of recent tweets copied into a timeline when following someone.
+TIMELINE_BACKFILL_SIZE = 100
+
+# Queue likes in a local SQLite file instead of writing them directly; run
+# `manage.py flush_like_buffer --interval 1` to apply them in bulk.
+LIKE_WRITE_BEHIND = False
+
+LIKE_BUFFER_PATH = BASE_DIR / "like_buffer.sqlite3"
+
+# Server-Sent Events stream (tweets:events), served only under ASGI.
+EVENTS_COALESCE_SECONDS = 1
+
+EVENTS_KEEPALIVE_SECONDS = 15
+
+# Likes are counted per period of this length for the trending page; run
+# `manage.py refresh_trending --interval 60` to rebuild its top TRENDING_SIZE.
+TRENDING_BUCKET_SECONDS = 300
+
+TRENDING_SIZE = 50
+
+# /metrics/ is served to staff users and to these client addresses (e.g. the
+# Prometheus scraper). Behind a proxy, REMOTE_ADDR is the proxy's address.
+METRICS_ALLOWED_IPS = ["127.0.0.1", "::1"]
+
 SQL_DEBUG = False
 
 if SQL_DEBUG:
@@ -144,3 +185,12 @@ if SQL_DEBUG:
     DEBUG_TOOLBAR_CONFIG = {
         "SHOW_TOOLBAR_CALLBACK": show_toolbar,
     }
+
+# Log requests that exceed their view's `query_budget` or repeat a statement
+# this many times, with the template line or code that ran the queries.
+QUERY_BUDGET_DEBUG = False
+
+QUERY_BUDGET_N_PLUS_ONE_THRESHOLD = 3
+
+if QUERY_BUDGET_DEBUG:
+    MIDDLEWARE.insert(0, "monitoring.middleware.QueryBudgetMiddleware")
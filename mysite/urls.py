@@ -21,6 +21,7 @@ urlpatterns = [
     path("admin/", admin.site.urls),
     path("accounts/", include("accounts.urls")),
     path("tweets/", include("tweets.urls")),
+    path("metrics/", include("monitoring.urls")),
     path("", include("welcome.urls")),
 ]
 
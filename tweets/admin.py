@@ -1,6 +1,28 @@
 from django.contrib import admin
 
-from .models import Like, Tweet
+from . import purge
+from .models import Hashtag, Like, Mention, PurgeJob, TimelineEntry, Tweet, TweetHashtag
+
+
+@admin.action(description="非表示にしてバックグラウンドで削除")
+def schedule_purge(modeladmin, request, queryset):
+    for tweet in queryset:
+        purge.schedule_tweet(tweet)
+
+
+@admin.register(Tweet)
+class TweetAdmin(admin.ModelAdmin):
+    actions = [schedule_purge]
+
+    def has_delete_permission(self, request, obj=None):
+        # Deleting in one transaction cascades through every related row and
+        # holds the write lock; deletions go through schedule_purge instead.
+        return False
+
 
-admin.site.register(Tweet)
 admin.site.register(Like)
+admin.site.register(TimelineEntry)
+admin.site.register(Hashtag)
+admin.site.register(TweetHashtag)
+admin.site.register(Mention)
+admin.site.register(PurgeJob)
@@ -0,0 +1,38 @@
+from django.conf import settings
+from django.contrib import messages
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.crypto import md5
+from django.utils.http import quote_etag
+
+
+class ConditionalGetMixin:
+    """
+    Answer GET with 304 Not Modified, before building the page, when the
+    client's ETag matches one derived from ``get_validators()``.
+    """
+
+    def get_validators(self):
+        raise NotImplementedError
+
+    def get_etag(self):
+        request = self.request
+        values = (
+            request.user.pk,
+            request.get_full_path(),
+            request.COOKIES.get(settings.CSRF_COOKIE_NAME),
+            *self.get_validators(),
+        )
+        return quote_etag(md5(repr(values).encode(), usedforsecurity=False).hexdigest())
+
+    def get(self, request, *args, **kwargs):
+        # Flash messages are shown once, so a page carrying them is never
+        # reused.
+        if len(messages.get_messages(request)):
+            return super().get(request, *args, **kwargs)
+        etag = self.get_etag()
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = super().get(request, *args, **kwargs)
+        response["ETag"] = etag
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
@@ -0,0 +1,95 @@
+import re
+import unicodedata
+
+from django.contrib.auth import get_user_model
+
+from .models import Hashtag, Mention, TweetHashtag
+from .pagination import KeysetPage, encode_cursor, keyset_window
+
+User = get_user_model()
+
+HASHTAG_RE = re.compile(r"(?<!\w)[#＃](\w+)")
+MENTION_RE = re.compile(r"(?<![\w@])[@＠]([\w.@+-]+)")
+
+
+def normalize_hashtag(name):
+    # "＃ＤＪＡＮＧＯ" and "#django" are the same tag.
+    return unicodedata.normalize("NFKC", name).lower()
+
+
+def extract_hashtags(content):
+    return list(dict.fromkeys(normalize_hashtag(name) for name in HASHTAG_RE.findall(content)))
+
+
+def extract_mentions(content):
+    # Usernames may end with "." but a mention at the end of a sentence is more
+    # likely, so both readings are looked up.
+    names = []
+    for name in MENTION_RE.findall(content):
+        names.append(name)
+        names.append(name.rstrip(".+-"))
+    return list(dict.fromkeys(name for name in names if name))
+
+
+def index_tweets(tweets):
+    """
+    Store the hashtags and mentions of ``tweets``, an iterable of
+    ``(id, content, created_at)``, with a fixed number of queries per call.
+    """
+    tweet_tags = {}
+    tweet_mentions = {}
+    for pk, content, created_at in tweets:
+        tweet_tags[pk, created_at] = extract_hashtags(content)
+        tweet_mentions[pk, created_at] = extract_mentions(content)
+
+    names = {name for tags in tweet_tags.values() for name in tags}
+    if names:
+        Hashtag.objects.bulk_create([Hashtag(name=name) for name in names], ignore_conflicts=True)
+        hashtag_ids = dict(Hashtag.objects.filter(name__in=names).values_list("name", "id"))
+        TweetHashtag.objects.bulk_create(
+            [
+                TweetHashtag(tweet_id=pk, hashtag_id=hashtag_ids[name], created_at=created_at)
+                for (pk, created_at), tags in tweet_tags.items()
+                for name in tags
+            ],
+            batch_size=500,
+            ignore_conflicts=True,
+        )
+
+    usernames = {name for mentions in tweet_mentions.values() for name in mentions}
+    if usernames:
+        user_ids = dict(User.objects.filter(username__in=usernames).values_list("username", "id"))
+        Mention.objects.bulk_create(
+            [
+                Mention(tweet_id=pk, user_id=user_ids[name], created_at=created_at)
+                for (pk, created_at), mentions in tweet_mentions.items()
+                for name in mentions
+                if name in user_ids
+            ],
+            batch_size=500,
+            ignore_conflicts=True,
+        )
+
+
+def index_tweet(tweet):
+    index_tweets([(tweet.pk, tweet.content, tweet.created_at)])
+
+
+def _page(entries, queryset, cursor, page_size):
+    fields = ("created_at", "tweet_id")
+    keys = list(keyset_window(entries, cursor, page_size + 1, fields).values_list(*fields))
+    next_cursor = None
+    if len(keys) > page_size:
+        keys = keys[:page_size]
+        next_cursor = encode_cursor(*keys[-1])
+    tweets = queryset.in_bulk([pk for _, pk in keys])
+    return KeysetPage([tweets[pk] for _, pk in keys if pk in tweets], next_cursor)
+
+
+def hashtag_tweets(name, queryset, cursor=None, page_size=20):
+    entries = TweetHashtag.objects.filter(hashtag__name=normalize_hashtag(name))
+    return _page(entries, queryset, cursor, page_size)
+
+
+def mentioning_tweets(user, queryset, cursor=None, page_size=20):
+    return _page(Mention.objects.filter(user=user), queryset, cursor, page_size)
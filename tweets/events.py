@@ -0,0 +1,151 @@
+import asyncio
+import json
+from collections import defaultdict
+from importlib import import_module
+from io import BytesIO
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user
+from django.core.handlers.asgi import ASGIRequest
+
+from accounts.models import FriendShip
+
+MAX_TWEETS = 200
+
+
+class Subscriber:
+    def __init__(self, tweet_ids, followee_ids):
+        self.tweet_ids = tweet_ids
+        self.followee_ids = followee_ids
+        self.like_counts = {}
+        self.new_tweets = self.reported_new_tweets = 0
+        self.changed = asyncio.Event()
+
+    def drain(self):
+        # Several changes between two sends collapse into one message per
+        # event type, carrying only the latest like count of each tweet.
+        messages = []
+        if self.like_counts:
+            messages.append(f"event: likes\ndata: {json.dumps(self.like_counts)}\n\n")
+            self.like_counts = {}
+        if self.new_tweets != self.reported_new_tweets:
+            messages.append(f"event: timeline\ndata: {json.dumps({'new_tweets': self.new_tweets})}\n\n")
+            self.reported_new_tweets = self.new_tweets
+        self.changed.clear()
+        return "".join(messages).encode()
+
+
+class EventHub:
+    """
+    In-process pub/sub for the event stream. Subscribers live on the ASGI event
+    loop; publishers may run in any thread and hand events over to the loop.
+    Only clients connected to the same process are notified.
+    """
+
+    def __init__(self):
+        self.loop = None
+        self.by_tweet = defaultdict(set)
+        self.by_author = defaultdict(set)
+
+    def subscribe(self, subscriber):
+        self.loop = asyncio.get_running_loop()
+        for tweet_id in subscriber.tweet_ids:
+            self.by_tweet[tweet_id].add(subscriber)
+        for author_id in subscriber.followee_ids:
+            self.by_author[author_id].add(subscriber)
+
+    def unsubscribe(self, subscriber):
+        for index, keys in ((self.by_tweet, subscriber.tweet_ids), (self.by_author, subscriber.followee_ids)):
+            for key in keys:
+                index[key].discard(subscriber)
+                if not index[key]:
+                    del index[key]
+
+    def publish(self, method, *args):
+        loop = self.loop
+        if loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(method, *args)
+
+    def publish_like_count(self, tweet_id, like_count):
+        self.publish(self.dispatch_like_count, tweet_id, like_count)
+
+    def publish_tweet(self, tweet):
+        self.publish(self.dispatch_tweet, tweet.user_id)
+
+    def dispatch_like_count(self, tweet_id, like_count):
+        for subscriber in self.by_tweet.get(tweet_id, ()):
+            subscriber.like_counts[tweet_id] = like_count
+            subscriber.changed.set()
+
+    def dispatch_tweet(self, author_id):
+        for subscriber in self.by_author.get(author_id, ()):
+            subscriber.new_tweets += 1
+            subscriber.changed.set()
+
+
+hub = EventHub()
+
+
+def load_subscriber(scope):
+    request = ASGIRequest(scope, BytesIO())
+    engine = import_module(settings.SESSION_ENGINE)
+    request.session = engine.SessionStore(request.COOKIES.get(settings.SESSION_COOKIE_NAME))
+    user = get_user(request)
+    if not user.is_authenticated:
+        return None
+    try:
+        tweet_ids = {int(pk) for pk in request.GET.get("tweets", "").split(",") if pk}
+    except ValueError:
+        tweet_ids = set()
+    followee_ids = set(FriendShip.objects.filter(follower=user).values_list("following_id", flat=True))
+    return Subscriber(set(islice(tweet_ids, MAX_TWEETS)), followee_ids)
+
+
+async def wait_for_disconnect(receive):
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+
+async def stream_events(scope, receive, send):
+    """
+    ASGI application streaming Server-Sent Events: ``likes`` with the new like
+    counts of the tweets listed in ``?tweets=``, and ``timeline`` with the
+    number of tweets posted by followed accounts since the stream was opened.
+    """
+    subscriber = await sync_to_async(load_subscriber)(scope)
+    if subscriber is None:
+        await send({"type": "http.response.start", "status": 403, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+        return
+
+    await send(
+        {
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [
+                (b"content-type", b"text/event-stream"),
+                (b"cache-control", b"no-cache"),
+                (b"x-accel-buffering", b"no"),
+            ],
+        }
+    )
+    await send({"type": "http.response.body", "body": b"retry: 5000\n\n", "more_body": True})
+    hub.subscribe(subscriber)
+    disconnected = asyncio.ensure_future(wait_for_disconnect(receive))
+    try:
+        while True:
+            changed = asyncio.ensure_future(subscriber.changed.wait())
+            done, _ = await asyncio.wait(
+                {changed, disconnected}, timeout=settings.EVENTS_KEEPALIVE_SECONDS, return_when=asyncio.FIRST_COMPLETED
+            )
+            changed.cancel()
+            if disconnected in done:
+                break
+            body = subscriber.drain() if changed in done else b": keepalive\n\n"
+            await send({"type": "http.response.body", "body": body, "more_body": True})
+            await asyncio.sleep(settings.EVENTS_COALESCE_SECONDS)
+    finally:
+        hub.unsubscribe(subscriber)
+        disconnected.cancel()
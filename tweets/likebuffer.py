@@ -0,0 +1,166 @@
+import sqlite3
+import threading
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connections, transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .models import Like, LikeBucket, Tweet
+
+User = get_user_model()
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pending_like (
+    user_id INTEGER NOT NULL,
+    tweet_id INTEGER NOT NULL,
+    liked INTEGER NOT NULL,
+    was_liked INTEGER NOT NULL,
+    PRIMARY KEY (user_id, tweet_id)
+)
+"""
+
+# Rows per INSERT or DELETE, at most three parameters each.
+ROWS_PER_STATEMENT = 2000
+
+_local = threading.local()
+
+
+def get_connection():
+    # One connection per thread and buffer file. The buffer lives outside the
+    # main database, so recording a like never takes its write lock.
+    path = str(settings.LIKE_BUFFER_PATH)
+    connections = _local.__dict__.setdefault("connections", {})
+    if path not in connections:
+        conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(SCHEMA)
+        connections[path] = conn
+    return connections[path]
+
+
+def close():
+    for conn in _local.__dict__.pop("connections", {}).values():
+        conn.close()
+
+
+def record(user, tweet_id, liked):
+    """
+    Queue a like or unlike, replacing any earlier pending action of the user on
+    the tweet, and return the tweet's like count including pending actions
+    (None if the tweet does not exist).
+    """
+    tweets = Tweet.objects.with_viewer_state(user).filter(pk=tweet_id)
+    row = tweets.values_list("like_count", "is_liked_by_viewer").first()
+    if row is None:
+        return None
+    like_count, is_liked = row
+    conn = get_connection()
+    conn.execute(
+        "INSERT INTO pending_like (user_id, tweet_id, liked, was_liked) VALUES (?, ?, ?, ?) "
+        "ON CONFLICT (user_id, tweet_id) DO UPDATE SET liked = excluded.liked",
+        [user.pk, tweet_id, liked, is_liked],
+    )
+    (delta,) = conn.execute(
+        "SELECT COALESCE(SUM(liked - was_liked), 0) FROM pending_like WHERE tweet_id = ?", [tweet_id]
+    ).fetchone()
+    return max(like_count + delta, 0)
+
+
+def pending(user, tweet_ids):
+    """
+    Return the pending like count delta of each tweet and the pending action
+    of the user on each tweet, for tweets that have any.
+    """
+    conn = get_connection()
+    marks = ", ".join("?" * len(tweet_ids))
+    deltas = conn.execute(
+        f"SELECT tweet_id, SUM(liked - was_liked) FROM pending_like WHERE tweet_id IN ({marks}) GROUP BY tweet_id",
+        tweet_ids,
+    )
+    liked = conn.execute(
+        f"SELECT tweet_id, liked FROM pending_like WHERE user_id = ? AND tweet_id IN ({marks})", [user.pk, *tweet_ids]
+    )
+    return dict(deltas), {tweet_id: bool(value) for tweet_id, value in liked}
+
+
+def _returning(cursor, statement, rows):
+    """
+    Run ``statement(values)`` for each chunk of ``rows``, where ``values`` is
+    the chunk's VALUES list, and return the rows the statements returned.
+    """
+    returned = []
+    for start in range(0, len(rows), ROWS_PER_STATEMENT):
+        chunk = rows[start : start + ROWS_PER_STATEMENT]
+        values = ", ".join(["({})".format(", ".join(["%s"] * len(chunk[0])))] * len(chunk))
+        cursor.execute(statement(values), [value for row in chunk for value in row])
+        returned.extend(cursor.fetchall())
+    return returned
+
+
+def flush(limit=10000):
+    """
+    Apply up to ``limit`` pending actions to Like and Tweet.like_count in one
+    transaction. Counts are adjusted by the rows actually inserted or deleted,
+    so replaying actions after a crash is harmless. Returns the number of
+    actions applied.
+    """
+    conn = get_connection()
+    pending = conn.execute("SELECT user_id, tweet_id, liked FROM pending_like LIMIT ?", [limit]).fetchall()
+    if not pending:
+        return 0
+
+    connection = connections[Like.objects.db]
+    table = connection.ops.quote_name(Like._meta.db_table)
+    now = timezone.now()
+    liked_at = connection.ops.adapt_datetimefield_value(now)
+    with transaction.atomic(using=Like.objects.db), connection.cursor() as cursor:
+        tweet_ids = set(Tweet.objects.filter(pk__in={pk for _, pk, _ in pending}).values_list("pk", flat=True))
+        user_ids = set(User.objects.filter(pk__in={pk for pk, _, _ in pending}).values_list("pk", flat=True))
+        actions = [action for action in pending if action[0] in user_ids and action[1] in tweet_ids]
+        # Likes that already exist, or are already gone, return no row, so
+        # only real changes reach the counters.
+        created = _returning(
+            cursor,
+            lambda values: f"INSERT INTO {table} (user_id, target_id, created_at) VALUES {values} "
+            "ON CONFLICT DO NOTHING RETURNING target_id",
+            [(user_id, tweet_id, liked_at) for user_id, tweet_id, liked in actions if liked],
+        )
+        deleted = _returning(
+            cursor,
+            lambda values: f"DELETE FROM {table} WHERE (user_id, target_id) IN (VALUES {values}) "
+            "RETURNING target_id, created_at",
+            [(user_id, tweet_id) for user_id, tweet_id, liked in actions if not liked],
+        )
+
+        deltas = Counter(tweet_id for (tweet_id,) in created)
+        deltas.subtract(tweet_id for tweet_id, _ in deleted)
+        tweets_by_delta = defaultdict(list)
+        for tweet_id, delta in deltas.items():
+            if delta:
+                tweets_by_delta[delta].append(tweet_id)
+        for delta, ids in tweets_by_delta.items():
+            Tweet.all_objects.filter(pk__in=ids).update(like_count=Greatest(F("like_count") + delta, 0))
+        LikeBucket.objects.add(Counter(tweet_id for (tweet_id,) in created), at=now)
+        LikeBucket.objects.remove((tweet_id, Like.objects.liked_at(connection, value)) for tweet_id, value in deleted)
+
+    # Actions toggled again while flushing stay queued, now relative to the
+    # state that was just written.
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.executemany(
+            "DELETE FROM pending_like WHERE user_id = ? AND tweet_id = ? AND liked = ?",
+            pending,
+        )
+        conn.executemany(
+            "UPDATE pending_like SET was_liked = ? WHERE user_id = ? AND tweet_id = ?",
+            [(liked, user_id, tweet_id) for user_id, tweet_id, liked in pending],
+        )
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    return len(pending)
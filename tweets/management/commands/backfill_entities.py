@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from tweets import entities
+from tweets.models import Tweet
+
+
+class Command(BaseCommand):
+    help = "Extract the hashtags and mentions of existing tweets, one chunk of tweets at a time."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=1000)
+
+    def handle(self, *args, chunk_size, **options):
+        last_id = 0
+        indexed = 0
+        while True:
+            chunk = list(
+                Tweet.objects.filter(id__gt=last_id)
+                .order_by("id")
+                .values_list("id", "content", "created_at")[:chunk_size]
+            )
+            if not chunk:
+                break
+            with transaction.atomic():
+                entities.index_tweets(chunk)
+            last_id = chunk[-1][0]
+            indexed += len(chunk)
+        self.stdout.write(self.style.SUCCESS(f"Indexed hashtags and mentions of {indexed} tweets."))
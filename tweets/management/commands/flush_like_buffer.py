@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from tweets import likebuffer
+
+
+class Command(BaseCommand):
+    help = "Apply likes and unlikes queued in the write-behind buffer (LIKE_WRITE_BEHIND) to the database."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--limit", type=int, default=10000, help="Maximum actions applied per transaction.")
+        parser.add_argument("--interval", type=float, help="Keep running, flushing every INTERVAL seconds.")
+
+    def handle(self, *args, limit, interval, **options):
+        while True:
+            applied = total = likebuffer.flush(limit)
+            while applied == limit:
+                applied = likebuffer.flush(limit)
+                total += applied
+            if total:
+                self.stdout.write(f"Flushed {total} like actions.")
+            if interval is None:
+                break
+            time.sleep(interval)
@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from tweets import purge
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete the rows of hidden tweets and deactivated accounts queued in PurgeJob, "
+        "one short transaction per batch."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000, help="Rows deleted per transaction.")
+        parser.add_argument("--interval", type=float, help="Keep running, checking for jobs every INTERVAL seconds.")
+
+    def handle(self, *args, batch_size, interval, **options):
+        while True:
+            for job in purge.pending():
+                started = time.perf_counter()
+                for job in purge.run(job, batch_size):
+                    pass
+                elapsed = time.perf_counter() - started
+                self.stdout.write(f"Purged {job}: {job.deleted} rows in {elapsed:.1f}s.")
+            if interval is None:
+                break
+            time.sleep(interval)
+        self.stdout.write(self.style.SUCCESS("No deletions pending."))
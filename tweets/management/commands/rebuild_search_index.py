@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from tweets import search
+
+
+class Command(BaseCommand):
+    help = "Rebuild the tweet full-text search index from scratch, one transaction per batch."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=10000)
+
+    def handle(self, *args, batch_size, **options):
+        if not search.is_available():
+            raise CommandError("Full-text search requires SQLite with FTS5.")
+        indexed = 0
+        for indexed in search.rebuild_index(batch_size):
+            self.stdout.write(f"Indexed {indexed} tweets.")
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt the search index with {indexed} tweets."))
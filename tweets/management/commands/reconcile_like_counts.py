@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from tweets.models import Like, Tweet
+
+
+def actual_like_count():
+    likes = Like.objects.filter(target=OuterRef("pk")).values("target").annotate(n=Count("id")).values("n")
+    return Coalesce(Subquery(likes), 0)
+
+
+class Command(BaseCommand):
+    help = "Backfill or repair Tweet.like_count from the Like table, one chunk of tweets at a time."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=1000)
+
+    def handle(self, *args, chunk_size, **options):
+        last_id = 0
+        checked = fixed = 0
+        while True:
+            ids = list(Tweet.objects.filter(id__gt=last_id).order_by("id").values_list("id", flat=True)[:chunk_size])
+            if not ids:
+                break
+            last_id = ids[-1]
+            with transaction.atomic():
+                chunk = Tweet.objects.filter(id__gte=ids[0], id__lte=last_id)
+                drifted = chunk.annotate(actual=actual_like_count()).exclude(like_count=F("actual"))
+                fixed += Tweet.objects.filter(id__in=list(drifted.values_list("id", flat=True))).update(
+                    like_count=actual_like_count()
+                )
+            checked += len(ids)
+        self.stdout.write(self.style.SUCCESS(f"Checked {checked} tweets, fixed {fixed} like counts."))
@@ -0,0 +1,21 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from tweets import trending
+
+
+class Command(BaseCommand):
+    help = "Rebuild the trending tweets and hashtags from the recent like buckets."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--size", type=int, help="Entries per window and kind (default: TRENDING_SIZE).")
+        parser.add_argument("--interval", type=float, help="Keep running, refreshing every INTERVAL seconds.")
+
+    def handle(self, *args, size, interval, **options):
+        while True:
+            entries = trending.refresh(size=size)
+            self.stdout.write(f"Stored {len(entries)} trending entries.")
+            if interval is None:
+                break
+            time.sleep(interval)
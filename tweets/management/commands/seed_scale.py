@@ -0,0 +1,167 @@
+import random
+import time
+from array import array
+from datetime import datetime, timedelta
+from datetime import timezone as dt_timezone
+from itertools import accumulate
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from accounts.models import FriendShip
+from tweets import timeline
+from tweets.models import Like, Tweet
+
+User = get_user_model()
+
+WORDS = [
+    "今日",
+    "天気",
+    "ランチ",
+    "コーヒー",
+    "仕事",
+    "勉強",
+    "映画",
+    "週末",
+    "散歩",
+    "ラーメン",
+    "電車",
+    "猫",
+    "音楽",
+    "Django",
+    "Python",
+    "backend",
+]
+TAGS = ["#python", "#django", "#猫", "#ランチ", "#今日の一枚"]
+
+# Fixed so that the same --seed always produces the same created_at values.
+DEFAULT_END = datetime(2024, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def zipf_cum_weights(n, skew):
+    return array("d", accumulate(1 / (rank + 1) ** skew for rank in range(n)))
+
+
+def chunked(total, size):
+    while total > 0:
+        yield min(total, size)
+        total -= size
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate a deterministic, production-shaped dataset: users, tweets, likes and a power-law follow graph. "
+        "Rows are written with bulk_create in chunked transactions, so model signals are not sent."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=1000)
+        parser.add_argument("--tweets", type=int, default=10000)
+        parser.add_argument("--likes", type=int, default=50000)
+        parser.add_argument("--follows", type=int, default=20000)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--skew", type=float, default=1.1, help="Zipf exponent of account and tweet popularity.")
+        parser.add_argument("--days", type=int, default=365, help="Spread created_at over this many days.")
+        parser.add_argument(
+            "--end", type=datetime.fromisoformat, help="Newest created_at (default: 2024-01-01T00:00:00+00:00)."
+        )
+        parser.add_argument("--prefix", default="seed")
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument("--no-timelines", action="store_true", help="Do not materialize home timelines.")
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options["seed"])
+        self.batch_size = options["batch_size"]
+        self.end = options["end"] or DEFAULT_END
+        if timezone.is_naive(self.end):
+            self.end = timezone.make_aware(self.end)
+        self.span = options["days"] * 86400
+        if User.objects.filter(username__startswith=options["prefix"]).exists():
+            raise CommandError(f"Users prefixed with {options['prefix']!r} already exist.")
+
+        user_ids = self.timed("users", self.create_users, options["users"], options["prefix"])
+        # Popularity ranks are assigned in a seeded random order, so the few
+        # huge accounts are not simply the first users created.
+        self.rng.shuffle(user_ids)
+        user_weights = zipf_cum_weights(len(user_ids), options["skew"])
+        self.timed("follows", self.create_follows, options["follows"], user_ids, user_weights)
+        tweet_ids = self.timed("tweets", self.create_tweets, options["tweets"], user_ids)
+        self.rng.shuffle(tweet_ids)
+        tweet_weights = zipf_cum_weights(len(tweet_ids), options["skew"])
+        self.timed("likes", self.create_likes, options["likes"], user_ids, tweet_ids, tweet_weights)
+
+        call_command("repair_follow_counts", stdout=self.stdout)
+        call_command("reconcile_like_counts", stdout=self.stdout)
+        if not options["no_timelines"]:
+            self.timed("timelines", timeline.backfill_authors, user_ids, self.batch_size)
+
+    def timed(self, label, func, *args):
+        started = time.perf_counter()
+        result = func(*args)
+        self.stdout.write(f"{label}: {time.perf_counter() - started:.1f}s")
+        return result
+
+    def random_datetime(self):
+        return self.end - timedelta(seconds=self.rng.random() * self.span)
+
+    def create_users(self, total, prefix):
+        password = make_password(None)
+        user_ids = array("q")
+        created = 0
+        for size in chunked(total, self.batch_size):
+            users = [
+                User(username=f"{prefix}{created + i:08d}", email=f"{prefix}{created + i:08d}@example.com")
+                for i in range(size)
+            ]
+            for user in users:
+                user.password = password
+                user.date_joined = self.random_datetime()
+            with transaction.atomic():
+                User.objects.bulk_create(users)
+            user_ids.extend(user.id for user in users)
+            created += size
+        return user_ids
+
+    def create_follows(self, total, user_ids, user_weights):
+        for size in chunked(total, self.batch_size):
+            followers = self.rng.choices(user_ids, k=size)
+            followings = self.rng.choices(user_ids, cum_weights=user_weights, k=size)
+            friendships = [
+                FriendShip(follower_id=follower, following_id=following, created_at=self.random_datetime())
+                for follower, following in zip(followers, followings)
+                if follower != following
+            ]
+            with transaction.atomic():
+                FriendShip.objects.bulk_create(friendships, ignore_conflicts=True)
+
+    def create_tweets(self, total, user_ids):
+        tweet_ids = array("q")
+        for size in chunked(total, self.batch_size):
+            tweets = [
+                Tweet(
+                    user_id=self.rng.choice(user_ids), content=self.random_content(), created_at=self.random_datetime()
+                )
+                for _ in range(size)
+            ]
+            with transaction.atomic():
+                Tweet.objects.bulk_create(tweets)
+            tweet_ids.extend(tweet.id for tweet in tweets)
+        return tweet_ids
+
+    def create_likes(self, total, user_ids, tweet_ids, tweet_weights):
+        for size in chunked(total, self.batch_size):
+            users = self.rng.choices(user_ids, k=size)
+            targets = self.rng.choices(tweet_ids, cum_weights=tweet_weights, k=size)
+            likes = [Like(user_id=user, target_id=target) for user, target in zip(users, targets)]
+            with transaction.atomic():
+                Like.objects.bulk_create(likes, ignore_conflicts=True)
+
+    def random_content(self):
+        words = self.rng.choices(WORDS, k=self.rng.randint(3, 12))
+        if self.rng.random() < 0.2:
+            words.append(self.rng.choice(TAGS))
+        return " ".join(words)
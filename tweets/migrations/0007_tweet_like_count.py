@@ -0,0 +1,28 @@
+# Generated by Django 4.1.13 on 2026-10-18 11:04
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_like_counts(apps, schema_editor):
+    Tweet = apps.get_model("tweets", "Tweet")
+    Like = apps.get_model("tweets", "Like")
+    likes = Like.objects.filter(target=OuterRef("pk")).values("target").annotate(n=Count("id")).values("n")
+    Tweet.objects.update(like_count=Coalesce(Subquery(likes), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tweets", "0006_timelineentry"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="tweet",
+            name="like_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_like_counts, migrations.RunPython.noop),
+    ]
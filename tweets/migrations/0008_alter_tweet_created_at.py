@@ -0,0 +1,19 @@
+# Generated by Django 4.1.13 on 2026-10-18 11:09
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tweets", "0007_tweet_like_count"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="tweet",
+            name="created_at",
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
@@ -0,0 +1,58 @@
+from django.db import migrations
+
+# External-content FTS5 index over tweets_tweet.content. The trigram tokenizer
+# indexes every three-character window, so Japanese text without spaces is
+# searchable; the triggers keep it in sync with every insert, update and delete,
+# including bulk_create and cascades.
+CREATE_INDEX = [
+    """
+    CREATE VIRTUAL TABLE tweets_tweet_fts USING fts5(
+        content, content='tweets_tweet', content_rowid='id', tokenize='trigram'
+    )
+    """,
+    """
+    CREATE TRIGGER tweets_tweet_fts_insert AFTER INSERT ON tweets_tweet BEGIN
+        INSERT INTO tweets_tweet_fts (rowid, content) VALUES (new.id, new.content);
+    END
+    """,
+    """
+    CREATE TRIGGER tweets_tweet_fts_delete AFTER DELETE ON tweets_tweet BEGIN
+        INSERT INTO tweets_tweet_fts (tweets_tweet_fts, rowid, content) VALUES ('delete', old.id, old.content);
+    END
+    """,
+    """
+    CREATE TRIGGER tweets_tweet_fts_update AFTER UPDATE OF content ON tweets_tweet BEGIN
+        INSERT INTO tweets_tweet_fts (tweets_tweet_fts, rowid, content) VALUES ('delete', old.id, old.content);
+        INSERT INTO tweets_tweet_fts (rowid, content) VALUES (new.id, new.content);
+    END
+    """,
+    "INSERT INTO tweets_tweet_fts (tweets_tweet_fts) VALUES ('rebuild')",
+]
+
+DROP_INDEX = [
+    "DROP TRIGGER IF EXISTS tweets_tweet_fts_insert",
+    "DROP TRIGGER IF EXISTS tweets_tweet_fts_delete",
+    "DROP TRIGGER IF EXISTS tweets_tweet_fts_update",
+    "DROP TABLE IF EXISTS tweets_tweet_fts",
+]
+
+
+def run(statements):
+    def operation(apps, schema_editor):
+        if schema_editor.connection.vendor != "sqlite":
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tweets", "0008_alter_tweet_created_at"),
+    ]
+
+    operations = [
+        migrations.RunPython(run(CREATE_INDEX), run(DROP_INDEX)),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 4.1.13 on 2026-10-18 11:46
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tweets", "0010_hashtag_mention"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TrendingEntry",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("window", models.CharField(choices=[("hour", "1時間"), ("day", "24時間")], max_length=8)),
+                ("rank", models.PositiveSmallIntegerField()),
+                ("score", models.PositiveIntegerField()),
+                (
+                    "hashtag",
+                    models.ForeignKey(
+                        blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to="tweets.hashtag"
+                    ),
+                ),
+                (
+                    "tweet",
+                    models.ForeignKey(
+                        blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to="tweets.tweet"
+                    ),
+                ),
+            ],
+        ),
+        migrations.CreateModel(
+            name="LikeBucket",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("start", models.DateTimeField()),
+                ("likes", models.PositiveIntegerField(default=0)),
+                (
+                    "tweet",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, related_name="like_buckets", to="tweets.tweet"
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="trendingentry",
+            index=models.Index(fields=["window", "rank"], name="trending_window_rank_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="likebucket",
+            index=models.Index(fields=["start"], name="like_bucket_start_idx"),
+        ),
+        migrations.AddConstraint(
+            model_name="likebucket",
+            constraint=models.UniqueConstraint(fields=("tweet", "start"), name="like_bucket_unique"),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 4.1.13 on 2026-10-18 12:02
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tweets", "0011_likebucket_trendingentry"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PurgeJob",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("kind", models.CharField(choices=[("tweet", "ツイート"), ("user", "ユーザー")], max_length=8)),
+                ("target_id", models.BigIntegerField()),
+                ("stage", models.CharField(blank=True, max_length=32)),
+                ("deleted", models.PositiveBigIntegerField(default=0)),
+                ("created_at", models.DateTimeField(default=django.utils.timezone.now)),
+                ("finished_at", models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name="tweet",
+            name="deleted_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name="purgejob",
+            index=models.Index(fields=["finished_at", "id"], name="purge_job_pending_idx"),
+        ),
+    ]
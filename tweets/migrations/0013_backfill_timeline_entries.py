@@ -0,0 +1,49 @@
+from django.conf import settings
+from django.db import migrations, transaction
+from django.db.models import Count
+
+
+def backfill_timeline_entries(apps, schema_editor):
+    # Home timelines read only TimelineEntry rows for fan-out-on-write authors,
+    # so follow edges that existed before the inbox was introduced need their
+    # followees' recent tweets copied in, as timeline.backfill_authors does.
+    User = apps.get_model("accounts", "User")
+    FriendShip = apps.get_model("accounts", "FriendShip")
+    Tweet = apps.get_model("tweets", "Tweet")
+    TimelineEntry = apps.get_model("tweets", "TimelineEntry")
+    connection = schema_editor.connection
+    sql = (
+        f"INSERT INTO {TimelineEntry._meta.db_table} (owner_id, tweet_id, created_at) "
+        f"SELECT f.follower_id, t.id, t.created_at FROM {FriendShip._meta.db_table} f "
+        f"CROSS JOIN (SELECT id, created_at FROM {Tweet._meta.db_table} WHERE user_id = %s "
+        "AND deleted_at IS NULL ORDER BY created_at DESC, id DESC LIMIT %s) t "
+        "WHERE f.following_id = %s ON CONFLICT DO NOTHING"
+    )
+    # followers_count is not filled in yet on an upgraded database, so the
+    # fan-out-on-write authors are picked by counting their follow edges.
+    small_authors = (
+        FriendShip.objects.values("following_id")
+        .annotate(followers=Count("id"))
+        .filter(followers__lte=settings.TIMELINE_FANOUT_MAX_FOLLOWERS)
+        .values("following_id")
+    )
+    authors = User.objects.filter(id__in=small_authors, is_active=True).order_by("id").values_list("id", flat=True)
+    author_ids = list(authors)
+    for start in range(0, len(author_ids), 1000):
+        with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+            for author_id in author_ids[start : start + 1000]:
+                cursor.execute(sql, [author_id, settings.TIMELINE_BACKFILL_SIZE, author_id])
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ("accounts", "0007_importcheckpoint"),
+        ("tweets", "0012_purge"),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_timeline_entries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 4.1.13 on 2026-10-18 12:24
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tweets", "0013_backfill_timeline_entries"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="like",
+            name="created_at",
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
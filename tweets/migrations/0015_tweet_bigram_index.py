@@ -0,0 +1,59 @@
+from django.db import migrations
+
+# Contentless FTS5 index over the two-character windows of
+# tweets_tweet.content, for search terms too short for the trigram index. The
+# triggers compute the windows with tweets_bigrams(), which tweets.signals
+# registers on every SQLite connection; a contentless table is cleared with the
+# same tokens it was given, so deletes and updates recompute them from old.content.
+CREATE_INDEX = [
+    """
+    CREATE VIRTUAL TABLE tweets_tweet_bigram USING fts5(content, content='', tokenize='ascii')
+    """,
+    """
+    CREATE TRIGGER tweets_tweet_bigram_insert AFTER INSERT ON tweets_tweet BEGIN
+        INSERT INTO tweets_tweet_bigram (rowid, content) VALUES (new.id, tweets_bigrams(new.content));
+    END
+    """,
+    """
+    CREATE TRIGGER tweets_tweet_bigram_delete AFTER DELETE ON tweets_tweet BEGIN
+        INSERT INTO tweets_tweet_bigram (tweets_tweet_bigram, rowid, content)
+        VALUES ('delete', old.id, tweets_bigrams(old.content));
+    END
+    """,
+    """
+    CREATE TRIGGER tweets_tweet_bigram_update AFTER UPDATE OF content ON tweets_tweet BEGIN
+        INSERT INTO tweets_tweet_bigram (tweets_tweet_bigram, rowid, content)
+        VALUES ('delete', old.id, tweets_bigrams(old.content));
+        INSERT INTO tweets_tweet_bigram (rowid, content) VALUES (new.id, tweets_bigrams(new.content));
+    END
+    """,
+    "INSERT INTO tweets_tweet_bigram (rowid, content) SELECT id, tweets_bigrams(content) FROM tweets_tweet",
+]
+
+DROP_INDEX = [
+    "DROP TRIGGER IF EXISTS tweets_tweet_bigram_insert",
+    "DROP TRIGGER IF EXISTS tweets_tweet_bigram_delete",
+    "DROP TRIGGER IF EXISTS tweets_tweet_bigram_update",
+    "DROP TABLE IF EXISTS tweets_tweet_bigram",
+]
+
+
+def run(statements):
+    def operation(apps, schema_editor):
+        if schema_editor.connection.vendor != "sqlite":
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tweets", "0014_like_created_at"),
+    ]
+
+    operations = [
+        migrations.RunPython(run(CREATE_INDEX), run(DROP_INDEX)),
+    ]
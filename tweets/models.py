@@ -1,21 +1,277 @@
+from collections import Counter
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
 from django.conf import settings
-from django.db import models
+from django.db import connections, models, transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+
+class TweetQuerySet(models.QuerySet):
+    def with_viewer_state(self, viewer):
+        likes = Like.objects.filter(target=OuterRef("pk"), user=viewer)
+        return self.annotate(is_liked_by_viewer=Exists(likes))
+
+    def fingerprint(self, viewer):
+        # The ordered (id, like_count, liked by viewer) rows of a bounded
+        # window, so any change to the tweets shown or to their like state
+        # changes the result; sums of these could cancel out.
+        rows = self.with_viewer_state(viewer).order_by("-created_at", "-id")
+        return list(rows.values_list("id", "like_count", "is_liked_by_viewer"))
+
+
+class TweetManager(models.Manager.from_queryset(TweetQuerySet)):
+    def get_queryset(self):
+        # Deleted tweets, and the tweets of deleted accounts, stay in the table
+        # until `purge_deleted` removes them but are hidden from every read.
+        return super().get_queryset().filter(deleted_at__isnull=True, user__is_active=True)
 
 
 class Tweet(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     content = models.TextField(max_length=200)
-    created_at = models.DateTimeField(auto_now_add=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    like_count = models.PositiveIntegerField(default=0)
+    deleted_at = models.DateTimeField(null=True, blank=True)
+
+    objects = TweetManager()
+    all_objects = TweetQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["-created_at", "-id"], name="tweet_created_at_id_idx"),
+            models.Index(fields=["user", "-created_at", "-id"], name="tweet_user_created_at_id_idx"),
+        ]
 
     def __str__(self):
         return self.content
 
 
+class LikeManager(models.Manager):
+    def like(self, user, tweet_id):
+        """
+        Like the tweet if the user has not already, and return its like count
+        (None if the tweet does not exist).
+        """
+        connection = connections[self.db]
+        now = timezone.now()
+        with transaction.atomic(using=self.db), connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {self._table(connection, Like)} (target_id, user_id, created_at) "
+                f"SELECT id, %s, %s FROM {self._table(connection, Tweet)} WHERE id = %s AND deleted_at IS NULL "
+                "ON CONFLICT DO NOTHING",
+                [user.pk, connection.ops.adapt_datetimefield_value(now), tweet_id],
+            )
+            if not cursor.rowcount:
+                return self._like_count(connection, cursor, tweet_id, None)
+            LikeBucket.objects.add({tweet_id: 1}, at=now)
+            return self._like_count(connection, cursor, tweet_id, "like_count + 1")
+
+    def unlike(self, user, tweet_id):
+        connection = connections[self.db]
+        decrement = "MAX(like_count - 1, 0)" if connection.vendor == "sqlite" else "GREATEST(like_count - 1, 0)"
+        table = self._table(connection, Like)
+        where = "WHERE target_id = %s AND user_id = %s"
+        with transaction.atomic(using=self.db), connection.cursor() as cursor:
+            if connection.features.can_return_columns_from_insert:
+                cursor.execute(f"DELETE FROM {table} {where} RETURNING created_at", [tweet_id, user.pk])
+                row = cursor.fetchone()
+            else:
+                cursor.execute(f"SELECT created_at FROM {table} {where}", [tweet_id, user.pk])
+                row = cursor.fetchone()
+                cursor.execute(f"DELETE FROM {table} {where}", [tweet_id, user.pk])
+            if row is None:
+                return self._like_count(connection, cursor, tweet_id, None)
+            LikeBucket.objects.remove([(tweet_id, Like.objects.liked_at(connection, row[0]))])
+            return self._like_count(connection, cursor, tweet_id, decrement)
+
+    async def alike(self, user, tweet_id):
+        return await sync_to_async(self.like)(user, tweet_id)
+
+    async def aunlike(self, user, tweet_id):
+        return await sync_to_async(self.unlike)(user, tweet_id)
+
+    def _table(self, connection, model):
+        return connection.ops.quote_name(model._meta.db_table)
+
+    def liked_at(self, connection, value):
+        # Converts a created_at value read with a raw cursor, as the ORM would.
+        column = self.model._meta.get_field("created_at").get_col(self.model._meta.db_table)
+        for converter in connection.ops.get_db_converters(column):
+            value = converter(value, column, connection)
+        return value
+
+    def _like_count(self, connection, cursor, tweet_id, expression):
+        table = self._table(connection, Tweet)
+        if expression is not None:
+            update = f"UPDATE {table} SET like_count = {expression} WHERE id = %s"
+            if connection.features.can_return_columns_from_insert:
+                cursor.execute(f"{update} RETURNING like_count", [tweet_id])
+                return cursor.fetchone()[0]
+            cursor.execute(update, [tweet_id])
+        cursor.execute(f"SELECT like_count FROM {table} WHERE id = %s AND deleted_at IS NULL", [tweet_id])
+        row = cursor.fetchone()
+        return row[0] if row else None
+
+
 class Like(models.Model):
     target = models.ForeignKey(Tweet, related_name="likes", on_delete=models.CASCADE)
     user = models.ForeignKey(settings.AUTH_USER_MODEL, related_name="likes", on_delete=models.CASCADE)
+    # Which LikeBucket counted this like, so an unlike is taken back out of it.
+    created_at = models.DateTimeField(default=timezone.now)
+
+    objects = LikeManager()
 
     class Meta:
         constraints = [
             models.UniqueConstraint(fields=["target", "user"], name="like_unique"),
         ]
+
+
+class TimelineEntry(models.Model):
+    owner = models.ForeignKey(settings.AUTH_USER_MODEL, related_name="timeline_entries", on_delete=models.CASCADE)
+    tweet = models.ForeignKey(Tweet, related_name="timeline_entries", on_delete=models.CASCADE)
+    created_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["owner", "tweet"], name="timeline_entry_unique"),
+        ]
+        indexes = [
+            models.Index(fields=["owner", "-created_at", "-tweet"], name="timeline_owner_created_at_idx"),
+        ]
+
+
+class Hashtag(models.Model):
+    name = models.CharField(max_length=200, unique=True)
+
+    def __str__(self):
+        return self.name
+
+
+class TweetHashtag(models.Model):
+    tweet = models.ForeignKey(Tweet, related_name="hashtag_entries", on_delete=models.CASCADE)
+    hashtag = models.ForeignKey(Hashtag, related_name="tweet_entries", on_delete=models.CASCADE)
+    # Copied from the tweet so that a tag page is one index range scan.
+    created_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["hashtag", "tweet"], name="tweet_hashtag_unique"),
+        ]
+        indexes = [
+            models.Index(fields=["hashtag", "-created_at", "-tweet"], name="hashtag_created_at_idx"),
+        ]
+
+
+class Mention(models.Model):
+    tweet = models.ForeignKey(Tweet, related_name="mentions", on_delete=models.CASCADE)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, related_name="mentions", on_delete=models.CASCADE)
+    created_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "tweet"], name="mention_unique"),
+        ]
+        indexes = [
+            models.Index(fields=["user", "-created_at", "-tweet"], name="mention_user_created_at_idx"),
+        ]
+
+
+class LikeBucketManager(models.Manager):
+    def bucket_start(self, at):
+        at = at.replace(microsecond=0)
+        return at - timedelta(seconds=int(at.timestamp()) % settings.TRENDING_BUCKET_SECONDS)
+
+    def add(self, counts, at=None):
+        """
+        Add ``counts``, a mapping of tweet id to the number of likes it gained
+        at ``at`` (default: now), to the buckets covering ``at``.
+        """
+        connection = connections[self.db]
+        table = connection.ops.quote_name(self.model._meta.db_table)
+        start = connection.ops.adapt_datetimefield_value(self.bucket_start(at or timezone.now()))
+        rows = [(tweet_id, start, count) for tweet_id, count in counts.items() if count > 0]
+        if rows:
+            with connection.cursor() as cursor:
+                cursor.executemany(
+                    f"INSERT INTO {table} (tweet_id, start, likes) VALUES (%s, %s, %s) "
+                    f"ON CONFLICT (tweet_id, start) DO UPDATE SET likes = {table}.likes + excluded.likes",
+                    rows,
+                )
+
+    def remove(self, likes):
+        """
+        Take deleted ``likes``, (tweet id, Like.created_at) pairs, back out of
+        the buckets that counted them, so unliking and liking again cannot add
+        to a tweet's score. Buckets are never taken below zero.
+        """
+        connection = connections[self.db]
+        table = connection.ops.quote_name(self.model._meta.db_table)
+        counts = Counter(
+            (tweet_id, connection.ops.adapt_datetimefield_value(self.bucket_start(liked_at)))
+            for tweet_id, liked_at in likes
+        )
+        greatest = "MAX" if connection.vendor == "sqlite" else "GREATEST"
+        if counts:
+            with connection.cursor() as cursor:
+                cursor.executemany(
+                    f"UPDATE {table} SET likes = {greatest}(likes - %s, 0) WHERE tweet_id = %s AND start = %s",
+                    [(count, tweet_id, start) for (tweet_id, start), count in counts.items()],
+                )
+
+
+class LikeBucket(models.Model):
+    """Number of likes a tweet gained during one TRENDING_BUCKET_SECONDS period."""
+
+    tweet = models.ForeignKey(Tweet, related_name="like_buckets", on_delete=models.CASCADE)
+    start = models.DateTimeField()
+    likes = models.PositiveIntegerField(default=0)
+
+    objects = LikeBucketManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["tweet", "start"], name="like_bucket_unique"),
+        ]
+        indexes = [
+            models.Index(fields=["start"], name="like_bucket_start_idx"),
+        ]
+
+
+class TrendingEntry(models.Model):
+    WINDOW_CHOICES = [("hour", "1時間"), ("day", "24時間")]
+
+    window = models.CharField(max_length=8, choices=WINDOW_CHOICES)
+    rank = models.PositiveSmallIntegerField()
+    tweet = models.ForeignKey(Tweet, null=True, blank=True, on_delete=models.CASCADE)
+    hashtag = models.ForeignKey(Hashtag, null=True, blank=True, on_delete=models.CASCADE)
+    score = models.PositiveIntegerField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["window", "rank"], name="trending_window_rank_idx"),
+        ]
+
+
+class PurgeJob(models.Model):
+    """A hidden tweet or account whose rows `purge_deleted` has yet to remove."""
+
+    KIND_CHOICES = [("tweet", "ツイート"), ("user", "ユーザー")]
+
+    kind = models.CharField(max_length=8, choices=KIND_CHOICES)
+    # Not a foreign key: the target row is the last one the job deletes.
+    target_id = models.BigIntegerField()
+    stage = models.CharField(max_length=32, blank=True)
+    deleted = models.PositiveBigIntegerField(default=0)
+    created_at = models.DateTimeField(default=timezone.now)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["finished_at", "id"], name="purge_job_pending_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} {self.target_id}"
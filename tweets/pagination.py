@@ -0,0 +1,100 @@
+import base64
+import binascii
+from datetime import datetime
+
+from django.db.models import Q
+from django.http import HttpResponseBadRequest
+from django.shortcuts import render
+
+# Largest primary key the database can compare against; a cursor beyond it
+# would raise OverflowError in the driver instead of matching nothing.
+MAX_ID = 2**63 - 1
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def parse_id(value):
+    pk = int(value)
+    if not 0 < pk <= MAX_ID:
+        raise ValueError(f"id out of range: {pk}")
+    return pk
+
+
+def encode_cursor(created_at, pk):
+    raw = f"{created_at.isoformat()}|{pk}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, pk = raw.split("|")
+        return datetime.fromisoformat(created_at), parse_id(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError) as e:
+        raise InvalidCursor(cursor) from e
+
+
+class KeysetPage:
+    def __init__(self, object_list, next_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+
+def after_cursor(queryset, cursor, keys=("created_at", "id")):
+    # `a <= x AND (a < x OR b < y)` is the row-value comparison `(a, b) < (x, y)`
+    # written so that the leading conjunct is an index range on `a`.
+    time_key, id_key = keys
+    created_at, pk = decode_cursor(cursor)
+    return queryset.filter(
+        Q(**{f"{time_key}__lte": created_at}),
+        Q(**{f"{time_key}__lt": created_at}) | Q(**{f"{id_key}__lt": pk}),
+    )
+
+
+def keyset_window(queryset, cursor=None, limit=21, keys=("created_at", "id")):
+    time_key, id_key = keys
+    queryset = queryset.order_by(f"-{time_key}", f"-{id_key}")
+    if cursor:
+        queryset = after_cursor(queryset, cursor, keys)
+    return queryset[:limit]
+
+
+def paginate_keyset(queryset, cursor=None, page_size=20, keys=("created_at", "id")):
+    time_key, id_key = keys
+    rows = list(keyset_window(queryset, cursor, page_size + 1, keys))
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        last = rows[-1]
+        next_cursor = encode_cursor(getattr(last, time_key), getattr(last, id_key))
+    return KeysetPage(rows, next_cursor)
+
+
+class KeysetPaginationMixin:
+    page_size = 20
+    cursor_kwarg = "cursor"
+    page = None
+
+    def get_cursor(self):
+        return self.request.GET.get(self.cursor_kwarg) or None
+
+    def paginate_keyset(self, queryset, keys=("created_at", "id")):
+        self.page = paginate_keyset(queryset, self.get_cursor(), self.page_size, keys)
+        return self.page.object_list
+
+    def get(self, request, *args, **kwargs):
+        try:
+            return super().get(request, *args, **kwargs)
+        except InvalidCursor:
+            return HttpResponseBadRequest(render(request, "error/400.html"))
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["page"] = self.page
+        return context
@@ -0,0 +1,116 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from accounts.models import FollowSuggestion, FriendShip
+
+from .models import Like, LikeBucket, Mention, PurgeJob, TimelineEntry, Tweet, TweetHashtag
+
+User = get_user_model()
+
+
+def schedule_tweet(tweet):
+    """Hide ``tweet`` now and queue its rows for `purge_deleted`."""
+    with transaction.atomic():
+        Tweet.all_objects.filter(pk=tweet.pk).update(deleted_at=timezone.now())
+        return PurgeJob.objects.create(kind="tweet", target_id=tweet.pk)
+
+
+def schedule_user(user):
+    """Deactivate ``user``, which hides their profile and tweets, and queue their rows."""
+    with transaction.atomic():
+        User.objects.filter(pk=user.pk).update(is_active=False)
+        return PurgeJob.objects.create(kind="user", target_id=user.pk)
+
+
+def _batches(queryset, batch_size):
+    # Re-reads the first ids of what is left, so a stopped job resumes by
+    # running again.
+    while True:
+        ids = list(queryset.order_by("pk").values_list("pk", flat=True)[:batch_size])
+        if not ids:
+            return
+        yield ids
+
+
+def _delete(model, ids, adjust=None):
+    rows = model._base_manager.filter(pk__in=ids)
+    if adjust is not None:
+        adjust(rows)
+    return rows.delete()[0]
+
+
+def _unlike(likes):
+    # Each like is also taken out of the trending bucket that counted it.
+    rows = list(likes.values_list("target_id", "created_at"))
+    Tweet.all_objects.filter(pk__in=[tweet_id for tweet_id, _ in rows]).update(
+        like_count=Greatest(F("like_count") - 1, 0)
+    )
+    LikeBucket.objects.remove(rows)
+
+
+def _unfollow(field, counter):
+    # Decrements ``counter`` on the other side of each follow edge in a batch.
+    def adjust(friendships):
+        User.objects.filter(pk__in=friendships.values(field)).update(**{counter: Greatest(F(counter) - 1, 0)})
+
+    return adjust
+
+
+def _tweet_stages(tweet_ids):
+    yield "likes", Like.objects.filter(target_id__in=tweet_ids), None
+    yield "timeline", TimelineEntry.objects.filter(tweet_id__in=tweet_ids), None
+    yield "hashtags", TweetHashtag.objects.filter(tweet_id__in=tweet_ids), None
+    yield "mentions", Mention.objects.filter(tweet_id__in=tweet_ids), None
+
+
+def _stages(job, batch_size):
+    """
+    Yield (stage name, queryset, adjust) in the order the job deletes them.
+    ``adjust`` is called with each batch before it is deleted, to fix the
+    counters that point at it.
+    """
+    if job.kind == "tweet":
+        yield from _tweet_stages([job.target_id])
+        yield "tweet", Tweet.all_objects.filter(pk=job.target_id), None
+        return
+
+    user_id = job.target_id
+    yield "likes", Like.objects.filter(user_id=user_id), _unlike
+    # The account's own tweets go one batch at a time, each after the rows
+    # that reference it.
+    tweets = Tweet.all_objects.filter(user_id=user_id)
+    for tweet_ids in _batches(tweets, batch_size):
+        yield from _tweet_stages(tweet_ids)
+        yield "tweets", Tweet.all_objects.filter(pk__in=tweet_ids), None
+    yield "timeline", TimelineEntry.objects.filter(owner_id=user_id), None
+    yield "mentions", Mention.objects.filter(user_id=user_id), None
+    yield "following", FriendShip.objects.filter(follower_id=user_id), _unfollow("following_id", "followers_count")
+    yield "followers", FriendShip.objects.filter(following_id=user_id), _unfollow("follower_id", "following_count")
+    yield "suggestions", FollowSuggestion.objects.filter(user_id=user_id), None
+    yield "suggestions", FollowSuggestion.objects.filter(suggested_id=user_id), None
+    yield "user", User.objects.filter(pk=user_id), None
+
+
+def run(job, batch_size=1000):
+    """
+    Delete the rows of ``job`` in batches of at most ``batch_size``, each in a
+    short transaction that also records the progress, so the write lock is
+    never held for long. Yields the job after each batch.
+    """
+    for stage, queryset, adjust in _stages(job, batch_size):
+        for ids in _batches(queryset, batch_size):
+            with transaction.atomic():
+                deleted = _delete(queryset.model, ids, adjust)
+                PurgeJob.objects.filter(pk=job.pk).update(stage=stage, deleted=F("deleted") + deleted)
+            job.refresh_from_db()
+            yield job
+    job.finished_at = timezone.now()
+    job.save(update_fields=["finished_at"])
+    yield job
+
+
+def pending():
+    return PurgeJob.objects.filter(finished_at__isnull=True).order_by("id")
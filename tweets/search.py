@@ -0,0 +1,146 @@
+import base64
+import binascii
+
+from django.db import connection, transaction
+
+from .models import Tweet
+from .pagination import InvalidCursor, KeysetPage, paginate_keyset, parse_id
+
+INDEX_TABLE = "tweets_tweet_fts"
+BIGRAM_TABLE = "tweets_tweet_bigram"
+BIGRAM_FUNCTION = "tweets_bigrams"
+
+# The trigram tokenizer cannot match terms shorter than three characters;
+# those are looked up in the bigram index instead.
+MIN_TERM_LENGTH = 3
+
+
+def encode_cursor(score, pk):
+    raw = f"{score!r}|{pk}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        score, pk = raw.split("|")
+        return float(score), parse_id(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError) as e:
+        raise InvalidCursor(cursor) from e
+
+
+def is_available():
+    return connection.vendor == "sqlite"
+
+
+def bigrams(text):
+    """
+    Return every two-character window of ``text``, lowercased, as hex tokens
+    separated by spaces. Hex keeps punctuation inside a token, and a trailing
+    space gives the last character a window of its own, so a one-character
+    term is a prefix of some token.
+    """
+    text = text.lower() + " "
+    return " ".join(text[i : i + 2].encode().hex() for i in range(len(text) - 1))
+
+
+def parse_query(query):
+    """Split ``query`` into terms the index can match and terms it cannot."""
+    terms = list(dict.fromkeys(query.split()))
+    return [term for term in terms if len(term) >= MIN_TERM_LENGTH], [
+        term for term in terms if len(term) < MIN_TERM_LENGTH
+    ]
+
+
+def match_expression(terms):
+    # Each term is a quoted phrase, so FTS5 operators typed by the user are
+    # searched for literally.
+    return " AND ".join('"{}"'.format(term.replace('"', '""')) for term in terms)
+
+
+def bigram_expression(terms):
+    # A two-character term is one bigram token; a one-character term is the
+    # prefix of the tokens that start with it.
+    tokens = []
+    for term in terms:
+        term = term.lower()
+        if len(term) == 1:
+            tokens.append(f'"{term.encode().hex()}" *')
+        else:
+            tokens.extend(f'"{term[i : i + 2].encode().hex()}"' for i in range(len(term) - 1))
+    return " AND ".join(tokens)
+
+
+def search_tweets(query, queryset, cursor=None, page_size=20):
+    """
+    Return a KeysetPage of tweets from ``queryset`` containing every term of
+    ``query``, best bm25 match first. Terms of three or more characters are
+    ranked by the trigram index and shorter ones by the bigram index. Without
+    SQLite the terms fall back to a substring scan, newest first.
+    """
+    indexed, short = parse_query(query)
+    if not indexed and not short:
+        return KeysetPage([], None)
+    if not is_available():
+        for term in indexed + short:
+            queryset = queryset.filter(content__icontains=term)
+        return paginate_keyset(queryset, cursor, page_size)
+
+    if indexed:
+        table, params = INDEX_TABLE, [match_expression(indexed)]
+    else:
+        table, params = BIGRAM_TABLE, [bigram_expression(short)]
+    sql = f"SELECT rowid AS id, bm25({table}) AS score FROM {table} WHERE {table} MATCH %s"
+    if indexed and short:
+        sql += f" AND rowid IN (SELECT rowid FROM {BIGRAM_TABLE} WHERE {BIGRAM_TABLE} MATCH %s)"
+        params.append(bigram_expression(short))
+    sql = f"SELECT id, score FROM ({sql}) AS matches"
+    if cursor:
+        sql += " WHERE (score, id) > (%s, %s)"
+        params.extend(decode_cursor(cursor))
+    sql += " ORDER BY score, id LIMIT %s"
+    params.append(page_size + 1)
+    with connection.cursor() as c:
+        c.execute(sql, params)
+        rows = c.fetchall()
+
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        pk, score = rows[-1]
+        next_cursor = encode_cursor(score, pk)
+    tweets = queryset.in_bulk([pk for pk, _ in rows])
+    return KeysetPage([tweets[pk] for pk, _ in rows if pk in tweets], next_cursor)
+
+
+def rebuild_index(batch_size=10000):
+    """
+    Empty both indexes and re-add every tweet, one transaction per batch of
+    ``batch_size`` tweets in id order. Yields the number of tweets indexed so far.
+    """
+    with transaction.atomic(), connection.cursor() as c:
+        c.execute(f"INSERT INTO {INDEX_TABLE} ({INDEX_TABLE}) VALUES ('delete-all')")
+        c.execute(f"INSERT INTO {BIGRAM_TABLE} ({BIGRAM_TABLE}) VALUES ('delete-all')")
+    indexed = 0
+    last_id = 0
+    while True:
+        ids = list(Tweet.objects.filter(id__gt=last_id).order_by("id").values_list("id", flat=True)[:batch_size])
+        if not ids:
+            break
+        with transaction.atomic(), connection.cursor() as c:
+            c.execute(
+                f"INSERT INTO {INDEX_TABLE} (rowid, content) "
+                "SELECT id, content FROM tweets_tweet WHERE id > %s AND id <= %s",
+                [last_id, ids[-1]],
+            )
+            c.execute(
+                f"INSERT INTO {BIGRAM_TABLE} (rowid, content) "
+                f"SELECT id, {BIGRAM_FUNCTION}(content) FROM tweets_tweet WHERE id > %s AND id <= %s",
+                [last_id, ids[-1]],
+            )
+        last_id = ids[-1]
+        indexed += len(ids)
+        yield indexed
+    with connection.cursor() as c:
+        c.execute(f"INSERT INTO {INDEX_TABLE} ({INDEX_TABLE}) VALUES ('optimize')")
+        c.execute(f"INSERT INTO {BIGRAM_TABLE} ({BIGRAM_TABLE}) VALUES ('optimize')")
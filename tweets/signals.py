@@ -0,0 +1,12 @@
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+from . import search
+
+
+@receiver(connection_created)
+def register_search_functions(sender, connection, **kwargs):
+    # The bigram index triggers call this function, so every SQLite connection
+    # that writes tweets needs it.
+    if connection.vendor == "sqlite":
+        connection.connection.create_function(search.BIGRAM_FUNCTION, 1, search.bigrams, deterministic=True)
@@ -0,0 +1,127 @@
+from urllib.parse import quote
+
+from django import template
+from django.core.cache import caches
+from django.core.cache.utils import make_template_fragment_key
+from django.template.base import render_value_in_context
+from django.template.defaultfilters import linebreaksbr
+from django.urls import reverse
+from django.utils.html import conditional_escape
+from django.utils.http import RFC3986_SUBDELIMS
+from django.utils.safestring import mark_safe
+
+register = template.Library()
+
+# Must stay in sync with the {% cache %} tag in tweets/tweet_card.html, which
+# shares the cache entries with this renderer.
+CARD_CACHE = "tweet_cards"
+CARD_CACHE_TIMEOUT = 86400
+
+URL_MARKER = "7310932841"
+
+
+class UrlPattern:
+    """Reverses a URL once and fills in the single argument by concatenation."""
+
+    def __init__(self, viewname, kwarg, autoescape):
+        url = reverse(viewname, kwargs={kwarg: URL_MARKER})
+        self.prefix, self.suffix = url.split(URL_MARKER)
+        self.autoescape = autoescape
+
+    def __call__(self, value):
+        url = self.prefix + quote(str(value), safe=RFC3986_SUBDELIMS + "/~:%@") + self.suffix
+        return conditional_escape(url) if self.autoescape else url
+
+
+def render_fragment(context, tweet, profile_url, detail_url):
+    return (
+        "\n"
+        '    <ul class="topbar">\n'
+        "        <li>\n"
+        f'            <a href="{profile_url(tweet.user)}">\n'
+        f"                {render_value_in_context(tweet.user, context)}\n"
+        "            </a>\n"
+        "        </li>\n"
+        "        <li>\n"
+        f"            <p>{render_value_in_context(tweet.created_at, context)}</p>\n"
+        "        </li>\n"
+        "    </ul>\n"
+        f'    <p class="contents">{linebreaksbr(tweet.content, autoescape=context.autoescape)}</p>\n'
+        '    <ul class="buttombar">\n'
+        "        <li>\n"
+        f'            <a href="{detail_url(tweet.pk)}">\n'
+        '                <i class="bi bi-eye-fill"></i>\n'
+        "            </a>\n"
+        "        </li>\n"
+        "        "
+    )
+
+
+@register.simple_tag(takes_context=True)
+def tweet_cards(context, tweets):
+    """
+    Render ``tweets`` exactly like looping over tweets/tweet_card.html, in one
+    pass: URLs are reversed once per call and the cached fragments are fetched
+    with a single cache lookup.
+    """
+    tweets = list(tweets)
+    autoescape = context.autoescape
+    profile_url = UrlPattern("accounts:user_profile", "username", autoescape)
+    detail_url = UrlPattern("tweets:detail", "pk", autoescape)
+    delete_url = UrlPattern("tweets:delete", "pk", autoescape)
+    like_url = UrlPattern("tweets:like", "pk", autoescape)
+    unlike_url = UrlPattern("tweets:unlike", "pk", autoescape)
+    viewer_id = context["request"].user.pk
+
+    cache = caches[CARD_CACHE]
+    keys = {tweet.pk: make_template_fragment_key("tweet_card", [tweet.pk, tweet.created_at]) for tweet in tweets}
+    fragments = cache.get_many(keys.values())
+    missing = {}
+    for tweet in tweets:
+        if keys[tweet.pk] not in fragments:
+            missing[keys[tweet.pk]] = render_fragment(context, tweet, profile_url, detail_url)
+    if missing:
+        cache.set_many(missing, CARD_CACHE_TIMEOUT)
+        fragments.update(missing)
+
+    cards = []
+    for tweet in tweets:
+        pk = tweet.pk
+        if tweet.user_id == viewer_id:
+            delete = (
+                "\n"
+                "        <li>\n"
+                f'            <a href="{delete_url(pk)}">\n'
+                '                <i class="bi bi-trash-fill"></i>\n'
+                "            </a>\n"
+                "        </li>\n"
+                "        "
+            )
+        else:
+            delete = ""
+        if getattr(tweet, "is_liked_by_viewer", False):
+            url, liked, icon = unlike_url(pk), "true", "bi-heart-fill"
+        else:
+            url, liked, icon = like_url(pk), "false", "bi-heart"
+        cards.append(
+            "\n"
+            "\n"
+            '<div class="tweetbox">\n'
+            f"    {fragments[keys[pk]]}\n"
+            f"        {delete}\n"
+            "        <div>\n"
+            "    \n"
+            f'    <button id="tweet-{pk}" class="like_btn" data-url="{url}" data-pk={pk}\n'
+            f'        data-is-liked="{liked}">\n'
+            f'        <i class="bi {icon}"></i>\n'
+            "    </button>\n"
+            "    \n"
+            "\n"
+            f'    <span id="count_{pk}">{render_value_in_context(tweet.like_count, context)}</span>\n'
+            "</div>\n"
+            "\n"
+            "    </ul>\n"
+            "</div>\n"
+            "\n"
+        )
+    return mark_safe("".join(cards))
@@ -1,9 +1,43 @@
+import asyncio
+import tempfile
+from datetime import datetime, timedelta
+from datetime import timezone as dt_timezone
+from io import StringIO
+from pathlib import Path
+from unittest import mock
+
+from asgiref.sync import sync_to_async
 from django.conf import settings
 from django.contrib.auth import SESSION_KEY, get_user_model
-from django.test import TestCase
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import caches
+from django.core.cache.utils import make_template_fragment_key
+from django.core.management import call_command
+from django.db import connection
+from django.template import engines
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
+
+from accounts.models import FriendShip
+from monitoring.querybudget import query_budget
 
-from .models import Like, Tweet
+from . import entities, likebuffer, purge, search, timeline, trending
+from .events import hub, stream_events
+from .models import (
+    Hashtag,
+    Like,
+    LikeBucket,
+    Mention,
+    PurgeJob,
+    TimelineEntry,
+    TrendingEntry,
+    Tweet,
+    TweetHashtag,
+)
+from .pagination import encode_cursor
+from .views import HashtagView, HomeView, MentionsView, SearchView, TrendingView, TweetDetailView
 
 User = get_user_model()
 
@@ -23,6 +57,209 @@ class TestHomeView(TestCase):
         tweets = response.context["tweet_list"]
         self.assertQuerysetEqual(tweets, Tweet.objects.all())
 
+    def test_success_get_with_cursor(self):
+        Tweet.objects.bulk_create([Tweet(user=self.user, content=f"tweet{i}") for i in range(25)])
+        response = self.client.get(self.url)
+        page = response.context["page"]
+        self.assertEqual(len(response.context["tweet_list"]), 20)
+        self.assertTrue(page.has_next)
+
+        response = self.client.get(self.url, {"cursor": page.next_cursor})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context["tweet_list"]), 6)
+        self.assertFalse(response.context["page"].has_next)
+
+    def test_success_get_keeps_position_when_new_tweets_arrive(self):
+        Tweet.objects.bulk_create([Tweet(user=self.user, content=f"tweet{i}") for i in range(25)])
+        first_page = self.client.get(self.url).context
+        Tweet.objects.create(user=self.user, content="new tweet")
+        second_page = self.client.get(self.url, {"cursor": first_page["page"].next_cursor}).context
+
+        seen = {tweet.id for tweet in first_page["tweet_list"]}
+        rest = {tweet.id for tweet in second_page["tweet_list"]}
+        self.assertFalse(seen & rest)
+        self.assertEqual(len(seen | rest), 26)
+
+    def test_success_get_not_modified(self):
+        self.client.get(self.url)
+        etag = self.client.get(self.url)["ETag"]
+        # session, user, fingerprint
+        with self.assertNumQueries(3):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+
+    def test_success_get_modified(self):
+        other = User.objects.create_user(username="testuser2", password="testpassword")
+        self.client.get(self.url)
+        etags = {self.client.get(self.url)["ETag"]}
+        tweet = Tweet.objects.create(user=self.user, content="new tweet")
+        etags.add(self.client.get(self.url)["ETag"])
+        Like.objects.like(other, tweet.pk)
+        etags.add(self.client.get(self.url)["ETag"])
+        Like.objects.like(self.user, tweet.pk)
+        Like.objects.unlike(other, tweet.pk)
+        etags.add(self.client.get(self.url)["ETag"])
+        etags.add(self.client.get(self.url, {"cursor": encode_cursor(tweet.created_at, tweet.pk)})["ETag"])
+        self.assertEqual(len(etags), 5)
+
+    def test_success_get_modified_when_like_moves_between_tweets(self):
+        tweet_a = Tweet.objects.create(user=self.user, content="a")
+        tweet_b = Tweet.objects.create(user=self.user, content="b")
+        Like.objects.like(self.user, tweet_b.pk)
+        self.client.get(self.url)
+        etag = self.client.get(self.url)["ETag"]
+        Like.objects.like(self.user, tweet_a.pk)
+        Like.objects.unlike(self.user, tweet_b.pk)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_success_get_stitches_viewer_state_into_cached_card(self):
+        other = User.objects.create_user(username="testuser2", password="testpassword")
+        FriendShip.objects.create(follower=other, following=self.user)
+        tweet = Tweet.objects.get(user=self.user)
+        TimelineEntry.objects.create(owner=other, tweet=tweet, created_at=tweet.created_at)
+        delete_url = reverse("tweets:delete", kwargs={"pk": tweet.pk})
+        self.assertContains(self.client.get(self.url), delete_url)
+
+        Like.objects.like(other, tweet.pk)
+        self.client.force_login(other)
+        response = self.client.get(self.url)
+        self.assertNotContains(response, delete_url)
+        self.assertContains(response, 'data-is-liked="true"')
+        self.assertContains(response, f'<span id="count_{tweet.pk}">1</span>')
+
+    def test_query_budget(self):
+        authors = [User.objects.create_user(username=f"author{i}", password="testpassword") for i in range(3)]
+        for author in authors:
+            self.client.force_login(author)
+            self.client.post(reverse("accounts:follow", kwargs={"username": self.user.username}))
+            self.client.force_login(self.user)
+            self.client.post(reverse("accounts:follow", kwargs={"username": author.username}))
+        for i in range(30):
+            tweet = Tweet.objects.create(user=authors[i % 3], content=f"tweet{i}")
+            Like.objects.create(user=self.user, target=tweet)
+        timeline.backfill_authors([author.id for author in authors])
+
+        with query_budget(HomeView.query_budget):
+            response = self.client.get(self.url)
+        self.assertEqual(len(response.context["tweet_list"]), 20)
+
+    def test_failure_get_with_invalid_cursor(self):
+        response = self.client.get(self.url, {"cursor": "invalid"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_failure_get_with_out_of_range_cursor(self):
+        response = self.client.get(self.url, {"cursor": encode_cursor(timezone.now(), 2**64)})
+        self.assertEqual(response.status_code, 400)
+
+    def test_success_get_shows_only_followed_users(self):
+        followee = User.objects.create_user(username="followee", password="testpassword")
+        stranger = User.objects.create_user(username="stranger", password="testpassword")
+        FriendShip.objects.create(following=followee, follower=self.user)
+        for author in (followee, stranger):
+            self.client.force_login(author)
+            self.client.post(reverse("tweets:create"), {"content": f"by {author.username}"})
+        self.client.force_login(self.user)
+
+        response = self.client.get(self.url)
+        contents = [tweet.content for tweet in response.context["tweet_list"]]
+        self.assertEqual(contents, ["by followee", "test tweet"])
+
+    @override_settings(TIMELINE_FANOUT_MAX_FOLLOWERS=0)
+    def test_success_get_merges_fanout_on_read_authors(self):
+        celebrity = User.objects.create_user(username="celebrity", password="testpassword", followers_count=1)
+        FriendShip.objects.create(following=celebrity, follower=self.user)
+        self.client.force_login(celebrity)
+        self.client.post(reverse("tweets:create"), {"content": "by celebrity"})
+        self.client.force_login(self.user)
+
+        self.assertFalse(TimelineEntry.objects.exists())
+        response = self.client.get(self.url)
+        contents = [tweet.content for tweet in response.context["tweet_list"]]
+        self.assertEqual(contents, ["by celebrity", "test tweet"])
+
+
+class TestTweetQuerySet(TestCase):
+    def setUp(self):
+        self.user1 = User.objects.create_user(username="testuser", password="testpassword")
+        self.user2 = User.objects.create_user(username="testuser2", password="testpassword2")
+        self.tweet1 = Tweet.objects.create(user=self.user1, content="tweet1")
+        self.tweet2 = Tweet.objects.create(user=self.user1, content="tweet2")
+        Like.objects.create(user=self.user2, target=self.tweet1)
+
+    def test_with_viewer_state(self):
+        tweets = Tweet.objects.with_viewer_state(self.user2).in_bulk()
+        self.assertTrue(tweets[self.tweet1.pk].is_liked_by_viewer)
+        self.assertFalse(tweets[self.tweet2.pk].is_liked_by_viewer)
+        self.assertFalse(Tweet.objects.with_viewer_state(self.user1).filter(is_liked_by_viewer=True).exists())
+
+
+class TestTweetCardsTag(TestCase):
+    def setUp(self):
+        self.user1 = User.objects.create_user(username="testuser", password="testpassword")
+        self.user2 = User.objects.create_user(username="ユーザー.2", password="testpassword2")
+        Tweet.objects.create(user=self.user1, content="tweet1", like_count=1234)
+        tweet = Tweet.objects.create(user=self.user2, content='<b>tweet2</b> & "quotes"\nsecond line')
+        Like.objects.create(user=self.user1, target=tweet)
+        self.request = RequestFactory().get("/")
+        self.request.user = self.user1
+        self.reference = engines["django"].from_string(
+            "{% for tweet in tweet_list %}\n{% include 'tweets/tweet_card.html' %}\n{% endfor %}"
+        )
+        self.tag = engines["django"].from_string("{% load tweet_cards %}{% tweet_cards tweet_list %}")
+
+    def render(self, template):
+        tweets = Tweet.objects.select_related("user").with_viewer_state(self.user1).order_by("id")
+        return template.render({"tweet_list": tweets}, self.request)
+
+    def test_success_render_matches_include(self):
+        caches["tweet_cards"].clear()
+        expected = self.render(self.reference)
+        caches["tweet_cards"].clear()
+        self.assertEqual(self.render(self.tag), expected)
+        self.assertEqual(self.render(self.tag), expected)
+        self.assertEqual(self.render(self.reference), expected)
+        self.assertIn('data-is-liked="true"', expected)
+        self.assertEqual(expected.count("bi-trash-fill"), 1)
+
+    def test_success_render_anonymous(self):
+        self.request.user = AnonymousUser()
+        self.assertEqual(self.render(self.tag), self.render(self.reference))
+
+
+class TestHomeTimelineView(TestCase):
+    def setUp(self):
+        self.url = reverse("tweets:timeline")
+        self.user = User.objects.create_user(username="testuser", password="testpassword")
+        self.client.force_login(self.user)
+        self.tweet = Tweet.objects.create(user=self.user, content="test tweet", like_count=1)
+        Like.objects.create(user=self.user, target=self.tweet)
+
+    def test_success_get(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertIsNone(data["next_cursor"])
+        self.assertEqual(data["tweets"][0]["id"], self.tweet.id)
+        self.assertEqual(data["tweets"][0]["liked_count"], 1)
+        self.assertTrue(data["tweets"][0]["is_liked"])
+
+    async def test_success_get_asgi(self):
+        await sync_to_async(self.async_client.force_login)(self.user)
+        response = await self.async_client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["tweets"][0]["id"], self.tweet.id)
+
+    def test_failure_get_with_anonymous_user(self):
+        self.client.logout()
+        response = self.client.get(self.url)
+        self.assertRedirects(response, f"{reverse(settings.LOGIN_URL)}?next={self.url}")
+
+    def test_failure_get_with_invalid_cursor(self):
+        response = self.client.get(self.url, {"cursor": "invalid"})
+        self.assertEqual(response.status_code, 400)
+
 
 class TestTweetCreateView(TestCase):
     def setUp(self):
@@ -49,6 +286,24 @@ class TestTweetCreateView(TestCase):
         )
         self.assertIn(SESSION_KEY, self.client.session)
 
+    def test_success_post_fans_out_to_followers(self):
+        follower = User.objects.create_user(username="follower", password="testpassword")
+        FriendShip.objects.create(following=self.user, follower=follower)
+        self.client.post(self.url, {"content": "test content"})
+        self.assertTrue(TimelineEntry.objects.filter(owner=follower, tweet__content="test content").exists())
+
+    def test_success_post_indexes_hashtags_and_mentions(self):
+        mentioned = User.objects.create_user(username="mentioned", password="testpassword")
+        self.client.post(self.url, {"content": "#Django と ＃猫 の話 @mentioned. @nobody"})
+        tweet = Tweet.objects.get()
+        self.assertEqual(
+            sorted(TweetHashtag.objects.filter(tweet=tweet).values_list("hashtag__name", flat=True)), ["django", "猫"]
+        )
+        self.assertEqual(
+            list(Mention.objects.values_list("tweet", "user", "created_at")),
+            [(tweet.pk, mentioned.pk, tweet.created_at)],
+        )
+
     def test_failure_post_with_empty_content(self):
         empty_content_data = {"user": self.user, "content": ""}
         response = self.client.post(self.url, empty_content_data)
@@ -81,6 +336,28 @@ class TestTweetDetailView(TestCase):
         response = self.client.get(self.url)
         self.assertEqual(response.status_code, 200)
         self.assertTemplateUsed(response, "tweets/detail.html")
+        self.assertContains(response, 'data-is-liked="false"')
+
+    def test_success_get_not_modified(self):
+        self.client.get(self.url)
+        etag = self.client.get(self.url)["ETag"]
+        with self.assertNumQueries(3):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        Like.objects.like(self.user, self.tweet.pk)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'data-is-liked="true"')
+
+    @query_budget(TweetDetailView.query_budget)
+    def test_query_budget(self):
+        self.client.get(self.url)
+
+    def test_success_get_with_liked_tweet(self):
+        Like.objects.create(user=self.user, target=self.tweet)
+        response = self.client.get(self.url)
+        self.assertTrue(response.context["tweet"].is_liked_by_viewer)
+        self.assertContains(response, 'data-is-liked="true"')
 
 
 class TestTweetDeleteView(TestCase):
@@ -94,9 +371,28 @@ class TestTweetDeleteView(TestCase):
         self.url2 = reverse("tweets:delete", kwargs={"pk": self.tweet2.pk})
 
     def test_success_post(self):
+        TimelineEntry.objects.create(owner=self.user2, tweet=self.tweet1, created_at=self.tweet1.created_at)
         response = self.client.post(self.url1)
         self.assertRedirects(response, reverse("tweets:home"), status_code=302, target_status_code=200)
         self.assertEqual(Tweet.objects.count(), 1)
+        self.assertTrue(PurgeJob.objects.filter(kind="tweet", target_id=self.tweet1.pk).exists())
+        call_command("purge_deleted", stdout=StringIO())
+        self.assertEqual(Tweet.all_objects.count(), 1)
+        self.assertFalse(TimelineEntry.objects.exists())
+
+    def test_success_post_hides_tweet(self):
+        Like.objects.create(target=self.tweet1, user=self.user2)
+        self.client.post(self.url1)
+        self.assertEqual(self.client.get(reverse("tweets:detail", kwargs={"pk": self.tweet1.pk})).status_code, 404)
+        self.assertIsNone(Like.objects.like(self.user1, self.tweet1.pk))
+        self.assertEqual(Like.objects.count(), 1)
+
+    def test_success_post_invalidates_tweet_card(self):
+        self.client.get(reverse("tweets:home"))
+        card_key = make_template_fragment_key("tweet_card", [self.tweet1.pk, self.tweet1.created_at])
+        self.assertIsNotNone(caches["tweet_cards"].get(card_key))
+        self.client.post(self.url1)
+        self.assertIsNone(caches["tweet_cards"].get(card_key))
 
     def test_failure_post_with_not_exist_tweet(self):
         response = self.client.get(reverse("tweets:delete", kwargs={"pk": 100}))
@@ -120,6 +416,16 @@ class TestLikeView(TestCase):
         response = self.client.post(self.url)
         self.assertEqual(response.status_code, 200)
         self.assertTrue(Like.objects.filter(target=self.post, user=self.user).exists())
+        self.assertEqual(response.json()["liked_count"], 1)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.like_count, 1)
+
+    async def test_success_post_asgi(self):
+        await sync_to_async(self.async_client.force_login)(self.user)
+        response = await self.async_client.post(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["liked_count"], 1)
+        self.assertTrue(await Like.objects.filter(target=self.post, user=self.user).aexists())
 
     def test_failure_post_with_not_exist_tweet(self):
         url = reverse("tweets:like", kwargs={"pk": "10"})
@@ -129,16 +435,24 @@ class TestLikeView(TestCase):
 
     def test_failure_post_with_liked_tweet(self):
         Like.objects.create(target=self.post, user=self.user)
+        Tweet.objects.filter(pk=self.post.pk).update(like_count=1)
         response = self.client.post(self.url)
         self.assertEqual(response.status_code, 200)
         self.assertEqual(Like.objects.count(), 1)
+        self.assertEqual(response.json()["liked_count"], 1)
+
+    def test_success_post_queries(self):
+        # session, user, savepoint, insert, like bucket, update ... returning, release
+        with self.assertNumQueries(7):
+            response = self.client.post(self.url)
+        self.assertEqual(response.json()["liked_count"], 1)
 
 
 class TestUnLikeView(TestCase):
     def setUp(self):
         self.user = User.objects.create_user(username="testuser", password="testpassword")
         self.client.force_login(self.user)
-        self.tweet1 = Tweet.objects.create(user=self.user, content="testtweet")
+        self.tweet1 = Tweet.objects.create(user=self.user, content="testtweet", like_count=1)
         Like.objects.create(user=self.user, target=self.tweet1)
         self.url = reverse("tweets:like", kwargs={"pk": self.tweet1.pk})
 
@@ -146,6 +460,7 @@ class TestUnLikeView(TestCase):
         response = self.client.post(reverse("tweets:unlike", kwargs={"pk": self.tweet1.pk}))
         self.assertEqual(response.status_code, 200)
         self.assertFalse(Like.objects.filter(user=self.user, target=self.tweet1).exists())
+        self.assertEqual(response.json()["liked_count"], 0)
 
     def test_failure_post_with_not_exist_tweet(self):
         response = self.client.post(reverse("tweets:unlike", kwargs={"pk": 100}))
@@ -157,3 +472,596 @@ class TestUnLikeView(TestCase):
         response = self.client.post(reverse("tweets:unlike", kwargs={"pk": self.tweet1.pk}))
         self.assertEqual(response.status_code, 200)
         self.assertFalse(Like.objects.filter(user=self.user, target=self.tweet1).count(), 0)
+
+    def test_success_post_does_not_go_below_zero(self):
+        Tweet.objects.filter(pk=self.tweet1.pk).update(like_count=0)
+        response = self.client.post(reverse("tweets:unlike", kwargs={"pk": self.tweet1.pk}))
+        self.assertEqual(response.json()["liked_count"], 0)
+
+
+class TestLikeBatchView(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpassword")
+        self.client.force_login(self.user)
+        self.tweet1 = Tweet.objects.create(user=self.user, content="tweet1", like_count=1)
+        self.tweet2 = Tweet.objects.create(user=self.user, content="tweet2")
+        Like.objects.create(user=self.user, target=self.tweet1)
+        self.url = reverse("tweets:likes")
+
+    def post(self, actions):
+        return self.client.post(self.url, {"actions": actions}, content_type="application/json")
+
+    def test_success_get(self):
+        # session, user, like states
+        with self.assertNumQueries(3):
+            response = self.client.get(self.url, {"ids": f"{self.tweet1.pk},{self.tweet2.pk},100"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.json()["likes"],
+            {
+                str(self.tweet1.pk): {"liked_count": 1, "is_liked": True},
+                str(self.tweet2.pk): {"liked_count": 0, "is_liked": False},
+            },
+        )
+
+    def test_success_post(self):
+        response = self.post(
+            [
+                {"id": self.tweet1.pk, "liked": False},
+                {"id": self.tweet2.pk, "liked": True},
+                {"id": self.tweet2.pk, "liked": False},
+                {"id": self.tweet2.pk, "liked": True},
+            ]
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.json()["likes"],
+            {
+                str(self.tweet1.pk): {"liked_count": 0, "is_liked": False},
+                str(self.tweet2.pk): {"liked_count": 1, "is_liked": True},
+            },
+        )
+        self.assertEqual(list(Like.objects.values_list("target", flat=True)), [self.tweet2.pk])
+
+    def test_success_post_with_not_exist_tweet(self):
+        response = self.post([{"id": 100, "liked": True}])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["likes"], {})
+        self.assertEqual(Like.objects.count(), 1)
+
+    def test_failure_get_with_invalid_ids(self):
+        response = self.client.get(self.url, {"ids": "1,a"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_failure_get_with_too_many_ids(self):
+        response = self.client.get(self.url, {"ids": ",".join(map(str, range(1, 102)))})
+        self.assertEqual(response.status_code, 400)
+
+    def test_failure_get_with_out_of_range_id(self):
+        response = self.client.get(self.url, {"ids": "99999999999999999999999"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_failure_post_with_invalid_body(self):
+        response = self.client.post(self.url, "actions", content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+        response = self.post([{"id": self.tweet2.pk}])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Like.objects.count(), 1)
+
+    def test_failure_post_with_out_of_range_id(self):
+        response = self.post([{"id": 10**25, "liked": True}])
+        self.assertEqual(response.status_code, 400)
+
+    def test_failure_post_with_non_boolean_liked(self):
+        response = self.post([{"id": self.tweet2.pk, "liked": "false"}])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Like.objects.count(), 1)
+
+
+class TestLikeWriteBehind(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpassword")
+        self.user2 = User.objects.create_user(username="testuser2", password="testpassword")
+        self.client.force_login(self.user)
+        self.tweet = Tweet.objects.create(user=self.user, content="testtweet", like_count=1)
+        Like.objects.create(user=self.user2, target=self.tweet)
+        self.like_url = reverse("tweets:like", kwargs={"pk": self.tweet.pk})
+        self.unlike_url = reverse("tweets:unlike", kwargs={"pk": self.tweet.pk})
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.addCleanup(likebuffer.close)
+        settings_override = override_settings(LIKE_WRITE_BEHIND=True, LIKE_BUFFER_PATH=Path(directory.name, "b"))
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def flush(self):
+        call_command("flush_like_buffer", stdout=StringIO())
+        self.tweet.refresh_from_db()
+
+    def test_success_flush_adds_like_buckets(self):
+        self.client.post(self.like_url)
+        self.flush()
+        self.assertEqual(list(LikeBucket.objects.values_list("tweet", "likes")), [(self.tweet.pk, 1)])
+
+    def test_success_post_returns_optimistic_count(self):
+        response = self.client.post(self.like_url)
+        self.assertEqual(response.json()["liked_count"], 2)
+        self.assertFalse(Like.objects.filter(user=self.user).exists())
+        self.flush()
+        self.assertTrue(Like.objects.filter(user=self.user, target=self.tweet).exists())
+        self.assertEqual(self.tweet.like_count, 2)
+
+    def test_success_toggles_are_coalesced(self):
+        for url in [self.like_url, self.unlike_url, self.like_url, self.unlike_url]:
+            response = self.client.post(url)
+        self.assertEqual(response.json()["liked_count"], 1)
+        # savepoint, tweets, users, delete returning no row, release
+        with self.assertNumQueries(5):
+            likebuffer.flush()
+        self.assertEqual(Like.objects.count(), 1)
+
+    def test_success_unlike(self):
+        self.client.force_login(self.user2)
+        response = self.client.post(self.unlike_url)
+        self.assertEqual(response.json()["liked_count"], 0)
+        self.flush()
+        self.assertFalse(Like.objects.exists())
+        self.assertEqual(self.tweet.like_count, 0)
+
+    def test_success_flush_is_idempotent(self):
+        self.client.post(self.like_url)
+        Like.objects.create(user=self.user, target=self.tweet)
+        self.flush()
+        self.assertEqual(Like.objects.count(), 2)
+        self.assertEqual(self.tweet.like_count, 1)
+
+    def test_success_flush_uses_fixed_number_of_queries(self):
+        tweets = Tweet.objects.bulk_create([Tweet(user=self.user2, content=f"tweet{i}") for i in range(20)])
+        for tweet in tweets:
+            likebuffer.record(self.user, tweet.pk, liked=True)
+            likebuffer.record(self.user2, tweet.pk, liked=True)
+        likebuffer.record(self.user2, self.tweet.pk, liked=False)
+        # savepoint, tweets, users, insert, delete, one like_count update per
+        # distinct delta (+2, -1), bucket upsert, bucket decrement, release
+        with self.assertNumQueries(10):
+            self.assertEqual(likebuffer.flush(), 41)
+        self.assertEqual(Like.objects.count(), 40)
+        self.assertEqual(set(Tweet.objects.filter(pk__in=[t.pk for t in tweets]).values_list("like_count")), {(2,)})
+
+    def test_success_flush_skips_deleted_tweet(self):
+        self.client.post(self.like_url)
+        self.tweet.delete()
+        self.assertEqual(likebuffer.flush(), 1)
+        self.assertEqual(likebuffer.flush(), 0)
+
+    def test_failure_post_with_not_exist_tweet(self):
+        response = self.client.post(reverse("tweets:like", kwargs={"pk": 100}))
+        self.assertEqual(response.status_code, 404)
+
+    def test_success_batch_includes_pending_actions(self):
+        self.client.post(self.like_url)
+        response = self.client.get(reverse("tweets:likes"), {"ids": self.tweet.pk})
+        self.assertEqual(response.json()["likes"], {str(self.tweet.pk): {"liked_count": 2, "is_liked": True}})
+
+
+@override_settings(EVENTS_COALESCE_SECONDS=0, EVENTS_KEEPALIVE_SECONDS=60)
+class TestEventStream(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpassword")
+        self.user2 = User.objects.create_user(username="testuser2", password="testpassword")
+        FriendShip.objects.create(follower=self.user, following=self.user2)
+        self.tweet = Tweet.objects.create(user=self.user, content="testtweet")
+        self.client.force_login(self.user)
+
+    def scope(self, query_string):
+        cookie = f"{settings.SESSION_COOKIE_NAME}={self.client.cookies[settings.SESSION_COOKIE_NAME].value}"
+        return {
+            "type": "http",
+            "method": "GET",
+            "path": reverse("tweets:events"),
+            "query_string": query_string.encode(),
+            "headers": [(b"cookie", cookie.encode())],
+        }
+
+    async def open_stream(self, scope):
+        self.receive = asyncio.Queue()
+        self.sent = asyncio.Queue()
+        self.stream = asyncio.ensure_future(stream_events(scope, self.receive.get, self.sent.put))
+        start = await self.sent.get()
+        if start["status"] == 200:
+            await self.sent.get()
+        return start
+
+    async def next_body(self):
+        message = await asyncio.wait_for(self.sent.get(), 1)
+        return message["body"].decode()
+
+    async def close_stream(self):
+        await self.receive.put({"type": "http.disconnect"})
+        await asyncio.wait_for(self.stream, 1)
+
+    async def test_success_like_counts_are_coalesced(self):
+        start = await self.open_stream(self.scope(f"tweets={self.tweet.pk},100"))
+        self.assertIn((b"content-type", b"text/event-stream"), start["headers"])
+        hub.publish_like_count(self.tweet.pk, 1)
+        hub.publish_like_count(self.tweet.pk, 2)
+        hub.publish_like_count(200, 1)
+        self.assertEqual(await self.next_body(), f'event: likes\ndata: {{"{self.tweet.pk}": 2}}\n\n')
+        await self.close_stream()
+        self.assertEqual(hub.by_tweet, {})
+
+    async def test_success_new_tweets(self):
+        await self.open_stream(self.scope(""))
+        hub.publish_tweet(Tweet(user=self.user2))
+        hub.publish_tweet(Tweet(user=self.user))
+        self.assertEqual(await self.next_body(), 'event: timeline\ndata: {"new_tweets": 1}\n\n')
+        await self.close_stream()
+
+    async def test_failure_with_anonymous_user(self):
+        scope = self.scope("")
+        scope["headers"] = []
+        start = await self.open_stream(scope)
+        self.assertEqual(start["status"], 403)
+
+    def test_success_get_under_wsgi(self):
+        response = self.client.get(reverse("tweets:events"))
+        self.assertEqual(response.status_code, 204)
+
+
+class TestSearchView(TestCase):
+    def setUp(self):
+        self.url = reverse("tweets:search")
+        self.user = User.objects.create_user(username="testuser", password="testpassword")
+        self.client.force_login(self.user)
+        self.ramen = Tweet.objects.create(user=self.user, content="今日のランチはラーメン")
+        self.twice = Tweet.objects.create(user=self.user, content="ラーメン、ラーメン、また明日もラーメン")
+        self.cat = Tweet.objects.create(user=self.user, content="猫と昼寝")
+
+    def search(self, query, **params):
+        return self.client.get(self.url, {"q": query, **params})
+
+    def test_success_get(self):
+        response = self.search("ラーメン")
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, "tweets/search.html")
+        self.assertEqual(response.context["tweet_list"], [self.twice, self.ramen])
+
+    def test_success_get_paginates_by_rank(self):
+        Tweet.objects.bulk_create([Tweet(user=self.user, content=f"ラーメン{i}") for i in range(25)])
+        first_page = self.search("ラーメン")
+        second_page = self.search("ラーメン", cursor=first_page.context["page"].next_cursor)
+        seen = [tweet.id for tweet in first_page.context["tweet_list"]]
+        rest = [tweet.id for tweet in second_page.context["tweet_list"]]
+        self.assertEqual(len(seen), 20)
+        self.assertFalse(set(seen) & set(rest))
+        self.assertEqual(len(seen + rest), 27)
+        self.assertIsNone(second_page.context["page"].next_cursor)
+
+    def test_success_get_with_short_terms(self):
+        self.assertEqual(self.search("猫").context["tweet_list"], [self.cat])
+        self.assertEqual(self.search("ラーメン 明日").context["tweet_list"], [self.twice])
+
+    def test_success_get_with_short_terms_uses_bigram_index(self):
+        Tweet.objects.create(user=self.user, content="Go, Django!")
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.search("昼寝").context["tweet_list"], [self.cat])
+            self.assertEqual(self.search("寝").context["tweet_list"], [self.cat])
+            self.assertEqual(self.search("明日 ン").context["tweet_list"], [self.twice])
+            self.assertEqual(len(self.search("o,").context["tweet_list"]), 1)
+            self.assertEqual(len(self.search("GO").context["tweet_list"]), 1)
+        self.assertFalse([query for query in queries if "LIKE" in query["sql"]])
+
+        self.assertEqual(self.search('"ラーメン" OR 猫と昼').context["tweet_list"], [])
+
+    def test_success_index_follows_writes(self):
+        self.ramen.delete()
+        self.cat.content = "犬と散歩"
+        self.cat.save()
+        self.assertEqual(self.search("ラーメン").context["tweet_list"], [self.twice])
+        self.assertEqual(self.search("猫と昼").context["tweet_list"], [])
+        self.assertEqual(self.search("犬と散").context["tweet_list"], [self.cat])
+        self.assertEqual(self.search("猫").context["tweet_list"], [])
+        self.assertEqual(self.search("散歩").context["tweet_list"], [self.cat])
+
+    def test_success_get_without_query(self):
+        with self.assertNumQueries(2):
+            response = self.search(" ")
+        self.assertEqual(response.context["tweet_list"], [])
+
+    def test_query_budget(self):
+        with query_budget(SearchView.query_budget):
+            self.search("ラーメン")
+
+    def test_failure_get_with_invalid_cursor(self):
+        response = self.search("ラーメン", cursor="invalid")
+        self.assertEqual(response.status_code, 400)
+
+    def test_failure_get_with_out_of_range_cursor(self):
+        response = self.search("ラーメン", cursor=search.encode_cursor(-1.0, 2**64))
+        self.assertEqual(response.status_code, 400)
+
+
+class TestRebuildSearchIndexCommand(TestCase):
+    def test_rebuild(self):
+        user = User.objects.create_user(username="testuser", password="testpassword")
+        Tweet.objects.bulk_create([Tweet(user=user, content=f"ラーメン{i}") for i in range(5)])
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {search.INDEX_TABLE} ({search.INDEX_TABLE}) VALUES ('delete-all')")
+            cursor.execute(f"INSERT INTO {search.BIGRAM_TABLE} ({search.BIGRAM_TABLE}) VALUES ('delete-all')")
+        self.assertEqual(search.search_tweets("ラーメン", Tweet.objects.all()).object_list, [])
+        self.assertEqual(search.search_tweets("メン", Tweet.objects.all()).object_list, [])
+        out = StringIO()
+        call_command("rebuild_search_index", batch_size=2, stdout=out)
+        self.assertIn("with 5 tweets", out.getvalue())
+        self.assertEqual(len(search.search_tweets("ラーメン", Tweet.objects.all()).object_list), 5)
+        self.assertEqual(len(search.search_tweets("メン", Tweet.objects.all()).object_list), 5)
+
+
+class TestEntities(TestCase):
+    def test_extract_hashtags(self):
+        self.assertEqual(entities.extract_hashtags("#Django #django ＃ＤＪＡＮＧＯ a#b #猫_2 #"), ["django", "猫_2"])
+
+    def test_extract_mentions(self):
+        self.assertEqual(entities.extract_mentions("@alice, a@b.com @bob. @"), ["alice", "bob.", "bob"])
+
+
+class TestHashtagView(TestCase):
+    def setUp(self):
+        self.url = reverse("tweets:hashtag", kwargs={"name": "Django"})
+        self.user = User.objects.create_user(username="testuser", password="testpassword")
+        self.client.force_login(self.user)
+        self.client.post(reverse("tweets:create"), {"content": "#猫"})
+        for i in range(25):
+            self.client.post(reverse("tweets:create"), {"content": f"tweet{i} #django"})
+
+    def test_success_get(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, "tweets/hashtag.html")
+        self.assertEqual(response.context["hashtag"], "django")
+        first_page = response.context["tweet_list"]
+        self.assertEqual(
+            first_page, list(Tweet.objects.filter(content__contains="#django").order_by("-created_at", "-id")[:20])
+        )
+        second_page = self.client.get(self.url, {"cursor": response.context["page"].next_cursor}).context["tweet_list"]
+        self.assertEqual(len(second_page), 5)
+        self.assertFalse(set(first_page) & set(second_page))
+
+    def test_success_get_unknown_hashtag(self):
+        response = self.client.get(reverse("tweets:hashtag", kwargs={"name": "unknown"}))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["tweet_list"], [])
+
+    def test_query_budget(self):
+        with query_budget(HashtagView.query_budget):
+            self.client.get(self.url)
+
+    def test_failure_get_with_invalid_cursor(self):
+        response = self.client.get(self.url, {"cursor": "invalid"})
+        self.assertEqual(response.status_code, 400)
+
+
+class TestMentionsView(TestCase):
+    def setUp(self):
+        self.url = reverse("tweets:mentions")
+        self.user1 = User.objects.create_user(username="testuser", password="testpassword")
+        self.user2 = User.objects.create_user(username="testuser2", password="testpassword2")
+        self.client.force_login(self.user2)
+        self.client.post(reverse("tweets:create"), {"content": "hello @testuser"})
+        self.client.post(reverse("tweets:create"), {"content": "hello @testuser2"})
+        self.client.force_login(self.user1)
+
+    def test_success_get(self):
+        with query_budget(MentionsView.query_budget):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, "tweets/mentions.html")
+        self.assertEqual(response.context["tweet_list"], list(Tweet.objects.filter(content="hello @testuser")))
+
+    def test_success_get_after_delete(self):
+        tweet = Tweet.objects.get(content="hello @testuser")
+        self.client.force_login(self.user2)
+        self.client.post(reverse("tweets:delete", kwargs={"pk": tweet.pk}))
+        self.client.force_login(self.user1)
+        self.assertEqual(self.client.get(self.url).context["tweet_list"], [])
+
+
+class TestBackfillEntitiesCommand(TestCase):
+    def test_backfill(self):
+        user = User.objects.create_user(username="testuser", password="testpassword")
+        Tweet.objects.bulk_create([Tweet(user=user, content=f"#tag{i % 2} @testuser") for i in range(5)])
+        call_command("backfill_entities", chunk_size=2, stdout=StringIO())
+        call_command("backfill_entities", chunk_size=2, stdout=StringIO())
+        self.assertEqual(Hashtag.objects.count(), 2)
+        self.assertEqual(TweetHashtag.objects.count(), 5)
+        self.assertEqual(Mention.objects.filter(user=user).count(), 5)
+
+
+class TestTrending(TestCase):
+    def setUp(self):
+        self.users = [User.objects.create_user(username=f"testuser{i}", password="testpassword") for i in range(3)]
+        self.tweet1 = Tweet.objects.create(user=self.users[0], content="tweet1 #django")
+        self.tweet2 = Tweet.objects.create(user=self.users[0], content="tweet2 #django #猫")
+        entities.index_tweet(self.tweet1)
+        entities.index_tweet(self.tweet2)
+
+    def test_like_buckets(self):
+        for user in self.users:
+            Like.objects.like(user, self.tweet1.pk)
+        Like.objects.like(self.users[0], self.tweet1.pk)
+        Like.objects.unlike(self.users[1], self.tweet1.pk)
+        Like.objects.unlike(self.users[1], self.tweet2.pk)
+        self.assertEqual(list(LikeBucket.objects.values_list("tweet", "likes")), [(self.tweet1.pk, 2)])
+
+    def test_unlike_takes_like_out_of_its_own_bucket(self):
+        start = timezone.now()
+        for step, action in enumerate([Like.objects.like, Like.objects.unlike, Like.objects.like]):
+            at = start + timedelta(seconds=settings.TRENDING_BUCKET_SECONDS * step)
+            with mock.patch("django.utils.timezone.now", return_value=at):
+                action(self.users[1], self.tweet1.pk)
+        self.assertEqual(sum(LikeBucket.objects.values_list("likes", flat=True)), 1)
+
+    @override_settings(TRENDING_BUCKET_SECONDS=600)
+    def test_bucket_start(self):
+        at = datetime(2026, 1, 1, 12, 34, 56, 789, tzinfo=dt_timezone.utc)
+        self.assertEqual(LikeBucket.objects.bucket_start(at), datetime(2026, 1, 1, 12, 30, tzinfo=dt_timezone.utc))
+
+    def test_refresh(self):
+        now = timezone.now()
+        LikeBucket.objects.add({self.tweet1.pk: 1, self.tweet2.pk: 2}, at=now)
+        LikeBucket.objects.add({self.tweet1.pk: 5}, at=now - timedelta(hours=3))
+        LikeBucket.objects.add({self.tweet2.pk: 7}, at=now - timedelta(days=2))
+        trending.refresh(now)
+
+        def ranking(window, **kinds):
+            entries = TrendingEntry.objects.filter(window=window, **kinds).order_by("rank")
+            return list(entries.values_list("tweet", "hashtag__name", "score"))
+
+        self.assertEqual(ranking("hour", hashtag=None), [(self.tweet2.pk, None, 2), (self.tweet1.pk, None, 1)])
+        self.assertEqual(ranking("day", hashtag=None), [(self.tweet1.pk, None, 6), (self.tweet2.pk, None, 2)])
+        self.assertEqual(ranking("day", tweet=None), [(None, "django", 8), (None, "猫", 2)])
+        self.assertEqual(LikeBucket.objects.count(), 3)
+
+
+class TestTrendingView(TestCase):
+    def setUp(self):
+        self.url = reverse("tweets:trending")
+        self.user = User.objects.create_user(username="testuser", password="testpassword")
+        self.client.force_login(self.user)
+        self.client.post(reverse("tweets:create"), {"content": "tweet1 #django"})
+        self.client.post(reverse("tweets:create"), {"content": "tweet2"})
+        self.tweet1, self.tweet2 = Tweet.objects.order_by("id")
+        Like.objects.like(self.user, self.tweet2.pk)
+        call_command("refresh_trending", stdout=StringIO())
+
+    def test_success_get(self):
+        with query_budget(TrendingView.query_budget):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, "tweets/trending.html")
+        self.assertEqual(response.context["tweet_list"], [self.tweet2])
+        self.assertEqual(response.context["hashtag_entries"], [])
+        self.assertContains(response, 'data-is-liked="true"')
+
+    def test_success_get_day(self):
+        Like.objects.like(self.user, self.tweet1.pk)
+        call_command("refresh_trending", stdout=StringIO())
+        response = self.client.get(self.url, {"window": "day"})
+        self.assertEqual(response.context["tweet_list"], [self.tweet2, self.tweet1])
+        self.assertEqual([entry.hashtag.name for entry in response.context["hashtag_entries"]], ["django"])
+
+    def test_failure_get_with_invalid_window(self):
+        response = self.client.get(self.url, {"window": "week"})
+        self.assertEqual(response.status_code, 400)
+
+
+class TestReconcileLikeCountsCommand(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpassword")
+        self.tweet1 = Tweet.objects.create(user=self.user, content="tweet1", like_count=5)
+        self.tweet2 = Tweet.objects.create(user=self.user, content="tweet2")
+        Like.objects.create(user=self.user, target=self.tweet2)
+
+    def test_reconcile(self):
+        call_command("reconcile_like_counts", chunk_size=1, stdout=StringIO())
+        self.tweet1.refresh_from_db()
+        self.tweet2.refresh_from_db()
+        self.assertEqual(self.tweet1.like_count, 0)
+        self.assertEqual(self.tweet2.like_count, 1)
+
+
+class TestSeedScaleCommand(TestCase):
+    def seed(self, **options):
+        options = {"users": 20, "tweets": 100, "likes": 300, "follows": 60, **options}
+        call_command("seed_scale", stdout=StringIO(), **options)
+        return list(Tweet.objects.order_by("id").values_list("user__username", "content", "created_at", "like_count"))
+
+    def test_seed(self):
+        tweets = self.seed()
+        self.assertEqual(User.objects.count(), 20)
+        self.assertEqual(len(tweets), 100)
+        self.assertEqual(sum(like_count for *_, like_count in tweets), Like.objects.count())
+        follows = FriendShip.objects.count()
+        self.assertEqual(sum(User.objects.values_list("followers_count", flat=True)), follows)
+        self.assertTrue(TimelineEntry.objects.exists())
+
+    def test_seed_is_deterministic(self):
+        tweets = self.seed()
+        Tweet.objects.all().delete()
+        User.objects.all().delete()
+        self.assertEqual(self.seed(), tweets)
+
+
+class TestPurgeDeletedCommand(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpassword")
+        self.other = User.objects.create_user(username="testuser2", password="testpassword2")
+        self.tweets = Tweet.objects.bulk_create(
+            [Tweet(user=self.user, content=f"#tag{i} @testuser2") for i in range(5)]
+        )
+        entities.index_tweets((tweet.pk, tweet.content, tweet.created_at) for tweet in self.tweets)
+        self.other_tweet = Tweet.objects.create(user=self.other, content="tweet")
+        for tweet in self.tweets:
+            Like.objects.like(self.other, tweet.pk)
+        Like.objects.like(self.user, self.other_tweet.pk)
+        for follower, following in ((self.user, self.other), (self.other, self.user)):
+            FriendShip.objects.create(follower=follower, following=following)
+        User.objects.update(followers_count=1, following_count=1)
+        TimelineEntry.objects.create(owner=self.other, tweet=self.tweets[0], created_at=self.tweets[0].created_at)
+
+    def test_schedule_user_hides_account(self):
+        purge.schedule_user(self.user)
+        self.assertFalse(Tweet.objects.filter(user=self.user).exists())
+        self.assertEqual(Tweet.all_objects.filter(user=self.user).count(), 5)
+        response = self.client.get(reverse("accounts:user_profile", kwargs={"username": "testuser"}))
+        self.assertEqual(response.status_code, 302)
+        self.client.force_login(self.other)
+        response = self.client.get(reverse("accounts:user_profile", kwargs={"username": "testuser"}))
+        self.assertEqual(response.status_code, 404)
+
+    def test_admin_deletes_only_through_purge(self):
+        self.client.force_login(User.objects.create_superuser(username="admin", password="adminpassword"))
+        for name, pk in (("tweets_tweet", self.tweets[0].pk), ("accounts_user", self.user.pk)):
+            response = self.client.get(reverse(f"admin:{name}_delete", args=[pk]))
+            self.assertEqual(response.status_code, 403)
+            response = self.client.get(reverse(f"admin:{name}_changelist"))
+            self.assertNotContains(response, 'value="delete_selected"')
+            response = self.client.post(
+                reverse(f"admin:{name}_changelist"), {"action": "schedule_purge", "_selected_action": [pk]}
+            )
+            self.assertEqual(response.status_code, 302)
+        jobs = set(PurgeJob.objects.values_list("kind", "target_id"))
+        self.assertEqual(jobs, {("tweet", self.tweets[0].pk), ("user", self.user.pk)})
+
+    def test_purge_user(self):
+        job = purge.schedule_user(self.user)
+        out = StringIO()
+        call_command("purge_deleted", batch_size=2, stdout=out)
+        self.assertIn("No deletions pending", out.getvalue())
+        self.assertFalse(User.objects.filter(pk=self.user.pk).exists())
+        self.assertEqual(list(Tweet.all_objects.all()), [self.other_tweet])
+        self.assertFalse(Like.objects.exists())
+        self.assertFalse(FriendShip.objects.exists())
+        self.assertFalse(TweetHashtag.objects.exists())
+        self.assertFalse(Mention.objects.exists())
+        self.assertFalse(TimelineEntry.objects.exists())
+        self.other.refresh_from_db()
+        self.assertEqual((self.other.followers_count, self.other.following_count), (0, 0))
+        self.other_tweet.refresh_from_db()
+        self.assertEqual(self.other_tweet.like_count, 0)
+        self.assertEqual(list(LikeBucket.objects.filter(tweet=self.other_tweet).values_list("likes", flat=True)), [0])
+        job.refresh_from_db()
+        self.assertIsNotNone(job.finished_at)
+        self.assertEqual(job.stage, "user")
+
+    def test_purge_resumes_after_failure(self):
+        job = purge.schedule_user(self.user)
+        runs = purge.run(job, batch_size=2)
+        next(runs)
+        job = next(runs)
+        self.assertEqual((job.stage, job.deleted), ("likes", 3))
+        self.assertEqual(Like.objects.filter(target__user=self.user).count(), 3)
+        call_command("purge_deleted", batch_size=2, stdout=StringIO())
+        self.assertFalse(User.objects.filter(pk=self.user.pk).exists())
+        self.assertFalse(Like.objects.exists())
+        self.assertIsNotNone(PurgeJob.objects.get().finished_at)
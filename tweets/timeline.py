@@ -0,0 +1,116 @@
+import heapq
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.db.models import Q
+
+from accounts.models import FriendShip
+
+from .models import TimelineEntry, Tweet
+from .pagination import KeysetPage, encode_cursor, keyset_window
+
+User = get_user_model()
+
+
+def is_fanout_on_read(user):
+    return user.followers_count > settings.TIMELINE_FANOUT_MAX_FOLLOWERS
+
+
+def fanout_on_read_followees(user):
+    threshold = settings.TIMELINE_FANOUT_MAX_FOLLOWERS
+    followees = FriendShip.objects.filter(follower=user, following__followers_count__gt=threshold)
+    return followees.values_list("following_id", flat=True)
+
+
+def fan_out(tweet):
+    if is_fanout_on_read(tweet.user):
+        return
+    follower_ids = FriendShip.objects.filter(following=tweet.user).values_list("follower_id", flat=True)
+    TimelineEntry.objects.bulk_create(
+        [TimelineEntry(owner_id=owner_id, tweet=tweet, created_at=tweet.created_at) for owner_id in follower_ids],
+        batch_size=500,
+        ignore_conflicts=True,
+    )
+
+
+def backfill(owner, following):
+    if is_fanout_on_read(following):
+        return
+    recent = Tweet.objects.filter(user=following).order_by("-created_at", "-id")[: settings.TIMELINE_BACKFILL_SIZE]
+    TimelineEntry.objects.bulk_create(
+        [
+            TimelineEntry(owner=owner, tweet_id=pk, created_at=created_at)
+            for pk, created_at in recent.values_list("id", "created_at")
+        ],
+        ignore_conflicts=True,
+    )
+
+
+def backfill_authors(author_ids, batch_size=1000):
+    # Materialize inboxes for follow edges that were written in bulk, as if
+    # each of them had gone through `backfill`. Rows are copied with one
+    # INSERT ... SELECT per author instead of round-tripping through Python.
+    sql = (
+        f"INSERT INTO {TimelineEntry._meta.db_table} (owner_id, tweet_id, created_at) "
+        f"SELECT f.follower_id, t.id, t.created_at FROM {FriendShip._meta.db_table} f "
+        f"CROSS JOIN (SELECT id, created_at FROM {Tweet._meta.db_table} WHERE user_id = %s "
+        "ORDER BY created_at DESC, id DESC LIMIT %s) t "
+        "WHERE f.following_id = %s ON CONFLICT DO NOTHING"
+    )
+    threshold = settings.TIMELINE_FANOUT_MAX_FOLLOWERS
+    author_ids = list(author_ids)
+    for start in range(0, len(author_ids), batch_size):
+        authors = User.objects.filter(id__in=author_ids[start : start + batch_size], followers_count__lte=threshold)
+        with transaction.atomic(), connection.cursor() as cursor:
+            for author_id in authors.values_list("id", flat=True):
+                cursor.execute(sql, [author_id, settings.TIMELINE_BACKFILL_SIZE, author_id])
+
+
+def prune(owner, following):
+    TimelineEntry.objects.filter(owner=owner, tweet__user=following).delete()
+
+
+def _keys(queryset, cursor, limit, keys):
+    return list(keyset_window(queryset, cursor, limit, keys).values_list(*keys))
+
+
+def home_timeline(user, queryset, cursor=None, page_size=20):
+    # The materialized inbox holds tweets fanned out on write. The viewer's own
+    # tweets and tweets of fan-out-on-read authors are read from `Tweet` and
+    # merged in, each source being a bounded keyset scan.
+    limit = page_size + 1
+    sources = [
+        _keys(TimelineEntry.objects.filter(owner=user), cursor, limit, ("created_at", "tweet_id")),
+        _keys(Tweet.objects.filter(user=user), cursor, limit, ("created_at", "id")),
+    ]
+    followee_ids = list(fanout_on_read_followees(user))
+    if followee_ids:
+        sources.append(_keys(Tweet.objects.filter(user__in=followee_ids), cursor, limit, ("created_at", "id")))
+
+    keys = []
+    for key in heapq.merge(*sources, reverse=True):
+        if not keys or keys[-1] != key:
+            keys.append(key)
+        if len(keys) == limit:
+            break
+
+    next_cursor = None
+    if len(keys) > page_size:
+        keys = keys[:page_size]
+        next_cursor = encode_cursor(*keys[-1])
+    tweets = queryset.in_bulk([pk for _, pk in keys])
+    return KeysetPage([tweets[pk] for _, pk in keys if pk in tweets], next_cursor)
+
+
+def home_timeline_scope(user, cursor=None, page_size=20):
+    # The tweets `home_timeline` picks its page from: the same bounded source
+    # windows, combined into one queryset that can be aggregated in a single
+    # query instead of being merged in Python.
+    limit = page_size + 1
+    inbox = keyset_window(TimelineEntry.objects.filter(owner=user), cursor, limit, ("created_at", "tweet_id"))
+    own = keyset_window(Tweet.objects.filter(user=user), cursor, limit)
+    followees = keyset_window(Tweet.objects.filter(user__in=fanout_on_read_followees(user)), cursor, limit)
+    return Tweet.objects.filter(
+        Q(id__in=inbox.values("tweet_id")) | Q(id__in=own.values("id")) | Q(id__in=followees.values("id"))
+    )
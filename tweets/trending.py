@@ -0,0 +1,52 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from .models import LikeBucket, TrendingEntry
+
+WINDOWS = {"hour": timedelta(hours=1), "day": timedelta(days=1)}
+
+
+def refresh(now=None, size=None):
+    """
+    Rank tweets and hashtags by the likes they gained in each window, reading
+    only the buckets inside the window, and replace the stored top ``size``
+    (default: TRENDING_SIZE). Buckets older than the longest window are dropped.
+    """
+    now = now or timezone.now()
+    size = size or settings.TRENDING_SIZE
+    entries = []
+    for window, length in WINDOWS.items():
+        buckets = LikeBucket.objects.filter(start__gte=LikeBucket.objects.bucket_start(now - length))
+        tweets = buckets.values("tweet").annotate(score=Sum("likes")).filter(score__gt=0)
+        for rank, row in enumerate(tweets.order_by("-score", "-tweet")[:size]):
+            entries.append(TrendingEntry(window=window, rank=rank, tweet_id=row["tweet"], score=row["score"]))
+        tags = (
+            buckets.filter(tweet__hashtag_entries__isnull=False)
+            .values("tweet__hashtag_entries__hashtag")
+            .annotate(score=Sum("likes"))
+            .filter(score__gt=0)
+        )
+        for rank, row in enumerate(tags.order_by("-score", "tweet__hashtag_entries__hashtag")[:size]):
+            entries.append(
+                TrendingEntry(
+                    window=window, rank=rank, hashtag_id=row["tweet__hashtag_entries__hashtag"], score=row["score"]
+                )
+            )
+
+    with transaction.atomic():
+        TrendingEntry.objects.all().delete()
+        TrendingEntry.objects.bulk_create(entries)
+        LikeBucket.objects.filter(start__lt=LikeBucket.objects.bucket_start(now - max(WINDOWS.values()))).delete()
+    return entries
+
+
+def trending(window, queryset):
+    """Return the stored ranking of ``window`` as (tweets, hashtag entries)."""
+    entries = list(TrendingEntry.objects.filter(window=window).select_related("hashtag").order_by("rank"))
+    tweet_ids = [entry.tweet_id for entry in entries if entry.tweet_id]
+    tweets = queryset.in_bulk(tweet_ids)
+    return [tweets[pk] for pk in tweet_ids if pk in tweets], [entry for entry in entries if entry.hashtag_id]
@@ -6,9 +6,16 @@ app_name = "tweets"
 
 urlpatterns = [
     path("home/", views.HomeView.as_view(), name="home"),
+    path("home/timeline/", views.HomeTimelineView.as_view(), name="timeline"),
+    path("search/", views.SearchView.as_view(), name="search"),
+    path("tags/<str:name>/", views.HashtagView.as_view(), name="hashtag"),
+    path("mentions/", views.MentionsView.as_view(), name="mentions"),
+    path("trending/", views.TrendingView.as_view(), name="trending"),
     path("create/", views.TweetCreateView.as_view(), name="create"),
     path("<int:pk>/", views.TweetDetailView.as_view(), name="detail"),
     path("<int:pk>/delete/", views.TweetDeleteView.as_view(), name="delete"),
     path("<int:pk>/like/", views.LikeView.as_view(), name="like"),
     path("<int:pk>/unlike/", views.UnlikeView.as_view(), name="unlike"),
+    path("likes/", views.LikeBatchView.as_view(), name="likes"),
+    path("events/", views.EventsUnavailableView.as_view(), name="events"),
 ]
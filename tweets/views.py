@@ -1,25 +1,146 @@
+import json
+from functools import partial
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib import messages
 from django.contrib.auth import get_user_model
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
-from django.http import JsonResponse
-from django.shortcuts import get_object_or_404
+from django.core.cache import caches
+from django.core.cache.utils import make_template_fragment_key
+from django.db import transaction
+from django.http import Http404, HttpResponse, HttpResponseBadRequest, HttpResponseRedirect, JsonResponse
+from django.shortcuts import render
 from django.urls import reverse_lazy
 from django.views.generic import CreateView, DeleteView, DetailView, ListView, View
 
+from accounts.mixins import AsyncLoginRequiredMixin
+
+from . import entities, likebuffer, purge, search, timeline, trending
+from .conditional import ConditionalGetMixin
+from .events import hub
 from .forms import TweetForm
-from .models import Like, Tweet
+from .models import Like, TrendingEntry, Tweet
+from .pagination import InvalidCursor, KeysetPaginationMixin, parse_id
 
 User = get_user_model()
 
 
-class HomeView(LoginRequiredMixin, ListView):
+class HomeView(LoginRequiredMixin, KeysetPaginationMixin, ConditionalGetMixin, ListView):
     template_name = "tweets/home.html"
     model = Tweet
-    queryset = model.objects.select_related("user").prefetch_related("likes").order_by("-created_at")
+    context_object_name = "tweet_list"
+    query_budget = 8
+
+    def get_queryset(self):
+        queryset = self.model.objects.select_related("user").with_viewer_state(self.request.user)
+        self.page = timeline.home_timeline(self.request.user, queryset, self.get_cursor(), self.page_size)
+        return self.page.object_list
+
+    def get_validators(self):
+        scope = timeline.home_timeline_scope(self.request.user, self.get_cursor(), self.page_size)
+        return scope.fingerprint(self.request.user)
+
+
+class HomeTimelineView(AsyncLoginRequiredMixin, View):
+    page_size = HomeView.page_size
+    query_budget = HomeView.query_budget
+
+    async def get(self, request, *args, **kwargs):
+        queryset = Tweet.objects.select_related("user").with_viewer_state(request.user)
+        cursor = request.GET.get("cursor") or None
+        try:
+            # The merge issues several dependent queries; running them in one
+            # worker thread costs a single hop off the event loop.
+            page = await sync_to_async(timeline.home_timeline)(request.user, queryset, cursor, self.page_size)
+        except InvalidCursor:
+            return JsonResponse({"error": "Invalid cursor."}, status=400)
+        tweets = [
+            {
+                "id": tweet.id,
+                "user": tweet.user.username,
+                "content": tweet.content,
+                "created_at": tweet.created_at.isoformat(),
+                "liked_count": tweet.like_count,
+                "is_liked": tweet.is_liked_by_viewer,
+            }
+            for tweet in page.object_list
+        ]
+        return JsonResponse({"tweets": tweets, "next_cursor": page.next_cursor})
+
+
+class SearchView(LoginRequiredMixin, KeysetPaginationMixin, ListView):
+    template_name = "tweets/search.html"
+    model = Tweet
+    context_object_name = "tweet_list"
+    query_budget = 4
+
+    def get_search_query(self):
+        return self.request.GET.get("q", "").strip()
+
+    def get_queryset(self):
+        queryset = self.model.objects.select_related("user").with_viewer_state(self.request.user)
+        self.page = search.search_tweets(self.get_search_query(), queryset, self.get_cursor(), self.page_size)
+        return self.page.object_list
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["query"] = self.get_search_query()
+        return context
+
+
+class HashtagView(LoginRequiredMixin, KeysetPaginationMixin, ListView):
+    template_name = "tweets/hashtag.html"
+    model = Tweet
+    context_object_name = "tweet_list"
+    query_budget = 4
+
+    def get_queryset(self):
+        queryset = self.model.objects.select_related("user").with_viewer_state(self.request.user)
+        self.page = entities.hashtag_tweets(self.kwargs["name"], queryset, self.get_cursor(), self.page_size)
+        return self.page.object_list
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["hashtag"] = entities.normalize_hashtag(self.kwargs["name"])
+        return context
+
+
+class MentionsView(LoginRequiredMixin, KeysetPaginationMixin, ListView):
+    template_name = "tweets/mentions.html"
+    model = Tweet
+    context_object_name = "tweet_list"
+    query_budget = 4
+
+    def get_queryset(self):
+        queryset = self.model.objects.select_related("user").with_viewer_state(self.request.user)
+        self.page = entities.mentioning_tweets(self.request.user, queryset, self.get_cursor(), self.page_size)
+        return self.page.object_list
+
+
+class TrendingView(LoginRequiredMixin, ListView):
+    template_name = "tweets/trending.html"
+    model = Tweet
+    context_object_name = "tweet_list"
+    query_budget = 4
+
+    def get(self, request, *args, **kwargs):
+        self.window = request.GET.get("window", "hour")
+        if self.window not in trending.WINDOWS:
+            messages.warning(request, "集計期間が正しくありません。")
+            return HttpResponseBadRequest(render(request, "error/400.html"))
+        return super().get(request, *args, **kwargs)
+
+    def get_queryset(self):
+        queryset = self.model.objects.select_related("user").with_viewer_state(self.request.user)
+        tweets, self.hashtags = trending.trending(self.window, queryset)
+        return tweets
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        likes = Like.objects.select_related("target").filter(user=self.request.user).values_list("target", flat=True)
-        context["user_like_list"] = likes
+        context["window"] = self.window
+        context["windows"] = TrendingEntry.WINDOW_CHOICES
+        context["hashtag_entries"] = self.hashtags
         return context
 
 
@@ -28,21 +149,32 @@ class TweetCreateView(LoginRequiredMixin, CreateView):
     success_url = reverse_lazy("tweets:home")
     form_class = TweetForm
 
+    @transaction.atomic
     def form_valid(self, form):
         form.instance.user = self.request.user
-        return super().form_valid(form)
+        response = super().form_valid(form)
+        entities.index_tweet(self.object)
+        timeline.fan_out(self.object)
+        transaction.on_commit(partial(hub.publish_tweet, self.object))
+        return response
 
 
-class TweetDetailView(LoginRequiredMixin, DetailView):
+class TweetDetailView(LoginRequiredMixin, ConditionalGetMixin, DetailView):
     template_name = "tweets/detail.html"
     model = Tweet
-    queryset = model.objects.select_related("user").prefetch_related("likes")
+    query_budget = 3
 
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-        context["is_liked"] = self.object.likes.filter(user=self.request.user, target_id=self.kwargs["pk"]).exists()
-        context["liked_count"] = self.object.likes.filter(target_id=self.kwargs["pk"]).count()
-        return context
+    def get_queryset(self):
+        return self.model.objects.select_related("user").with_viewer_state(self.request.user)
+
+    def get_object(self, queryset=None):
+        if getattr(self, "object", None) is None:
+            self.object = super().get_object(queryset)
+        return self.object
+
+    def get_validators(self):
+        tweet = self.get_object()
+        return tweet.pk, tweet.like_count, tweet.is_liked_by_viewer
 
 
 class TweetDeleteView(LoginRequiredMixin, UserPassesTestMixin, DeleteView):
@@ -55,27 +187,103 @@ class TweetDeleteView(LoginRequiredMixin, UserPassesTestMixin, DeleteView):
         context = self.get_context_data(object=self.object)
         return self.render_to_response(context)
 
+    def form_valid(self, form):
+        # The tweet is hidden here; its likes and timeline entries can be
+        # too many to delete within a request, so `purge_deleted` removes them.
+        purge.schedule_tweet(self.object)
+        card_key = make_template_fragment_key("tweet_card", [self.object.pk, self.object.created_at])
+        caches["tweet_cards"].delete(card_key)
+        return HttpResponseRedirect(self.get_success_url())
+
     def test_func(self):
         self.object = self.get_object()
         return self.request.user == self.object.user
 
 
-class LikeView(LoginRequiredMixin, View):
-    def post(self, request, *args, **kwargs):
-        user = request.user
-        tweet = get_object_or_404(Tweet, pk=kwargs["pk"])
-        Like.objects.get_or_create(target=tweet, user=user)
-        likes_count = Like.objects.filter(target=tweet).count()
-        context = {"liked_count": likes_count}
+class LikeView(AsyncLoginRequiredMixin, View):
+    async def post(self, request, *args, **kwargs):
+        if settings.LIKE_WRITE_BEHIND:
+            like_count = await sync_to_async(likebuffer.record)(request.user, kwargs["pk"], liked=True)
+        else:
+            like_count = await Like.objects.alike(request.user, kwargs["pk"])
+        if like_count is None:
+            raise Http404
+        hub.publish_like_count(kwargs["pk"], like_count)
+        context = {"liked_count": like_count}
         return JsonResponse(context)
 
 
-class UnlikeView(LoginRequiredMixin, View):
+class EventsUnavailableView(View):
+    # The event stream is served by mysite.asgi; 204 tells EventSource clients
+    # of a WSGI deployment not to reconnect.
+    def get(self, request, *args, **kwargs):
+        return HttpResponse(status=204)
+
+
+class LikeBatchView(LoginRequiredMixin, View):
+    max_tweets = 100
+
+    def get(self, request, *args, **kwargs):
+        try:
+            tweet_ids = {parse_id(pk) for pk in request.GET.get("ids", "").split(",") if pk}
+        except ValueError:
+            return JsonResponse({"error": "ids must be a comma separated list of tweet ids."}, status=400)
+        if len(tweet_ids) > self.max_tweets:
+            return JsonResponse({"error": f"At most {self.max_tweets} tweets per request."}, status=400)
+        return JsonResponse({"likes": self.like_states(tweet_ids)})
+
     def post(self, request, *args, **kwargs):
-        user = request.user
-        tweet = get_object_or_404(Tweet, pk=kwargs["pk"])
-        like = Like.objects.filter(target=tweet, user=user)
-        like.delete()
-        likes_count = Like.objects.prefetch_related("target").filter(target=tweet).count()
-        context = {"liked_count": likes_count}
+        try:
+            actions = {}
+            for action in json.loads(request.body)["actions"]:
+                if not isinstance(action["liked"], bool):
+                    raise TypeError("liked must be a boolean")
+                # Later actions on the same tweet replace earlier ones.
+                actions[parse_id(action["id"])] = action["liked"]
+        except (ValueError, KeyError, TypeError):
+            return JsonResponse(
+                {"error": 'Expected {"actions": [{"id": <tweet id>, "liked": <bool>}, ...]}.'}, status=400
+            )
+        if len(actions) > self.max_tweets:
+            return JsonResponse({"error": f"At most {self.max_tweets} tweets per request."}, status=400)
+
+        with transaction.atomic():
+            for tweet_id, liked in actions.items():
+                if settings.LIKE_WRITE_BEHIND:
+                    likebuffer.record(request.user, tweet_id, liked=liked)
+                elif liked:
+                    Like.objects.like(request.user, tweet_id)
+                else:
+                    Like.objects.unlike(request.user, tweet_id)
+        states = self.like_states(actions)
+        for tweet_id, state in states.items():
+            hub.publish_like_count(tweet_id, state["liked_count"])
+        return JsonResponse({"likes": states})
+
+    def like_states(self, tweet_ids):
+        if not tweet_ids:
+            return {}
+        tweets = Tweet.objects.with_viewer_state(self.request.user).filter(pk__in=tweet_ids)
+        states = {
+            pk: {"liked_count": like_count, "is_liked": is_liked}
+            for pk, like_count, is_liked in tweets.values_list("pk", "like_count", "is_liked_by_viewer")
+        }
+        if settings.LIKE_WRITE_BEHIND:
+            deltas, liked = likebuffer.pending(self.request.user, list(states))
+            for pk, state in states.items():
+                state["liked_count"] = max(state["liked_count"] + deltas.get(pk, 0), 0)
+                state["is_liked"] = liked.get(pk, state["is_liked"])
+        return states
+
+
+class UnlikeView(AsyncLoginRequiredMixin, View):
+    async def post(self, request, *args, **kwargs):
+        if settings.LIKE_WRITE_BEHIND:
+            like_count = await sync_to_async(likebuffer.record)(request.user, kwargs["pk"], liked=False)
+        else:
+            like_count = await Like.objects.aunlike(request.user, kwargs["pk"])
+        if like_count is None:
+            raise Http404
+        hub.publish_like_count(kwargs["pk"], like_count)
+        context = {"liked_count": like_count}
         return JsonResponse(context)